@@ -12,6 +12,9 @@ PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 if PROJECT_ROOT not in sys.path:
     sys.path.insert(0, PROJECT_ROOT)
 
+# Defer start-up work to first use: cold starts pay for it on every new instance
+os.environ.setdefault("LAZY_INIT", "1")
+
 # Import the Flask app instance
 from app import app as flask_app
 
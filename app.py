@@ -1,113 +1,99 @@
 import os
+import json
 import sqlite3
-from flask import Flask, render_template, request, jsonify, redirect, url_for, session
+from flask import Flask, Response, g, render_template, request, jsonify, redirect, url_for, session, stream_with_context
 from dotenv import load_dotenv
-import openai
-import httpx
-import traceback
 import sys
-from werkzeug.security import generate_password_hash, check_password_hash
-
-# --- Perplexity & Gemini Integration ---
-def perplexity_chat(message):
-    api_key = os.getenv("PERPLEXITY_API_KEY")
-    url = "https://api.perplexity.ai/chat/completions"
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Content-Type": "application/json"
-    }
-    payload = {
-        "model": "sonar-pro",
-        "messages": [
-            {"role": "user", "content": message}
-        ]
-    }
-    with httpx.Client(timeout=30) as client:
-        response = client.post(url, headers=headers, json=payload)
-    response.raise_for_status()
-    return response.json()["choices"][0]["message"]["content"]
-
-def gemini_chat(message):
-    api_key = os.getenv("GEMINI_API_KEY")
-    url = f"https://generativelanguage.googleapis.com/v1/models/gemini-2.5-flash:generateContent?key={api_key}"
-    payload = {
-        "contents": [
-            {"parts": [{"text": message}]}
-        ]
-    }
-    with httpx.Client(timeout=30) as client:
-        response = client.post(url, json=payload)
-    response.raise_for_status()
-    return response.json()["candidates"][0]["content"]["parts"][0]["text"]
+import time
+from contextlib import nullcontext
+from backend.database import get_db
+from backend.passwords import HasherBusy, hasher_from_env, throttle_from_env
+from backend.users import has_other_admin, list_users
+from backend.migrations import fingerprint, get_meta, migrate, set_meta
+from backend.response_cache import ResponseCache, cache_from_env
+from backend.singleflight import SingleFlight
+from backend.providers import DEFAULT_SYSTEM_PROMPT, build_messages, build_router
+from backend.capabilities import capabilities_from_env
+from backend.conversations import conversations_from_env, estimate_tokens, summarizer_from_env
+from backend.hedging import dispatcher_from_env
+from backend.resilience import ProviderUnavailable, guards_from_env
+from backend.ratelimit import QueueFull, fair_queue_from_env, rate_limiter_from_env
+from backend.metrics import metrics_from_env
+from backend.request_log import RequestLog, logger, setup_logging
+
+def sse_event(payload, event=None):
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(payload)}\n\n"
 
 # Load environment variables
 load_dotenv()
 
+# Serverless handlers set LAZY_INIT=1: skip start-up banners and defer work to first use
+LAZY_INIT = os.getenv("LAZY_INIT", "0").strip().lower() in ("1", "true", "yes", "on")
+
+
+def banner(*args):
+    if not LAZY_INIT:
+        print(*args)
+
+
 # Print key runtime info (without leaking secrets)
-print("=== Runtime Info ===")
-print("Working Dir:", os.getcwd())
-print("Python:", sys.version.split(" ")[0])
+banner("=== Runtime Info ===")
+banner("Working Dir:", os.getcwd())
+banner("Python:", sys.version.split(" ")[0])
+
+# Structured JSON logs, written by a background thread (LOG_LEVEL / LOG_FILE)
+setup_logging()
 
 app = Flask(__name__)
 app.secret_key = os.getenv("SECRET_KEY", "dev-secret-change-me")
+# Prometheus metrics at /metrics (None when disabled or prometheus_client is missing;
+# in lazy mode prometheus_client is imported by the first request)
+metrics = metrics_from_env(lazy=LAZY_INIT)
 
 
 def init_db():
+    # Versioned and idempotent: a no-op (one pragma read) once the schema is current
     try:
-        db_path = os.getenv("DB_PATH", "jarvis.db")
-        conn = sqlite3.connect(db_path)
-        cur = conn.cursor()
-        cur.execute(
-            """
-            CREATE TABLE IF NOT EXISTS users (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                username TEXT UNIQUE NOT NULL,
-                password_hash TEXT NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-            """
-        )
-        # Try to add is_admin column if missing
-        try:
-            cur.execute("ALTER TABLE users ADD COLUMN is_admin INTEGER DEFAULT 0")
-            conn.commit()
-        except Exception:
-            pass
-        conn.commit()
+        migrate(get_db())
     except Exception as e:
         print("DB init error:", e)
-    finally:
-        try:
-            conn.close()
-        except Exception:
-            pass
 
 
 init_db()
+# Password KDF work runs in a small process pool, started before any request threads exist
+# (in lazy mode, on the first hash instead)
+password_hasher = hasher_from_env()
+if not LAZY_INIT:
+    password_hasher.start()
+auth_throttle = throttle_from_env()
+
+
 def ensure_admin_user():
     try:
         uname = os.getenv("ADMIN_USERNAME", "admin")
         pwd = os.getenv("ADMIN_PASSWORD", "Rebel_0102")
         if not uname or not pwd:
             return
-        db_path = os.getenv("DB_PATH", "jarvis.db")
-        conn = sqlite3.connect(db_path)
-        cur = conn.cursor()
-        cur.execute('SELECT id FROM users WHERE username = ?', (uname,))
-        row = cur.fetchone()
-        pwd_hash = generate_password_hash(pwd)
-        if row:
-            cur.execute('UPDATE users SET password_hash = ?, is_admin = 1 WHERE id = ?', (pwd_hash, row[0]))
+        db = get_db()
+        row = db.query_one('SELECT id, password_hash, COALESCE(is_admin, 0) FROM users WHERE username = ?', (uname,))
+        # The marker records which credentials (and stored hash) were last seeded, so an
+        # unchanged admin costs one lookup instead of a password verification
+        if row and row[2] and get_meta(db, 'admin_seed') == fingerprint(app.secret_key, uname, pwd, row[1]):
+            return
+        # Keep the stored hash when it still verifies with current parameters
+        if row and not password_hasher.needs_rehash(row[1]) and password_hasher.verify(row[1], pwd):
+            pwd_hash = row[1]
         else:
-            cur.execute('INSERT INTO users (username, password_hash, is_admin) VALUES (?, ?, 1)', (uname, pwd_hash))
-        conn.commit()
+            pwd_hash = password_hasher.hash(pwd)
+        with db.transaction() as conn:
+            if row:
+                conn.execute('UPDATE users SET password_hash = ?, is_admin = 1 WHERE id = ?', (pwd_hash, row[0]))
+            else:
+                conn.execute('INSERT INTO users (username, password_hash, is_admin) VALUES (?, ?, 1)', (uname, pwd_hash))
+            set_meta(conn, 'admin_seed', fingerprint(app.secret_key, uname, pwd, pwd_hash))
     except Exception as e:
         print('Admin seed error:', e)
-    finally:
-        try:
-            conn.close()
-        except Exception:
-            pass
 
 ensure_admin_user()
 
@@ -116,8 +102,8 @@ provider = os.getenv("LLM_PROVIDER", "openai").lower()
 model_name = os.getenv("MODEL_NAME")  # optional override
 allowed_models_env = os.getenv("COPILOT_ALLOWED_MODELS")  # comma-separated or '*'
 
-print("\n=== LLM Provider Configuration ===")
-print("Provider:", provider)
+banner("\n=== LLM Provider Configuration ===")
+banner("Provider:", provider)
 
 if provider == "copilot":
     # GitHub Models via Azure AI Inference (OpenAI-compatible-ish)
@@ -126,9 +112,9 @@ if provider == "copilot":
     copilot_api_base = os.getenv("COPILOT_API_BASE", "https://models.inference.ai.azure.com")
     # No default model: require explicit selection per request or via env var
     effective_model = model_name or os.getenv("COPILOT_MODEL")
-    print("Using Copilot (GitHub Models)")
-    print("API key present:", bool(copilot_token))
-    print("API base:", copilot_api_base)
+    banner("Using Copilot (GitHub Models)")
+    banner("API key present:", bool(copilot_token))
+    banner("API base:", copilot_api_base)
     # Build allowed models list for UI population
     default_model_list = [
         # Copilot supported models (example, update as per docs)
@@ -171,22 +157,330 @@ if provider == "copilot":
     else:
         allowed_models = default_model_list
 else:
-    # Default: OpenAI platform
-    openai.api_key = os.getenv("OPENAI_API_KEY")
-    # api_base can be overridden for Azure OpenAI or proxies
-    if os.getenv("OPENAI_API_BASE"):
-        openai.api_base = os.getenv("OPENAI_API_BASE")
+    # Default: OpenAI platform; the SDK is imported and configured on first use (backend.providers)
     # No default model: require explicit selection per request or via env var
     effective_model = model_name or os.getenv("OPENAI_MODEL")
-    print("Using OpenAI Platform")
-    print("API key present:", bool(openai.api_key))
-    print("API base:", getattr(openai, "api_base", "default"))
+    banner("Using OpenAI Platform")
+    banner("API key present:", bool(os.getenv("OPENAI_API_KEY")))
+    banner("API base:", os.getenv("OPENAI_API_BASE", "default"))
     allowed_models = []  # not used for OpenAI path
 
+response_cache = cache_from_env()
+
+
+def load_semantic_cache():
+    if response_cache is None or os.getenv("SEMANTIC_CACHE", "0").strip().lower() not in ("1", "true", "yes", "on"):
+        return None
+    # Imported only when enabled: it pulls in numpy
+    try:
+        from backend.semantic_cache import semantic_cache_from_env
+    except ImportError:  # numpy is optional; without it only exact matches are cached
+        return None
+    return semantic_cache_from_env()
+
+
+semantic_cache = load_semantic_cache()
+# Coalesce concurrent identical requests into one upstream call
+chat_flight = None if os.getenv("CHAT_SINGLEFLIGHT", "1").strip().lower() in ("0", "false", "no", "off") else SingleFlight()
+
+SYSTEM_PROMPT = DEFAULT_SYSTEM_PROMPT
+CHAT_TEMPERATURE = 0.7
+CHAT_MAX_TOKENS = 512
+capabilities = capabilities_from_env()
+conversations = conversations_from_env()
+router = build_router(provider, capabilities=capabilities)
+COPILOT_SUPPORTED = router.models_for("copilot")
+upstream_guards = guards_from_env()
+dispatcher = dispatcher_from_env(
+    router, available=set(allowed_models) if provider == "copilot" else None, guards=upstream_guards,
+    metrics=metrics,
+)
+# Per-user / per-IP token buckets (shared by all workers) and fair ordering of upstream dispatch
+rate_limiter = rate_limiter_from_env()
+fair_queue = fair_queue_from_env()
+CHAT_QUEUE_ADMIN_WEIGHT = float(os.getenv("CHAT_QUEUE_ADMIN_WEIGHT", "2"))
+
+
+def provider_for(selected_model):
+    return router.resolve(selected_model).name
+
+
+def complete_chat(selected_model, user_message, hedge=None, history=None):
+    """Return (content, served_model); the served model differs after a hedge win or failover."""
+    return dispatcher.complete(
+        selected_model, build_messages(user_message, SYSTEM_PROMPT, history),
+        CHAT_TEMPERATURE, CHAT_MAX_TOKENS, hedge,
+    )
+
+
+def open_stream(selected_model, user_message, served=None, history=None):
+    return dispatcher.stream(
+        selected_model, build_messages(user_message, SYSTEM_PROMPT, history),
+        CHAT_TEMPERATURE, CHAT_MAX_TOKENS, served,
+    )
+
+
+def summarize_chat(model, messages, max_tokens):
+    content, _ = dispatcher.complete(model, messages, 0.2, max_tokens)
+    return content
+
+
+summarizer = summarizer_from_env(conversations, summarize_chat)
+
+
+def load_conversation(user_id, data, selected_model, user_message):
+    """Resolve the request's conversation and the history that fits the model's context budget.
+
+    Returns (conversation_id, history, None), or (None, None, (error_body, status))
+    for a conversation id that is unknown or belongs to someone else. Without
+    a `conversation_id` in the body a new conversation is started.
+    """
+    if conversations is None:
+        return None, [], None
+    conversation_id = data.get('conversation_id') if isinstance(data, dict) else None
+    if conversation_id:
+        if conversations.get(conversation_id, user_id) is None:
+            return None, None, ({'error': 'Conversation not found.', 'status': 'error'}, 404)
+        reserve = estimate_tokens(SYSTEM_PROMPT) + estimate_tokens(user_message)
+        return conversation_id, conversations.history(conversation_id, selected_model, reserve), None
+    return conversations.create(user_id), [], None
+
+
+def record_turn(conversation_id, user_message, content):
+    if conversations is None or not conversation_id or not content:
+        return
+    try:
+        conversations.append_turn(conversation_id, user_message, content)
+    except sqlite3.Error as e:
+        logger.warning("conversation write failed: %s", e)
+        return
+    if summarizer is not None:
+        summarizer.schedule(conversation_id)
+
+
+def rate_limited(user_id, ip, selected_model):
+    """Charge one /chat request to the caller's buckets; returns 0 or the Retry-After in seconds."""
+    if rate_limiter is None:
+        return 0
+    try:
+        return rate_limiter.check(user_id, ip, selected_model)
+    except sqlite3.Error as e:
+        # A limiter that cannot reach its store fails open rather than failing every chat
+        logger.warning("rate limit store error: %s", e)
+        return 0
+
+
+def queue_weight(is_admin):
+    return CHAT_QUEUE_ADMIN_WEIGHT if is_admin else 1.0
+
+
+def dispatch_slot(user_id, is_admin=False):
+    """Context manager holding one fair-queue slot for an upstream dispatch."""
+    if fair_queue is None:
+        return nullcontext()
+    return fair_queue.slot(user_id, queue_weight(is_admin))
+
+
+def too_many_requests(message, retry_after):
+    response = jsonify({'error': message, 'status': 'error'})
+    response.headers['Retry-After'] = str(retry_after)
+    return response, 429
+
+
+def requested_hedge(data):
+    """Per-request hedging override from the body (`"hedge": true|false`), else None."""
+    value = data.get('hedge') if isinstance(data, dict) else None
+    return value if isinstance(value, bool) else None
+
+
+def cache_bypassed(data, cache_control):
+    if isinstance(data, dict) and data.get('cache') is False:
+        return True
+    return 'no-cache' in (cache_control or '').lower()
+
+
+def chat_key(selected_model, user_message, history=None):
+    return ResponseCache.make_key(
+        provider_for(selected_model), selected_model, user_message,
+        SYSTEM_PROMPT, CHAT_TEMPERATURE, CHAT_MAX_TOKENS, history,
+    )
+
+
+def cache_lookup(selected_model, user_message, bypass=False, history=None):
+    """Return (cache_key, cached_response, cache_status) for a /chat request.
+
+    `cache_key` is None when the cache is disabled or bypassed, in which case
+    the response must not be stored either. A near-duplicate prompt found by
+    the semantic cache reports the status 'semantic'.
+    """
+    result = _cache_lookup(selected_model, user_message, bypass, history)
+    if metrics is not None:
+        metrics.cache_lookup(result[2])
+    return result
+
+
+def _cache_lookup(selected_model, user_message, bypass, history):
+    if response_cache is None or bypass:
+        return None, None, 'bypass'
+    key = chat_key(selected_model, user_message, history)
+    cached = response_cache.get(key)
+    if cached is not None:
+        return key, cached, 'hit'
+    # A similar prompt only means a similar answer when there is no prior context
+    if semantic_cache is not None and not history:
+        similar_key = semantic_cache.lookup(user_message, selected_model)
+        cached = response_cache.get(similar_key) if similar_key else None
+        if cached is not None:
+            return key, cached, 'semantic'
+    return key, None, 'miss'
+
+
+def cache_store(cache_key, selected_model, user_message, content, history=None):
+    if not cache_key or response_cache is None or not content:
+        return
+    response_cache.set(cache_key, selected_model, content)
+    if semantic_cache is not None and not history and response_cache.ttl_for(selected_model) > 0:
+        semantic_cache.add(user_message, selected_model, cache_key)
+
+
+def run_chat(selected_model, user_message, cache_key=None, hedge=None, history=None):
+    """Complete a chat as (content, served_model), joining an identical in-flight request if there is one."""
+    def call():
+        content, served_model = complete_chat(selected_model, user_message, hedge, history)
+        # Only the requested model's own answers are cached under its key
+        if served_model == selected_model:
+            cache_store(cache_key, selected_model, user_message, content, history)
+        return content, served_model
+    if chat_flight is None:
+        return call()
+    return chat_flight.do(chat_key(selected_model, user_message, history), call)
+
+
+def run_stream(selected_model, user_message, cache_key=None, history=None):
+    """Token iterator for a chat; identical concurrent streams share one upstream stream."""
+    def produce():
+        parts, served = [], []
+        for delta in open_stream(selected_model, user_message, served, history):
+            parts.append(delta)
+            yield delta
+        if served == [selected_model]:
+            cache_store(cache_key, selected_model, user_message, "".join(parts), history)
+    if chat_flight is None:
+        return produce()
+    return chat_flight.stream(chat_key(selected_model, user_message, history), produce)
+
+
+def stream_chat(selected_model, user_message, cache_key=None, cached=None, cache_status='bypass',
+                history=None, conversation_id=None, slot=None):
+    """Relay upstream tokens for `selected_model` as Server-Sent Events.
+
+    `slot` is the fair-queue slot to hold while the upstream stream runs.
+    """
+    log = g.get('request_log') or RequestLog('/chat', 'POST')
+    done = {"status": "success", "cache": cache_status, "conversation_id": conversation_id}
+    if cached is not None:
+        record_turn(conversation_id, user_message, cached)
+        log.mark('store')
+        yield sse_event({"delta": cached})
+        yield sse_event(done, event="done")
+        return
+    try:
+        parts = []
+        with slot or nullcontext():
+            log.mark('queue')
+            for delta in run_stream(selected_model, user_message, cache_key, history):
+                if not parts:
+                    log.mark('first_token')
+                parts.append(delta)
+                yield sse_event({"delta": delta})
+            log.mark('upstream')
+        record_turn(conversation_id, user_message, "".join(parts))
+        log.mark('store')
+        yield sse_event(done, event="done")
+    except QueueFull as e:
+        log.set(error='queue_full')
+        yield sse_event({"error": str(e), "status": "error", "retry_after": e.retry_after}, event="error")
+    except Exception as e:
+        log.set(error=str(e))
+        logger.exception("chat stream failed", extra={"fields": {"request_id": log.request_id}})
+        yield sse_event({"error": str(e), "status": "error"}, event="error")
+
+
+def validate_chat_request(data):
+    """Resolve the message and model for a /chat POST body.
+
+    Returns (user_message, selected_model, None) on success, or
+    (None, None, (error_body, status)) when the request must be rejected.
+    """
+    user_message = data.get('message', '')
+    requested_model = data.get('model') if isinstance(data, dict) else None
+
+    if provider == "copilot":
+        if not (os.getenv("GITHUB_TOKEN") or os.getenv("COPILOT_TOKEN")):
+            raise ValueError("Copilot token not set. Define GITHUB_TOKEN or COPILOT_TOKEN")
+    else:
+        if not os.getenv("OPENAI_API_KEY"):
+            raise ValueError("OpenAI API key not set. Define OPENAI_API_KEY")
+
+    # Model selection: request override > env
+    selected_model = requested_model or effective_model
+    if not selected_model:
+        return None, None, ({
+            'error': 'No model selected. Please choose a model before sending.',
+            'allowed_models': allowed_models if provider == 'copilot' else None,
+            'status': 'error'
+        }, 400)
+    if provider == "copilot" and allowed_models_env and allowed_models_env.strip() != "*":
+        if selected_model not in allowed_models:
+            return None, None, ({
+                'error': f"Model '{selected_model}' not in allowed set.",
+                'allowed_models': allowed_models,
+                'status': 'error'
+            }, 400)
+    if provider == "copilot" and not router.serves(selected_model):
+        return None, None, ({
+            'error': f"Model '{selected_model}' is not supported by Copilot.",
+            'allowed_models': COPILOT_SUPPORTED,
+            'status': 'error'
+        }, 400)
+    return user_message, selected_model, None
+
+
 @app.route('/')
 def home():
     return render_template('home.html')
 
+def incoming_request_id():
+    """A caller-supplied X-Request-ID, if it looks sane, so logs can be joined with the proxy's."""
+    value = request.headers.get('X-Request-ID', '')
+    return value if 0 < len(value) <= 64 and value.isprintable() else None
+
+@app.before_request
+def start_request():
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    g.request_log = RequestLog(route, request.method, incoming_request_id())
+    if metrics is not None:
+        metrics.http_started(route)
+
+@app.after_request
+def note_response_status(response):
+    g.response_status = response.status_code
+    if 'request_log' in g:
+        response.headers['X-Request-ID'] = g.request_log.request_id
+    return response
+
+@app.teardown_request
+def finish_request(exc=None):
+    # Runs after a streamed body is fully sent, so SSE requests are timed to their end
+    log = g.pop('request_log', None)
+    if log is None:
+        return
+    status = g.get('response_status', 500)
+    if metrics is not None:
+        metrics.http_finished(log.fields['route'], request.method, status, time.perf_counter() - log.started)
+    if request.endpoint != 'static':
+        log.emit(status)
+
 @app.after_request
 def add_cors_headers(response):
     response.headers['Access-Control-Allow-Origin'] = '*'
@@ -202,130 +496,65 @@ def chat():
         return render_template('index.html')
     if request.method == 'OPTIONS':
         return ('', 204)
+    log = g.request_log
     try:
         if not session.get('user_id'):
             return jsonify({'status': 'error', 'error': 'Unauthorized'}), 401
         data = request.json
-        user_message = data.get('message', '')
-        requested_model = data.get('model') if isinstance(data, dict) else None
-        
-        if provider == "copilot":
-            if not (os.getenv("GITHUB_TOKEN") or os.getenv("COPILOT_TOKEN")):
-                raise ValueError("Copilot token not set. Define GITHUB_TOKEN or COPILOT_TOKEN")
+        user_message, selected_model, error = validate_chat_request(data)
+        log.set(user_id=session['user_id'], model=selected_model, message_chars=len(user_message or ''))
+        if error:
+            return jsonify(error[0]), error[1]
+        retry_after = rate_limited(session['user_id'], client_ip(), selected_model)
+        if retry_after:
+            return too_many_requests('Rate limit exceeded; slow down.', retry_after)
+        conversation_id, history, error = load_conversation(session['user_id'], data, selected_model, user_message)
+        if error:
+            return jsonify(error[0]), error[1]
+        log.set(conversation_id=conversation_id, history_messages=len(history))
+        log.mark('prepare')
+        bypass = cache_bypassed(data, request.headers.get('Cache-Control'))
+        cache_key, cached, cache_status = cache_lookup(selected_model, user_message, bypass, history)
+        stream = request.args.get('stream') in ('1', 'true') or (isinstance(data, dict) and data.get('stream') is True)
+        log.set(cache=cache_status, stream=stream)
+        log.mark('cache')
+        if stream:
+            return Response(
+                stream_with_context(stream_chat(
+                    selected_model, user_message, cache_key, cached, cache_status, history, conversation_id,
+                    dispatch_slot(session['user_id'], session.get('is_admin')),
+                )),
+                mimetype='text/event-stream',
+                headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no', 'X-Cache': cache_status},
+            )
+        if cached is not None:
+            content, served_model = cached, selected_model
         else:
-            if not openai.api_key:
-                raise ValueError("OpenAI API key not set. Define OPENAI_API_KEY")
-            
-        print(f"\n=== Processing Message ===")
-        print(f"Message: {user_message}")
-        if provider != "copilot" and isinstance(openai.api_key, str) and len(openai.api_key) >= 8:
-            print(f"Using API key: {openai.api_key[:8]}...")
-        # Model selection: request override > env
-        selected_model = requested_model or effective_model
-        if not selected_model:
-            return jsonify({
-                'error': 'No model selected. Please choose a model before sending.',
-                'allowed_models': allowed_models if provider == 'copilot' else None,
-                'status': 'error'
-            }), 400
-        if provider == "copilot" and allowed_models_env and allowed_models_env.strip() != "*":
-            if selected_model not in allowed_models:
-                return jsonify({
-                    'error': f"Model '{selected_model}' not in allowed set.",
-                    'allowed_models': allowed_models,
-                    'status': 'error'
-                }), 400
-        print(f"Provider: {provider} | Model: {selected_model}")
-        
-        # Get response from selected provider or model
-        try:
-            # Perplexity models
-            if selected_model in ["sonar-pro", "sonar", "sonar-reasoning", "sonar-deep-research"]:
-                content = perplexity_chat(user_message)
-                return jsonify({"response": content, "status": "success"})
-            # Gemini models
-            elif selected_model in ["gemini-2.5-flash", "gemini-2.5-pro"] or selected_model.startswith("gemini-"):
-                content = gemini_chat(user_message)
-                return jsonify({"response": content, "status": "success"})
-            # Copilot models
-            elif provider == "copilot":
-                copilot_supported = [
-                    "gpt-5", "gpt-5-mini", "o4-mini", "o3-mini",
-                    "Llama-3.1-8B-Instruct", "Llama-3.1-70B-Instruct",
-                    "Mistral-large", "Phi-4-mini"
-                ]
-                if selected_model not in copilot_supported:
-                    return jsonify({
-                        'error': f"Model '{selected_model}' is not supported by Copilot.",
-                        'allowed_models': copilot_supported,
-                        'status': 'error'
-                    }), 400
-                url = f"{copilot_api_base.rstrip('/')}/chat/completions"
-                token = (os.getenv('GITHUB_TOKEN') or os.getenv('COPILOT_TOKEN'))
-                auth_scheme = os.getenv('COPILOT_AUTH_SCHEME', 'bearer').lower()
-                if auth_scheme == 'api-key':
-                    headers = {
-                        "api-key": token,
-                        "Content-Type": "application/json",
-                    }
-                else:
-                    headers = {
-                        "Authorization": f"Bearer {token}",
-                        "Content-Type": "application/json",
-                    }
-                base_payload = {
-                    "model": selected_model,
-                    "messages": [
-                        {"role": "system", "content": "You are Jarvis, a helpful AI assistant."},
-                        {"role": "user", "content": user_message},
-                    ],
-                    "temperature": 0.7,
-                }
-                token_param = os.getenv('COPILOT_TOKEN_PARAM')
-                if not token_param:
-                    sml = selected_model.lower()
-                    token_param = 'max_completion_tokens' if (sml.startswith('o3') or sml.startswith('o4')) else 'max_tokens'
-
-                def build_payload(tp):
-                    p = dict(base_payload)
-                    p[tp] = 512
-                    return p
-
-                with httpx.Client(timeout=60) as client:
-                    r = client.post(url, headers=headers, json=build_payload(token_param))
-                    if r.status_code == 400 and 'max_tokens' in r.text and token_param == 'max_tokens':
-                        r = client.post(url, headers=headers, json=build_payload('max_completion_tokens'))
-                    elif r.status_code == 400 and 'max_completion_tokens' in r.text and token_param == 'max_completion_tokens':
-                        r = client.post(url, headers=headers, json=build_payload('max_tokens'))
-
-                if r.status_code >= 400:
-                    raise RuntimeError(f"Copilot API error {r.status_code}: {r.text}")
-                data = r.json()
-                content = data["choices"][0]["message"]["content"]
-                return jsonify({"response": content, "status": "success"})
-            # OpenAI models
-            else:
-                response = openai.ChatCompletion.create(
-                    model=selected_model,
-                    messages=[
-                        {"role": "system", "content": "You are Jarvis, a helpful AI assistant."},
-                        {"role": "user", "content": user_message}
-                    ],
-                    max_tokens=512,
-                    temperature=0.7
-                )
-                return jsonify({
-                    'response': response.choices[0].message.content,
-                    'status': 'success'
-                })
-        # OpenAI error handling: fallback to generic Exception
-        except Exception as e:
-            print("Unexpected OpenAI Error:", str(e))
-            raise
-            
+            with dispatch_slot(session['user_id'], session.get('is_admin')):
+                log.mark('queue')
+                content, served_model = run_chat(selected_model, user_message, cache_key, requested_hedge(data), history)
+                log.mark('upstream')
+        log.set(served_model=served_model)
+        record_turn(conversation_id, user_message, content)
+        log.mark('store')
+        response = jsonify({
+            "response": content, "status": "success", "cache": cache_status,
+            "model": served_model, "conversation_id": conversation_id,
+        })
+        response.headers['X-Cache'] = cache_status
+        return response
+
+    except QueueFull as e:
+        log.set(error='queue_full')
+        return too_many_requests(str(e), e.retry_after)
+    except ProviderUnavailable as e:
+        log.set(error=str(e))
+        response = jsonify({'error': str(e), 'status': 'error'})
+        response.headers['Retry-After'] = str(e.retry_after or 1)
+        return response, 503
     except Exception as e:
-        error_msg = f"Error: {str(e)}\n{traceback.format_exc()}"
-        print(error_msg, file=sys.stderr)  # Print to stderr for better visibility in logs
+        log.set(error=str(e))
+        logger.exception("chat failed", extra={"fields": {"request_id": log.request_id}})
         return jsonify({
             'error': str(e),
             'status': 'error'
@@ -341,6 +570,43 @@ def models():
         'note': "Allowed models list is indicative; actual access is governed by your GitHub token permissions.",
     })
 
+@app.route('/metrics')
+def metrics_page():
+    token = os.getenv("METRICS_TOKEN")
+    if metrics is None or (token and request.headers.get('Authorization') != f"Bearer {token}"):
+        return ('', 404)
+    rendered = metrics.render()
+    if rendered is None:
+        return ('', 404)
+    body, content_type = rendered
+    return Response(body, content_type=content_type)
+
+@app.route('/conversations', methods=['GET'])
+def list_conversations():
+    if not session.get('user_id'):
+        return jsonify({'status': 'error', 'error': 'Unauthorized'}), 401
+    items = conversations.list(session['user_id']) if conversations else []
+    return jsonify({'conversations': items, 'status': 'success'})
+
+@app.route('/conversations/<conversation_id>', methods=['GET', 'DELETE'])
+def conversation_detail(conversation_id):
+    if not session.get('user_id'):
+        return jsonify({'status': 'error', 'error': 'Unauthorized'}), 401
+    meta = conversations.get(conversation_id, session['user_id']) if conversations else None
+    if meta is None:
+        return jsonify({'status': 'error', 'error': 'Conversation not found.'}), 404
+    if request.method == 'DELETE':
+        conversations.delete(conversation_id, session['user_id'])
+        return jsonify({'status': 'success'})
+    meta['messages'] = conversations.messages(conversation_id)
+    return jsonify({'conversation': meta, 'status': 'success'})
+
+def client_ip():
+    """The caller's address; X-Forwarded-For is only trusted behind a known proxy (TRUST_PROXY=1)."""
+    if os.getenv("TRUST_PROXY", "0").strip().lower() in ("1", "true", "yes", "on") and request.access_route:
+        return request.access_route[0]
+    return request.remote_addr or 'unknown'
+
 @app.route('/login', methods=['GET', 'POST'])
 def login_page():
     if request.method == 'GET':
@@ -350,15 +616,20 @@ def login_page():
     password = request.form.get('password') or ''
     if not username or not password:
         return render_template('login.html', error='Username and password are required.')
+    wait = auth_throttle.allow(client_ip())
+    if wait:
+        return render_template('login.html', error='Too many attempts. Please wait and try again.'), 429, {'Retry-After': str(wait)}
+    db = get_db()
+    row = db.query_one('SELECT id, password_hash, COALESCE(is_admin, 0) FROM users WHERE username = ?', (username,))
     try:
-        conn = sqlite3.connect('jarvis.db')
-        cur = conn.cursor()
-        cur.execute('SELECT id, password_hash, COALESCE(is_admin, 0) FROM users WHERE username = ?', (username,))
-        row = cur.fetchone()
-    finally:
-        conn.close()
-    if not row or not check_password_hash(row[1], password):
-        return render_template('login.html', error='Invalid username or password.')
+        if not row or not password_hasher.verify(row[1], password):
+            return render_template('login.html', error='Invalid username or password.')
+        # Upgrade hashes made with older parameters now that we have the plaintext
+        if password_hasher.needs_rehash(row[1]):
+            with db.transaction() as conn:
+                conn.execute('UPDATE users SET password_hash = ? WHERE id = ?', (password_hasher.hash(password), row[0]))
+    except HasherBusy as e:
+        return render_template('login.html', error=str(e)), 503, {'Retry-After': '1'}
     session['user_id'] = row[0]
     session['username'] = username
     session['is_admin'] = bool(row[2])
@@ -376,19 +647,21 @@ def signup_page():
         return render_template('signup.html', error='Username and password are required.')
     if password != confirm:
         return render_template('signup.html', error='Passwords do not match.')
+    wait = auth_throttle.allow(client_ip())
+    if wait:
+        return render_template('signup.html', error='Too many attempts. Please wait and try again.'), 429, {'Retry-After': str(wait)}
+    is_admin = 1 if username.lower() == 'admin' else 0
+    try:
+        password_hash = password_hasher.hash(password)
+    except HasherBusy as e:
+        return render_template('signup.html', error=str(e)), 503, {'Retry-After': '1'}
     try:
-        conn = sqlite3.connect('jarvis.db')
-        cur = conn.cursor()
-        is_admin = 1 if username.lower() == 'admin' else 0
-        cur.execute('INSERT INTO users (username, password_hash, is_admin) VALUES (?, ?, ?)', (username, generate_password_hash(password), is_admin))
-        conn.commit()
-        cur.execute('SELECT id FROM users WHERE username = ?', (username,))
-        user = cur.fetchone()
+        with get_db().transaction() as conn:
+            cur = conn.execute('INSERT INTO users (username, password_hash, is_admin) VALUES (?, ?, ?)', (username, password_hash, is_admin))
+            user_id = cur.lastrowid
     except sqlite3.IntegrityError:
         return render_template('signup.html', error='Username already exists.')
-    finally:
-        conn.close()
-    session['user_id'] = user[0]
+    session['user_id'] = user_id
     session['username'] = username
     session['is_admin'] = bool(is_admin)
     return redirect(url_for('chat'))
@@ -413,58 +686,75 @@ def admin_root():
         return guard
     return redirect(url_for('admin_users'))
 
+@app.route('/admin/upstreams')
+def admin_upstreams():
+    """Circuit breaker state and concurrency limits per provider (this worker)."""
+    guard = _ensure_admin()
+    if guard:
+        return guard
+    return jsonify({
+        'enabled': upstream_guards is not None,
+        'providers': upstream_guards.snapshot() if upstream_guards else {},
+        'pid': os.getpid(),
+    })
+
 @app.route('/admin/users')
 def admin_users():
     guard = _ensure_admin()
     if guard:
         return guard
-    db_path = os.getenv("DB_PATH", "jarvis.db")
-    conn = sqlite3.connect(db_path)
-    cur = conn.cursor()
-    cur.execute('SELECT id, username, COALESCE(is_admin,0), created_at FROM users ORDER BY id ASC')
-    users = [
-        { 'id': r[0], 'username': r[1], 'is_admin': bool(r[2]), 'created_at': r[3] }
-        for r in cur.fetchall()
-    ]
-    conn.close()
-    return render_template('admin_users.html', users=users)
+    return render_template('admin_users.html', **_users_page())
+
+@app.route('/admin/users.json')
+def admin_users_json():
+    if not session.get('user_id') or not session.get('is_admin'):
+        return jsonify({'status': 'error', 'error': 'Unauthorized'}), 401
+    return jsonify(dict(_users_page(), status='success'))
+
+def _users_page():
+    """Keyset page of users from ?after= / ?before= (ids), ?q= (username search) and ?limit=."""
+    def int_arg(name):
+        value = request.args.get(name, '')
+        return int(value) if value.isdigit() else None
+    q = (request.args.get('q') or '').strip()
+    limit = int_arg('limit') or 50
+    users, next_after, prev_before = list_users(
+        get_db().connection(), after=int_arg('after'), before=int_arg('before'), query=q, limit=limit,
+    )
+    return {'users': users, 'q': q, 'limit': limit, 'next_after': next_after, 'prev_before': prev_before}
 
 @app.route('/admin/users/<int:user_id>', methods=['GET', 'POST'])
 def admin_edit_user(user_id: int):
     guard = _ensure_admin()
     if guard:
         return guard
-    db_path = os.getenv("DB_PATH", "jarvis.db")
-    conn = sqlite3.connect(db_path)
-    cur = conn.cursor()
+    db = get_db()
     if request.method == 'POST':
         new_username = (request.form.get('username') or '').strip()
         new_password = request.form.get('password') or ''
         is_admin_flag = 1 if request.form.get('is_admin') == 'on' else 0
         if not new_username:
-            conn.close()
             return render_template('admin_edit_user.html', error='Username is required.', user={'id': user_id, 'username': new_username, 'is_admin': bool(is_admin_flag)})
         try:
-            if new_password:
-                cur.execute('UPDATE users SET username = ?, password_hash = ?, is_admin = ? WHERE id = ?',
-                            (new_username, generate_password_hash(new_password), is_admin_flag, user_id))
-            else:
-                cur.execute('UPDATE users SET username = ?, is_admin = ? WHERE id = ?',
-                            (new_username, is_admin_flag, user_id))
-            conn.commit()
+            new_hash = password_hasher.hash(new_password) if new_password else None
+            with db.transaction() as conn:
+                if new_hash:
+                    conn.execute('UPDATE users SET username = ?, password_hash = ?, is_admin = ? WHERE id = ?',
+                                 (new_username, new_hash, is_admin_flag, user_id))
+                else:
+                    conn.execute('UPDATE users SET username = ?, is_admin = ? WHERE id = ?',
+                                 (new_username, is_admin_flag, user_id))
             # If editing current user, sync session
             if session.get('user_id') == user_id:
                 session['username'] = new_username
                 session['is_admin'] = bool(is_admin_flag)
-            conn.close()
             return redirect(url_for('admin_users'))
         except sqlite3.IntegrityError:
-            conn.close()
             return render_template('admin_edit_user.html', error='Username already exists.', user={'id': user_id, 'username': new_username, 'is_admin': bool(is_admin_flag)})
+        except HasherBusy as e:
+            return render_template('admin_edit_user.html', error=str(e), user={'id': user_id, 'username': new_username, 'is_admin': bool(is_admin_flag)}), 503, {'Retry-After': '1'}
     # GET
-    cur.execute('SELECT id, username, COALESCE(is_admin,0) FROM users WHERE id = ?', (user_id,))
-    row = cur.fetchone()
-    conn.close()
+    row = db.query_one('SELECT id, username, COALESCE(is_admin,0) FROM users WHERE id = ?', (user_id,))
     if not row:
         return redirect(url_for('admin_users'))
     user = { 'id': row[0], 'username': row[1], 'is_admin': bool(row[2]) }
@@ -475,21 +765,14 @@ def admin_delete_user(user_id: int):
     guard = _ensure_admin()
     if guard:
         return guard
-    db_path = os.getenv("DB_PATH", "jarvis.db")
-    conn = sqlite3.connect(db_path)
-    cur = conn.cursor()
-    # Prevent deleting the last admin account
-    cur.execute('SELECT COUNT(*) FROM users WHERE COALESCE(is_admin,0)=1')
-    admin_count = cur.fetchone()[0]
-    cur.execute('SELECT COALESCE(is_admin,0) FROM users WHERE id = ?', (user_id,))
-    row = cur.fetchone()
-    is_target_admin = bool(row[0]) if row else False
-    if is_target_admin and admin_count <= 1:
-        conn.close()
-        return redirect(url_for('admin_users'))
-    cur.execute('DELETE FROM users WHERE id = ?', (user_id,))
-    conn.commit()
-    conn.close()
+    # Check and delete in one write transaction so two admins can't remove each other
+    with get_db().transaction(immediate=True) as conn:
+        # Prevent deleting the last admin account
+        row = conn.execute('SELECT COALESCE(is_admin,0) FROM users WHERE id = ?', (user_id,)).fetchone()
+        is_target_admin = bool(row[0]) if row else False
+        if is_target_admin and not has_other_admin(conn, user_id):
+            return redirect(url_for('admin_users'))
+        conn.execute('DELETE FROM users WHERE id = ?', (user_id,))
     if session.get('user_id') == user_id:
         session.clear()
         return redirect(url_for('home'))
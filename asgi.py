@@ -0,0 +1,316 @@
+"""
+ASGI entry point for Jarvis, next to the WSGI `app:app`.
+
+POST /chat is served natively on asyncio through the providers' async
+adapters, so a slow upstream call only parks a coroutine instead of pinning a
+worker. Every other route (/login, /models, admin pages, ...) is delegated to
+the Flask app through asgiref's WSGI adapter, which runs it on a thread pool.
+
+    uvicorn asgi:app --host 0.0.0.0 --port 5050
+    gunicorn asgi:app -k uvicorn.workers.UvicornWorker
+"""
+import os
+import json
+import time
+import asyncio
+from contextlib import nullcontext
+from http.cookies import SimpleCookie
+from urllib.parse import parse_qs
+
+from asgiref.wsgi import WsgiToAsgi
+from itsdangerous import BadSignature
+
+import app as jarvis
+from backend.http_clients import aclose_all
+from backend.providers import build_messages
+from backend.ratelimit import QueueFull
+from backend.request_log import RequestLog, logger
+from backend.resilience import ProviderUnavailable
+from backend.singleflight import AsyncSingleFlight
+
+flask_app = jarvis.app
+wsgi_app = WsgiToAsgi(flask_app)
+chat_flight = AsyncSingleFlight() if jarvis.chat_flight is not None else None
+
+CORS_HEADERS = [
+    (b"access-control-allow-origin", b"*"),
+    (b"access-control-allow-headers", b"Content-Type, Authorization"),
+    (b"access-control-allow-methods", b"GET, POST, OPTIONS"),
+]
+
+
+# --- Async dispatch ---
+async def chat_async(selected_model, user_message, hedge=None, history=None):
+    return await jarvis.dispatcher.acomplete(
+        selected_model, build_messages(user_message, jarvis.SYSTEM_PROMPT, history),
+        jarvis.CHAT_TEMPERATURE, jarvis.CHAT_MAX_TOKENS, hedge,
+    )
+
+
+def stream_async(selected_model, user_message, served=None, history=None):
+    return jarvis.dispatcher.astream(
+        selected_model, build_messages(user_message, jarvis.SYSTEM_PROMPT, history),
+        jarvis.CHAT_TEMPERATURE, jarvis.CHAT_MAX_TOKENS, served,
+    )
+
+
+async def run_chat_async(selected_model, user_message, cache_key=None, hedge=None, history=None):
+    async def call():
+        content, served_model = await chat_async(selected_model, user_message, hedge, history)
+        if served_model == selected_model:
+            await asyncio.to_thread(jarvis.cache_store, cache_key, selected_model, user_message, content, history)
+        return content, served_model
+    if chat_flight is None:
+        return await call()
+    return await chat_flight.do(jarvis.chat_key(selected_model, user_message, history), call)
+
+
+def dispatch_slot(user_id, is_admin=False):
+    """Async context manager holding one fair-queue slot for an upstream dispatch."""
+    if jarvis.fair_queue is None:
+        return nullcontext()
+    return jarvis.fair_queue.aslot(user_id, jarvis.queue_weight(is_admin))
+
+
+def run_stream_async(selected_model, user_message, cache_key=None, history=None):
+    async def produce():
+        parts, served = [], []
+        async for delta in stream_async(selected_model, user_message, served, history):
+            parts.append(delta)
+            yield delta
+        if served == [selected_model]:
+            await asyncio.to_thread(
+                jarvis.cache_store, cache_key, selected_model, user_message, "".join(parts), history,
+            )
+    if chat_flight is None:
+        return produce()
+    return chat_flight.stream(jarvis.chat_key(selected_model, user_message, history), produce)
+
+
+# --- ASGI plumbing ---
+def load_session(scope):
+    """Decode the Flask session cookie so /chat shares logins with the WSGI routes."""
+    cookie = SimpleCookie()
+    for name, value in scope.get("headers", []):
+        if name == b"cookie":
+            cookie.load(value.decode("latin-1"))
+    morsel = cookie.get(flask_app.config["SESSION_COOKIE_NAME"])
+    if morsel is None:
+        return {}
+    serializer = flask_app.session_interface.get_signing_serializer(flask_app)
+    if serializer is None:
+        return {}
+    try:
+        max_age = int(flask_app.permanent_session_lifetime.total_seconds())
+        return serializer.loads(morsel.value, max_age=max_age)
+    except BadSignature:
+        return {}
+
+
+async def read_body(receive):
+    body = b""
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            return None
+        body += message.get("body", b"")
+        if not message.get("more_body"):
+            return body
+
+
+def header(scope, name):
+    for key, value in scope.get("headers", []):
+        if key == name:
+            return value.decode("latin-1")
+    return None
+
+
+def client_ip(scope):
+    """Same rule as the WSGI app: X-Forwarded-For only counts behind a trusted proxy."""
+    if os.getenv("TRUST_PROXY", "0").strip().lower() in ("1", "true", "yes", "on"):
+        forwarded = header(scope, b"x-forwarded-for")
+        if forwarded:
+            return forwarded.split(",")[0].strip()
+    client = scope.get("client")
+    return client[0] if client else "unknown"
+
+
+async def send_json(send, payload, status=200, extra_headers=None):
+    body = json.dumps(payload).encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]
+        + CORS_HEADERS + (extra_headers or []),
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+async def send_event_stream(send, selected_model, user_message, cache_key, cached, cache_status,
+                            history=None, conversation_id=None, slot=None, log=None):
+    await send({
+        "type": "http.response.start",
+        "status": 200,
+        "headers": [
+            (b"content-type", b"text/event-stream; charset=utf-8"),
+            (b"cache-control", b"no-cache"),
+            (b"x-accel-buffering", b"no"),
+            (b"x-cache", cache_status.encode()),
+        ] + CORS_HEADERS,
+    })
+    log = log or RequestLog("/chat", "POST")
+    done = {"status": "success", "cache": cache_status, "conversation_id": conversation_id}
+    if cached is not None:
+        await asyncio.to_thread(jarvis.record_turn, conversation_id, user_message, cached)
+        log.mark("store")
+        await send({"type": "http.response.body", "body": jarvis.sse_event({"delta": cached}).encode(), "more_body": True})
+        await send({"type": "http.response.body", "body": jarvis.sse_event(done, event="done").encode()})
+        return
+    try:
+        parts = []
+        async with slot or nullcontext():
+            log.mark("queue")
+            async for delta in run_stream_async(selected_model, user_message, cache_key, history):
+                if not parts:
+                    log.mark("first_token")
+                parts.append(delta)
+                await send({"type": "http.response.body", "body": jarvis.sse_event({"delta": delta}).encode(), "more_body": True})
+            log.mark("upstream")
+        await asyncio.to_thread(jarvis.record_turn, conversation_id, user_message, "".join(parts))
+        log.mark("store")
+        final = jarvis.sse_event(done, event="done")
+    except QueueFull as e:
+        log.set(error="queue_full")
+        final = jarvis.sse_event({"error": str(e), "status": "error", "retry_after": e.retry_after}, event="error")
+    except Exception as e:
+        log.set(error=str(e))
+        logger.exception("chat stream failed", extra={"fields": {"request_id": log.request_id}})
+        final = jarvis.sse_event({"error": str(e), "status": "error"}, event="error")
+    await send({"type": "http.response.body", "body": final.encode()})
+
+
+async def chat(scope, receive, send, log):
+    body = await read_body(receive)
+    if body is None:
+        return
+    try:
+        user = load_session(scope)
+        user_id = user.get("user_id")
+        if not user_id:
+            await send_json(send, {"status": "error", "error": "Unauthorized"}, 401)
+            return
+        data = json.loads(body or b"{}")
+        user_message, selected_model, error = jarvis.validate_chat_request(data)
+        log.set(user_id=user_id, model=selected_model, message_chars=len(user_message or ""))
+        if error:
+            await send_json(send, error[0], error[1])
+            return
+        # SQLite work runs off the event loop
+        retry_after = await asyncio.to_thread(jarvis.rate_limited, user_id, client_ip(scope), selected_model)
+        if retry_after:
+            await send_json(
+                send, {"error": "Rate limit exceeded; slow down.", "status": "error"}, 429,
+                extra_headers=[(b"retry-after", str(retry_after).encode())],
+            )
+            return
+        conversation_id, history, error = await asyncio.to_thread(
+            jarvis.load_conversation, user_id, data, selected_model, user_message,
+        )
+        if error:
+            await send_json(send, error[0], error[1])
+            return
+        log.set(conversation_id=conversation_id, history_messages=len(history))
+        log.mark("prepare")
+        bypass = jarvis.cache_bypassed(data, header(scope, b"cache-control"))
+        cache_key, cached, cache_status = await asyncio.to_thread(
+            jarvis.cache_lookup, selected_model, user_message, bypass, history,
+        )
+        query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+        stream = query.get("stream", [""])[0] in ("1", "true") or (isinstance(data, dict) and data.get("stream") is True)
+        log.set(cache=cache_status, stream=stream)
+        log.mark("cache")
+        if stream:
+            await send_event_stream(
+                send, selected_model, user_message, cache_key, cached, cache_status, history, conversation_id,
+                dispatch_slot(user_id, user.get("is_admin")), log,
+            )
+            return
+        if cached is not None:
+            content, served_model = cached, selected_model
+        else:
+            async with dispatch_slot(user_id, user.get("is_admin")):
+                log.mark("queue")
+                content, served_model = await run_chat_async(
+                    selected_model, user_message, cache_key, jarvis.requested_hedge(data), history,
+                )
+                log.mark("upstream")
+        log.set(served_model=served_model)
+        await asyncio.to_thread(jarvis.record_turn, conversation_id, user_message, content)
+        log.mark("store")
+        await send_json(
+            send, {
+                "response": content, "status": "success", "cache": cache_status,
+                "model": served_model, "conversation_id": conversation_id,
+            },
+            extra_headers=[(b"x-cache", cache_status.encode())],
+        )
+    except QueueFull as e:
+        log.set(error="queue_full")
+        await send_json(
+            send, {"error": str(e), "status": "error"}, 429,
+            extra_headers=[(b"retry-after", str(e.retry_after).encode())],
+        )
+    except ProviderUnavailable as e:
+        log.set(error=str(e))
+        await send_json(
+            send, {"error": str(e), "status": "error"}, 503,
+            extra_headers=[(b"retry-after", str(e.retry_after or 1).encode())],
+        )
+    except Exception as e:
+        log.set(error=str(e))
+        logger.exception("chat failed", extra={"fields": {"request_id": log.request_id}})
+        await send_json(send, {"error": str(e), "status": "error"}, 500)
+
+
+async def observed(route, handler, scope, receive, send):
+    """Run a natively served route with the same metrics and request log as the Flask routes."""
+    metrics = jarvis.metrics
+    request_id = header(scope, b"x-request-id")
+    log = RequestLog(route, scope["method"], request_id if request_id and len(request_id) <= 64 else None)
+    status = 500
+
+    async def send_and_note(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+            message = {**message, "headers": list(message.get("headers", [])) + [(b"x-request-id", log.request_id.encode())]}
+        await send(message)
+
+    if metrics is not None:
+        metrics.http_started(route)
+    try:
+        await handler(scope, receive, send_and_note, log)
+    finally:
+        if metrics is not None:
+            metrics.http_finished(route, scope["method"], status, time.perf_counter() - log.started)
+        log.emit(status)
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await aclose_all()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        await lifespan(receive, send)
+    elif scope["type"] == "http" and scope["path"] == "/chat" and scope["method"] == "POST":
+        await observed("/chat", chat, scope, receive, send)
+    else:
+        await wsgi_app(scope, receive, send)
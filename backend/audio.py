@@ -0,0 +1,299 @@
+"""
+Streaming audio front-end for the hotword listener.
+
+Samples land in one preallocated int16 ring and are handed out as
+`np.frombuffer`-style views of whole frames, so the steady state allocates
+no per-frame buffers or tuples of ints.
+
+- MicrophoneSource feeds the ring from a callback-mode PyAudio stream, which
+  runs on PortAudio's own thread. If the reader falls behind, the oldest
+  frames are overwritten and counted in `overruns`.
+- WavSource feeds it from a 16-bit mono WAV file on a background thread,
+  either as fast as the reader consumes (benchmarks, tests) or at real-time
+  pace. This lets the pipeline run without a microphone.
+
+The ring holds a whole number of frames, so a frame never wraps around its
+end. A frame view stays valid until the writer comes back round to that slot
+(`ring_frames` frames later). Consumers that need a frame for longer must
+copy it.
+
+pyaudio is imported only when a microphone is opened.
+"""
+import wave
+import threading
+
+import numpy as np
+
+from backend import config
+
+
+class FrameRing:
+    """Single-writer, single-reader ring of int16 samples read back in fixed-size frames."""
+
+    def __init__(self, frame_length, ring_frames=64):
+        if ring_frames < 2:
+            raise ValueError("ring_frames must be at least 2")
+        self.frame_length = frame_length
+        self.ring_frames = ring_frames
+        self.samples = np.zeros(frame_length * ring_frames, dtype=np.int16)
+        self.written = 0      # samples written since start
+        self.read_frames = 0  # frames handed to the reader
+        self.overruns = 0     # frames overwritten before they were read
+        self.closed = False
+        self._ready = threading.Condition()
+
+    @property
+    def available(self):
+        return self.written // self.frame_length - self.read_frames
+
+    def write(self, data, block=False):
+        """Copy int16 samples (bytes or an array) into the ring.
+
+        With `block`, wait for the reader to free space instead of
+        overwriting unread frames.
+        """
+        pcm = np.frombuffer(data, dtype=np.int16) if isinstance(data, (bytes, bytearray, memoryview)) else data
+        size = len(self.samples)
+        # A blocking writer also leaves alone the frame the reader is working on
+        limit = size - self.frame_length if block else size
+        offset = 0
+        while offset < len(pcm):
+            chunk = min(len(pcm) - offset, limit)
+            if block:
+                with self._ready:
+                    self._ready.wait_for(
+                        lambda: self.closed or self.written + chunk - self.read_frames * self.frame_length <= limit
+                    )
+                    if self.closed:
+                        return
+            start = self.written % size
+            first = min(chunk, size - start)
+            self.samples[start:start + first] = pcm[offset:offset + first]
+            if chunk > first:
+                self.samples[:chunk - first] = pcm[offset + first:offset + chunk]
+            offset += chunk
+            with self._ready:
+                self.written += chunk
+                self._ready.notify_all()
+
+    def read(self, timeout=None):
+        """Block until a full frame is available and return a view of it, or None when closed/timed out."""
+        with self._ready:
+            if not self._ready.wait_for(lambda: self.closed or self.available > 0, timeout):
+                return None
+            if self.available <= 0:
+                return None
+            # A partly written frame already occupies the oldest slot
+            lag = self.available - self.ring_frames + (1 if self.written % self.frame_length else 0)
+            if lag > 0:
+                # The writer lapped us: skip to the oldest frame still intact
+                self.overruns += lag
+                self.read_frames += lag
+            slot = self.read_frames % self.ring_frames
+            self.read_frames += 1
+            self._ready.notify_all()
+        start = slot * self.frame_length
+        return self.samples[start:start + self.frame_length]
+
+    def drop_pending(self):
+        """Discard frames written but not yet read (e.g. audio captured while the reader was busy)."""
+        with self._ready:
+            self.read_frames = self.written // self.frame_length
+            self._ready.notify_all()
+
+    def close(self):
+        with self._ready:
+            self.closed = True
+            self._ready.notify_all()
+
+
+class AudioSource:
+    """Frames of int16 mono audio from a background producer, via a FrameRing."""
+
+    def __init__(self, sample_rate, frame_length, ring_frames=64):
+        self.sample_rate = sample_rate
+        self.frame_length = frame_length
+        self.ring = FrameRing(frame_length, ring_frames)
+
+    @property
+    def overruns(self):
+        return self.ring.overruns
+
+    def start(self):
+        raise NotImplementedError
+
+    def stop(self):
+        self.ring.close()
+
+    def read(self, timeout=None):
+        return self.ring.read(timeout)
+
+    def frames(self):
+        """Yield frame views until the source stops."""
+        while True:
+            frame = self.ring.read()
+            if frame is None:
+                return
+            yield frame
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+class MicrophoneSource(AudioSource):
+    """An input device (the default one unless `device_index` is given) through a callback-mode PyAudio stream."""
+
+    def __init__(self, sample_rate, frame_length, device_index=None, ring_frames=64):
+        super().__init__(sample_rate, frame_length, ring_frames)
+        self.device_index = device_index
+        self._pyaudio = None
+        self._stream = None
+
+    def _callback(self, in_data, frame_count, time_info, status):
+        self.ring.write(in_data)
+        return None, self._continue
+
+    def start(self):
+        import pyaudio
+        self._continue = pyaudio.paContinue
+        self._pyaudio = pyaudio.PyAudio()
+        self._stream = self._pyaudio.open(
+            rate=self.sample_rate,
+            channels=1,
+            format=pyaudio.paInt16,
+            input=True,
+            frames_per_buffer=self.frame_length,
+            input_device_index=self.device_index,
+            stream_callback=self._callback,
+        )
+        self._stream.start_stream()
+        return self
+
+    def stop(self):
+        super().stop()
+        if self._stream is not None:
+            self._stream.stop_stream()
+            self._stream.close()
+            self._stream = None
+        if self._pyaudio is not None:
+            self._pyaudio.terminate()
+            self._pyaudio = None
+
+
+class WavSource(AudioSource):
+    """A 16-bit mono WAV file played into the ring on a background thread.
+
+    `realtime=False` feeds as fast as the reader consumes, without dropping
+    frames. `realtime=True` paces the file like a microphone would, and
+    `loop` repeats it until stopped.
+    """
+
+    def __init__(self, path, frame_length, realtime=False, loop=False, ring_frames=64):
+        with wave.open(path, "rb") as wav:
+            if wav.getsampwidth() != 2 or wav.getnchannels() != 1:
+                raise ValueError(f"{path}: expected 16-bit mono PCM")
+            sample_rate = wav.getframerate()
+            self.pcm = np.frombuffer(wav.readframes(wav.getnframes()), dtype=np.int16)
+        super().__init__(sample_rate, frame_length, ring_frames)
+        self.realtime = realtime
+        self.loop = loop
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def _feed(self):
+        chunk = self.frame_length
+        interval = chunk / self.sample_rate
+        while not self._stopped.is_set():
+            for offset in range(0, len(self.pcm) - chunk + 1, chunk):
+                if self._stopped.is_set():
+                    break
+                self.ring.write(self.pcm[offset:offset + chunk], block=not self.realtime)
+                if self.realtime:
+                    self._stopped.wait(interval)
+            if not self.loop:
+                break
+        self.ring.close()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._feed, name="wav-source", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        super().stop()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+def open_source(sample_rate, frame_length, wav_path=None):
+    """The hotword input: HOTWORD_WAV (looped in real time) when set, else the microphone."""
+    wav_path = wav_path or config.HOTWORD_WAV
+    if wav_path:
+        source = WavSource(wav_path, frame_length, realtime=True, loop=True)
+        if source.sample_rate != sample_rate:
+            raise ValueError(f"{wav_path}: sample rate {source.sample_rate} Hz, the engine needs {sample_rate} Hz")
+        return source
+    return MicrophoneSource(sample_rate, frame_length)
+
+
+def _native_process_ok(native, handle):
+    """True if `native` is still pv_porcupine_process(handle, const int16_t *pcm, int32_t *keyword_index)."""
+    import ctypes
+    argtypes = getattr(native, "argtypes", None)
+    return (
+        argtypes is not None
+        and len(argtypes) == 3
+        and isinstance(handle, argtypes[0])
+        and argtypes[1] is ctypes.POINTER(ctypes.c_short)
+        and argtypes[2] is ctypes.POINTER(ctypes.c_int)
+    )
+
+
+def porcupine_processor(porcupine):
+    """Return `process(frame) -> keyword index` for int16 frame views.
+
+    pvporcupine's `process()` unpacks any sequence into a new ctypes array
+    on every call. When the engine exposes its native entry point, the
+    frame's own buffer is passed instead. Otherwise the frame goes through
+    the public API as a list, which is still much cheaper than unpacking
+    numpy scalars one at a time.
+
+    The native entry point is private to the SDK, so it is only used when its
+    ctypes signature is the expected one and a silent frame gives the same
+    answer through both paths. An SDK update that changes either falls back
+    to the public API instead of handing native code a bad pointer.
+    """
+    import ctypes
+
+    def public(frame):
+        return porcupine.process(frame.tolist())
+
+    native = getattr(porcupine, "_process_func", None)
+    handle = getattr(porcupine, "_handle", None)
+    if native is None or handle is None or not _native_process_ok(native, handle):
+        return public
+    short_p = ctypes.POINTER(ctypes.c_short)
+    result = ctypes.c_int()
+    result_ref = ctypes.byref(result)
+
+    def process(frame):
+        status = native(handle, frame.ctypes.data_as(short_p), result_ref)
+        if status != 0:
+            # Let the SDK raise its own error for this status
+            return porcupine.process(frame.tolist())
+        return result.value
+
+    silence = np.zeros(porcupine.frame_length, dtype=np.int16)
+    try:
+        if process(silence) != public(silence):
+            raise ValueError("native and public results differ")
+    except Exception as e:
+        print(f"Porcupine fast path disabled ({e}); using process()")
+        return public
+    return process
@@ -0,0 +1,179 @@
+"""
+In-process audio bus between the hotword listener and command capture.
+
+The hotword thread owns the microphone and pushes every frame through
+`AudioBus.feed()`. That keeps two things current:
+
+- the ambient level: a running RMS noise estimate, maintained all the time
+  instead of being recalibrated with adjust_for_ambient_noise() before every
+  command. `energy_threshold` is in the same units as
+  speech_recognition's Recognizer.energy_threshold.
+- the command capture: on a wake word the listener calls `arm()`, and the
+  frames that follow are copied straight into a preallocated capture buffer.
+  An utterance is endpointed the way Recognizer.listen() does it: wait up to
+  `timeout` for speech, then stop after `pause_threshold` of quiet or at
+  `phrase_time_limit`.
+
+`takecommand()` collects the utterance with `capture()`, so nothing reopens
+the microphone between "Jarvis" and recognition. A capture armed by the
+wake word is already in progress, and anything said while the UI catches up
+is kept.
+"""
+import time
+import threading
+
+import numpy as np
+
+
+class AudioBus:
+    def __init__(self, sample_rate, frame_length, timeout=10.0, phrase_time_limit=8.0, pause_threshold=1.0,
+                 pre_speech=0.5, ambient_ratio=1.5, min_threshold=300.0):
+        self.sample_rate = sample_rate
+        self.frame_length = frame_length
+        self.ambient_ratio = ambient_ratio
+        self.min_threshold = min_threshold
+        self.ambient_rms = None
+        self.frames_fed = 0
+        self._float = np.zeros(frame_length, dtype=np.float32)
+        self._lock = threading.Lock()
+        self._capture = None
+        self._done = None
+        self._result = None
+        self._finished_at = None
+        self.configure(timeout, phrase_time_limit, pause_threshold, pre_speech)
+
+    def configure(self, timeout, phrase_time_limit, pause_threshold, pre_speech=None):
+        """Set the endpointing used by the next armed capture."""
+        with self._lock:
+            self.timeout = timeout
+            self.phrase_time_limit = phrase_time_limit
+            self.pause_threshold = pause_threshold
+            if pre_speech is not None:
+                self.pre_speech = pre_speech
+            samples = int((self.pre_speech + phrase_time_limit) * self.sample_rate) + self.frame_length
+            if self._capture is None or len(self._capture) < samples:
+                self._capture = np.zeros(samples, dtype=np.int16)
+
+    @property
+    def energy_threshold(self):
+        """RMS level above which a frame counts as speech."""
+        if self.ambient_rms is None:
+            return self.min_threshold
+        return max(self.ambient_rms * self.ambient_ratio, self.min_threshold)
+
+    @property
+    def running(self):
+        return self.frames_fed > 0
+
+    @property
+    def capturing(self):
+        return self._done is not None and not self._done.is_set()
+
+    def rms(self, frame):
+        np.copyto(self._float, frame)
+        return float(np.sqrt(np.dot(self._float, self._float) / self.frame_length))
+
+    def arm(self):
+        """Start capturing a command from the next frame (no-op if one is already in progress)."""
+        with self._lock:
+            if self.capturing:
+                return
+            self._done = threading.Event()
+            self._result = None
+            self._finished_at = None
+            self._written = 0        # samples in the capture buffer
+            self._speech_at = None   # buffer offset where speech started
+            self._waited = 0         # frames before speech started
+            self._quiet = 0          # consecutive quiet frames since speech started
+
+    def feed(self, frame):
+        """Called by the listener thread with every frame, in order."""
+        self.frames_fed += 1
+        level = self.rms(frame)
+        speech = level > self.energy_threshold
+        if self.capturing:
+            with self._lock:
+                self._record(frame, speech)
+        if not speech:
+            # Minimum tracking, like Recognizer's dynamic threshold but never dragged up by speech
+            if self.ambient_rms is None or level < self.ambient_rms:
+                self.ambient_rms = level if self.ambient_rms is None else self.ambient_rms * 0.8 + level * 0.2
+            else:
+                self.ambient_rms += (level - self.ambient_rms) * 0.01
+
+    def _record(self, frame, speech):
+        if self._done is None or self._done.is_set():
+            return
+        n = self.frame_length
+        frame_s = n / self.sample_rate
+        if self._speech_at is None:
+            keep = int(self.pre_speech * self.sample_rate) // n * n
+            if self._written + n > len(self._capture):
+                # Still waiting for speech: keep only the last `pre_speech` seconds
+                self._capture[:keep] = self._capture[self._written - keep:self._written]
+                self._written = keep
+            self._capture[self._written:self._written + n] = frame
+            self._written += n
+            self._waited += 1
+            if speech:
+                # Move the utterance (with its lead-in) to the front so the whole phrase fits
+                start = max(0, self._written - n - keep)
+                self._capture[:self._written - start] = self._capture[start:self._written]
+                self._written -= start
+                self._speech_at = 0
+            elif self._waited * frame_s >= self.timeout:
+                self._finish(None)
+            return
+        self._capture[self._written:self._written + n] = frame
+        self._written += n
+        self._quiet = 0 if speech else self._quiet + 1
+        phrase_s = (self._written - self._speech_at) / self.sample_rate - self.pre_speech
+        full = self._written + n > len(self._capture)
+        if self._quiet * frame_s >= self.pause_threshold or phrase_s >= self.phrase_time_limit or full:
+            self._finish(self._capture[self._speech_at:self._written].tobytes())
+
+    def _finish(self, pcm):
+        self._result = pcm
+        self._finished_at = time.monotonic()
+        self._done.set()
+
+    def capture(self, timeout=None, phrase_time_limit=None, pause_threshold=None):
+        """Wait for the current (or a newly armed) command; returns 16-bit PCM bytes, or None on silence.
+
+        Settings given here apply when this call arms the capture; one already
+        armed by the wake word keeps the bus defaults.
+        """
+        with self._lock:
+            finished = self._result is not None
+            stale = finished and time.monotonic() - self._finished_at > self.timeout
+            rearm = not self.capturing and (not finished or stale)
+        if rearm:
+            if timeout is not None or phrase_time_limit is not None or pause_threshold is not None:
+                self.configure(
+                    self.timeout if timeout is None else timeout,
+                    self.phrase_time_limit if phrase_time_limit is None else phrase_time_limit,
+                    self.pause_threshold if pause_threshold is None else pause_threshold,
+                )
+            self.arm()
+        with self._lock:
+            done = self._done
+        done.wait(self.timeout + self.phrase_time_limit + self.pause_threshold + 1.0)
+        with self._lock:
+            result, self._result = self._result, None
+            if self._done is done and not done.is_set():
+                # The listener stopped feeding us; give up on this capture
+                self._finish(None)
+        return result
+
+
+_bus = None
+
+
+def set_audio_bus(bus):
+    global _bus
+    _bus = bus
+
+
+def get_audio_bus():
+    """The bus fed by this process's hotword listener, or None when it runs elsewhere (or not at all)."""
+    return _bus
@@ -0,0 +1,167 @@
+"""
+Per-model capability cache.
+
+Upstreams disagree on request details: some models want `max_completion_tokens`
+instead of `max_tokens`, reject a non-default `temperature`, refuse the
+`system` role or cannot stream. Adapters record what they learn from an
+upstream's 400 responses here, so later requests go out right the first time
+instead of paying for a failed round trip.
+
+Learned values are persisted in SQLite, so they survive restarts and every
+worker sees them. Each worker keeps a short-lived in-memory copy. The asyncio
+path only reads that copy (`cached`) and leaves database reads and writes to
+a background thread, so SQLite's busy timeout never blocks the event loop.
+"""
+import os
+import json
+import time
+import logging
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from backend.database import get_db, resolve_db_path
+
+logger = logging.getLogger(__name__)
+
+# Capability names and the value assumed until an upstream says otherwise
+TOKEN_PARAM = "token_param"
+SUPPORTS_TEMPERATURE = "supports_temperature"
+SUPPORTS_SYSTEM_ROLE = "supports_system_role"
+SUPPORTS_STREAMING = "supports_streaming"
+
+
+class CapabilityStore:
+    def __init__(self, db_path=None, refresh_seconds=60.0):
+        self.db_path = db_path
+        self.refresh_seconds = refresh_seconds
+        self._cache = {}
+        self._lock = threading.Lock()
+        # The table is created on first use, not at import: a read-only or missing
+        # database must not stop the app from starting
+        self.db = get_db(db_path) if db_path else None
+        self._ready = False
+        self._background = None
+        self._refreshing = set()
+
+    def _store(self):
+        """The database, with the table in place; None when running from memory only."""
+        if self.db is None or self._ready:
+            return self.db
+        try:
+            with self.db.transaction() as conn:
+                conn.execute(
+                    """
+                    CREATE TABLE IF NOT EXISTS model_capabilities (
+                        model TEXT NOT NULL,
+                        capability TEXT NOT NULL,
+                        value TEXT NOT NULL,
+                        updated_at REAL NOT NULL,
+                        PRIMARY KEY (model, capability)
+                    )
+                    """
+                )
+        except sqlite3.Error as e:
+            logger.warning("capability database unavailable; keeping capabilities in memory",
+                           extra={"fields": {"db_path": self.db_path, "error": str(e)}})
+            self.db = None
+            return None
+        self._ready = True
+        return self.db
+
+    def get(self, model):
+        """Return the learned capabilities of `model` as a dict (possibly empty)."""
+        now = time.time()
+        with self._lock:
+            entry = self._cache.get(model)
+            if entry is not None and (self.db is None or now - entry[0] < self.refresh_seconds):
+                return dict(entry[1])
+        caps = dict(entry[1]) if entry else {}
+        db = self._store()
+        if db is not None:
+            try:
+                rows = db.query_all("SELECT capability, value FROM model_capabilities WHERE model = ?", (model,))
+                caps = {name: json.loads(value) for name, value in rows}
+            except sqlite3.Error as e:
+                logger.warning("capability read failed", extra={"fields": {"model": model, "error": str(e)}})
+        with self._lock:
+            self._cache[model] = (now, caps)
+        return dict(caps)
+
+    def cached(self, model):
+        """Like get(), from the in-memory copy only; never waits on the database.
+
+        A missing or stale entry is reloaded on the background thread, so a
+        later call sees what other workers have learned.
+        """
+        with self._lock:
+            entry = self._cache.get(model)
+            stale = self.db is not None and (entry is None or time.time() - entry[0] >= self.refresh_seconds)
+            if stale and model not in self._refreshing:
+                self._refreshing.add(model)
+            else:
+                stale = False
+        if stale:
+            self._submit(self._refresh, model)
+        return dict(entry[1]) if entry else {}
+
+    def _refresh(self, model):
+        try:
+            self.get(model)
+        finally:
+            with self._lock:
+                self._refreshing.discard(model)
+
+    def _submit(self, fn, *args):
+        with self._lock:
+            if self._background is None:
+                self._background = ThreadPoolExecutor(max_workers=1, thread_name_prefix="capabilities")
+            background = self._background
+        background.submit(fn, *args)
+
+    def learn(self, model, capability, value, background=False):
+        """Record a capability; with `background`, the database write happens on the background thread."""
+        with self._lock:
+            entry = self._cache.get(model)
+            if entry is not None and entry[1].get(capability) == value:
+                return
+            caps = dict(entry[1]) if entry else {}
+            caps[capability] = value
+            self._cache[model] = (time.time(), caps)
+        if self.db is None:
+            return
+        if background:
+            self._submit(self._persist, model, capability, value)
+        else:
+            self._persist(model, capability, value)
+
+    def _persist(self, model, capability, value):
+        db = self._store()
+        if db is not None:
+            try:
+                with db.transaction() as conn:
+                    conn.execute(
+                        "INSERT OR REPLACE INTO model_capabilities (model, capability, value, updated_at) "
+                        "VALUES (?, ?, ?, ?)",
+                        (model, capability, json.dumps(value), time.time()),
+                    )
+            except sqlite3.Error as e:
+                logger.warning("capability write failed", extra={"fields": {"model": model, "error": str(e)}})
+
+    def forget(self, model=None):
+        with self._lock:
+            if model is None:
+                self._cache.clear()
+            else:
+                self._cache.pop(model, None)
+        db = self._store()
+        if db is not None:
+            with db.transaction() as conn:
+                if model is None:
+                    conn.execute("DELETE FROM model_capabilities")
+                else:
+                    conn.execute("DELETE FROM model_capabilities WHERE model = ?", (model,))
+
+
+def capabilities_from_env():
+    return CapabilityStore(db_path=os.getenv("CAPABILITIES_DB") or resolve_db_path())
@@ -1,30 +1,52 @@
 import time
-import pyttsx3
 import speech_recognition as sr
 import eel
+from backend.tts import NORMAL, get_speech_worker
+from backend.audio_bus import get_audio_bus
 
-def speak(text):
+def speak(text, priority=NORMAL, interrupt=False):
+    """Show `text` in the UI now and queue it for speech.
+
+    Returns at once with an Utterance: `.wait()` blocks until it has been
+    spoken, `await` works too, and `.cancel()` drops it.
+    """
     text = str(text)
-    engine = pyttsx3.init('sapi5')
-    voices = engine.getProperty('voices')
-    # print(voices)
-    engine.setProperty('voice', voices[2].id)
     eel.DisplayMessage(text)
-    engine.say(text)
-    engine.runAndWait()
-    engine.setProperty('rate', 174)
     eel.receiverText(text)
+    return get_speech_worker().say(text, priority, interrupt)
+
+
+async def speak_async(text, priority=NORMAL, interrupt=False):
+    """speak(), resolving once the phrase has been spoken (True) or cancelled (False)."""
+    return await speak(text, priority, interrupt)
+
+
+def stop_speaking():
+    """Cut off the current phrase and drop everything queued."""
+    get_speech_worker().stop()
 
 # Expose the Python function to JavaScript
 
 def takecommand():
     r = sr.Recognizer()
-    with sr.Microphone() as source:
+    r.pause_threshold = 1
+    bus = get_audio_bus()
+    if bus is not None and bus.running:
+        # The hotword listener already has the microphone open and a current ambient level;
+        # after a wake word the command is being recorded already
         print("I'm listening...")
         eel.DisplayMessage("I'm listening...")
-        r.pause_threshold = 1
-        r.adjust_for_ambient_noise(source)
-        audio = r.listen(source, 10, 8)
+        pcm = bus.capture(timeout=10, phrase_time_limit=8, pause_threshold=r.pause_threshold)
+        if pcm is None:
+            print("Error: no speech heard\n")
+            return None
+        audio = sr.AudioData(pcm, bus.sample_rate, 2)
+    else:
+        with sr.Microphone() as source:
+            print("I'm listening...")
+            eel.DisplayMessage("I'm listening...")
+            r.adjust_for_ambient_noise(source)
+            audio = r.listen(source, 10, 8)
 
     try:
         print("Recognizing...")
@@ -45,6 +67,8 @@ def takecommand():
 
 @eel.expose
 def takeAllCommands(message=None):
+    # A new command cuts off whatever is still being said
+    stop_speaking()
     if message is None:
         query = takecommand()  # If no message is passed, listen for voice input
         if not query:
@@ -68,7 +92,8 @@ def takeAllCommands(message=None):
                 if Phone != 0:
                     if "send message" in query:
                         flag = 'message'
-                        speak("What message to send?")
+                        # Let the question finish before listening, or the microphone hears it
+                        speak("What message to send?").wait()
                         query = takecommand()  # Ask for the message text
                     elif "call" in query:
                         flag = 'call'
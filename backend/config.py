@@ -18,7 +18,26 @@ DATABASE_URL = os.getenv('DATABASE_URL', 'sqlite:///jarvis.db')
 AUDIO_DEVICE_INDEX = int(os.getenv('AUDIO_DEVICE_INDEX', '0'))
 SAMPLE_RATE = int(os.getenv('SAMPLE_RATE', '16000'))
 CHANNELS = int(os.getenv('CHANNELS', '1'))
+HOTWORD_WAV = os.getenv('HOTWORD_WAV', '')  # 16-bit mono WAV to listen to instead of the microphone
+# Run the hotword listener as a thread of the UI process so commands reuse its audio (run.py).
+# On by default, which changes the process layout of existing installs: there is no separate
+# hotword process any more. Set HOTWORD_IN_PROCESS=0 to keep the old two-process layout.
+HOTWORD_IN_PROCESS = os.getenv('HOTWORD_IN_PROCESS', '1').strip().lower() not in ('0', 'false', 'no', 'off')
+# Voice activity gate: the keyword engine only sees frames that sound like speech
+HOTWORD_VAD = os.getenv('HOTWORD_VAD', '1').strip().lower() not in ('0', 'false', 'no', 'off')
+HOTWORD_VAD_MARGIN_DB = float(os.getenv('HOTWORD_VAD_MARGIN_DB', '6'))  # above the noise floor
+HOTWORD_VAD_PREROLL_MS = int(os.getenv('HOTWORD_VAD_PREROLL_MS', '400'))  # audio replayed when the gate opens
+HOTWORD_VAD_HANGOVER_MS = int(os.getenv('HOTWORD_VAD_HANGOVER_MS', '500'))  # gate stays open after speech
+
+# Text-to-speech (one pyttsx3 engine on a worker thread)
+TTS_DRIVER = os.getenv('TTS_DRIVER', 'sapi5')  # empty = pyttsx3's platform default
+TTS_VOICE_INDEX = int(os.getenv('TTS_VOICE_INDEX', '2'))  # clamped to the installed voices
+TTS_RATE = int(os.getenv('TTS_RATE', '174'))  # words per minute
+# Known phrases are rendered to WAV once and played back through pygame.mixer
+TTS_CACHE = os.getenv('TTS_CACHE', '1').strip().lower() not in ('0', 'false', 'no', 'off')
+TTS_CACHE_DIR = os.getenv('TTS_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'jarvis', 'tts'))
+TTS_CACHE_MAX_MB = float(os.getenv('TTS_CACHE_MAX_MB', '50'))  # least recently used files go first
 
 # Logging Configuration
 LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
-LOG_FILE = os.getenv('LOG_FILE', 'jarvis.log')
\ No newline at end of file
+LOG_FILE = os.getenv('LOG_FILE', '')  # empty = stderr
\ No newline at end of file
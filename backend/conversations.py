@@ -0,0 +1,298 @@
+"""
+Server-side conversation history for /chat.
+
+Turns are stored per user and conversation in the app's SQLite database.
+Every message is tokenized once, when it is stored, and keeps its token count
+plus its `position` (the running total of the tokens before it). The context
+window for a request is then the newest turns whose tokens fit the model's
+budget: one indexed range query on `position`, without re-tokenizing the
+transcript.
+
+Long conversations are compacted by `Summarizer`: once the unsummarized part
+outgrows a threshold, a worker pool asks a cheap model to fold the older
+turns into a running summary, which then stands in for them in the context.
+This never runs on the request path.
+"""
+import os
+import re
+import time
+import uuid
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from backend.database import get_db, resolve_db_path
+
+try:
+    import tiktoken
+except ImportError:  # optional; fall back to a character/word estimate
+    tiktoken = None
+
+logger = logging.getLogger(__name__)
+
+# Per-message framing the chat APIs add around each message's content
+MESSAGE_OVERHEAD = 4
+
+_PIECES = re.compile(r"\w+|[^\w\s]", re.UNICODE)
+_encoder = None
+
+
+def estimate_tokens(text):
+    """Fast token count for `text`: tiktoken when installed, otherwise an estimate that errs high."""
+    global _encoder
+    text = text or ""
+    if tiktoken is not None:
+        if _encoder is None:
+            _encoder = tiktoken.get_encoding("cl100k_base")
+        return len(_encoder.encode(text)) + MESSAGE_OVERHEAD
+    return max(len(_PIECES.findall(text)), (len(text) + 3) // 4) + MESSAGE_OVERHEAD
+
+
+def parse_model_budgets(spec):
+    """Parse "model=tokens,model2=tokens" into a dict of positive int token budgets."""
+    budgets = {}
+    for item in (spec or "").split(","):
+        name, sep, tokens = item.partition("=")
+        name = name.strip()
+        if not sep or not name:
+            continue
+        try:
+            budget = int(tokens)
+        except ValueError:
+            continue
+        if budget > 0:
+            budgets[name] = budget
+    return budgets
+
+
+class ConversationStore:
+    def __init__(self, db_path, default_budget=4000, model_budgets=None):
+        self.db_path = db_path
+        self.default_budget = default_budget
+        self.model_budgets = model_budgets or {}
+        # The tables are created by backend.migrations (v2, v3)
+        self.db = get_db(db_path)
+
+    def _db(self):
+        return self.db.connection()
+
+    def budget_for(self, model):
+        return int(self.model_budgets.get(model, self.default_budget))
+
+    def create(self, user_id, title=None):
+        conversation_id = uuid.uuid4().hex
+        now = time.time()
+        with self.db.transaction() as conn:
+            conn.execute(
+                "INSERT INTO conversations (id, user_id, title, created_at, updated_at) VALUES (?, ?, ?, ?, ?)",
+                (conversation_id, user_id, title, now, now),
+            )
+        return conversation_id
+
+    def get(self, conversation_id, user_id):
+        """Return the conversation's metadata if it belongs to `user_id`, else None."""
+        row = self._db().execute(
+            "SELECT id, title, token_total, created_at, updated_at FROM conversations WHERE id = ? AND user_id = ?",
+            (conversation_id, user_id),
+        ).fetchone()
+        if row is None:
+            return None
+        return {"id": row[0], "title": row[1], "tokens": row[2], "created_at": row[3], "updated_at": row[4]}
+
+    def list(self, user_id, limit=50):
+        rows = self._db().execute(
+            "SELECT id, title, token_total, created_at, updated_at FROM conversations "
+            "WHERE user_id = ? ORDER BY updated_at DESC LIMIT ?",
+            (user_id, limit),
+        ).fetchall()
+        return [{"id": r[0], "title": r[1], "tokens": r[2], "created_at": r[3], "updated_at": r[4]} for r in rows]
+
+    def messages(self, conversation_id):
+        rows = self._db().execute(
+            "SELECT role, content, created_at FROM conversation_messages WHERE conversation_id = ? ORDER BY position",
+            (conversation_id,),
+        ).fetchall()
+        return [{"role": r[0], "content": r[1], "created_at": r[2]} for r in rows]
+
+    def delete(self, conversation_id, user_id):
+        with self.db.transaction() as conn:
+            cur = conn.execute("DELETE FROM conversations WHERE id = ? AND user_id = ?", (conversation_id, user_id))
+            if cur.rowcount:
+                conn.execute("DELETE FROM conversation_messages WHERE conversation_id = ?", (conversation_id,))
+        return cur.rowcount > 0
+
+    def append_turn(self, conversation_id, user_message, reply):
+        """Store one user message and the assistant's reply, extending the running token count."""
+        turns = [("user", user_message, estimate_tokens(user_message)), ("assistant", reply, estimate_tokens(reply))]
+        now = time.time()
+        # IMMEDIATE takes the write lock up front, so concurrent turns get consecutive positions
+        with self.db.transaction(immediate=True) as conn:
+            row = conn.execute("SELECT token_total FROM conversations WHERE id = ?", (conversation_id,)).fetchone()
+            if row is None:
+                return
+            position = row[0]
+            for role, content, tokens in turns:
+                conn.execute(
+                    "INSERT INTO conversation_messages (conversation_id, role, content, tokens, position, created_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (conversation_id, role, content, tokens, position, now),
+                )
+                position += tokens
+            conn.execute(
+                "UPDATE conversations SET token_total = ?, updated_at = ?, title = COALESCE(title, ?) WHERE id = ?",
+                (position, now, user_message[:80], conversation_id),
+            )
+
+    def window(self, conversation_id, budget):
+        """Newest turns whose tokens sum to at most `budget`, oldest first, as chat messages.
+
+        Turns already folded into the rolling summary are replaced by it.
+        """
+        if budget <= 0:
+            return []
+        conn = self._db()
+        row = conn.execute(
+            "SELECT token_total, summary, summary_upto, summary_tokens FROM conversations WHERE id = ?",
+            (conversation_id,),
+        ).fetchone()
+        if row is None:
+            return []
+        total, summary, summary_upto, summary_tokens = row
+        start = total - budget
+        if summary:
+            start = max(start + summary_tokens, summary_upto)
+        rows = conn.execute(
+            "SELECT role, content FROM conversation_messages WHERE conversation_id = ? AND position >= ? ORDER BY position",
+            (conversation_id, start),
+        ).fetchall()
+        messages = [{"role": role, "content": content} for role, content in rows]
+        # Start on a user turn; some upstreams reject a leading assistant message
+        while messages and messages[0]["role"] != "user":
+            messages.pop(0)
+        if summary:
+            messages.insert(0, {"role": "system", "content": f"Summary of the earlier conversation:\n{summary}"})
+        return messages
+
+    def unsummarized(self, conversation_id):
+        """Return (token_total, summary, summary_upto, turns after summary_upto) for compaction."""
+        conn = self._db()
+        row = conn.execute(
+            "SELECT token_total, summary, summary_upto FROM conversations WHERE id = ?", (conversation_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        turns = conn.execute(
+            "SELECT role, content, position FROM conversation_messages "
+            "WHERE conversation_id = ? AND position >= ? ORDER BY position",
+            (conversation_id, row[2]),
+        ).fetchall()
+        return row[0], row[1], row[2], turns
+
+    def save_summary(self, conversation_id, summary, upto, previous_upto):
+        """Store a new rolling summary unless another worker already moved it on."""
+        with self.db.transaction() as conn:
+            cur = conn.execute(
+                "UPDATE conversations SET summary = ?, summary_upto = ?, summary_tokens = ? "
+                "WHERE id = ? AND summary_upto = ?",
+                (summary, upto, estimate_tokens(summary), conversation_id, previous_upto),
+            )
+        return cur.rowcount > 0
+
+    def history(self, conversation_id, model, reserve=0):
+        """Context window for `model`, leaving `reserve` tokens for the system prompt and new message."""
+        return self.window(conversation_id, self.budget_for(model) - reserve)
+
+
+SUMMARY_PROMPT = (
+    "You maintain the running summary of a conversation between a user and an AI assistant. "
+    "Fold the new turns into the previous summary. Keep names, facts, preferences, decisions "
+    "and open questions; drop pleasantries. Reply with the updated summary only."
+)
+
+
+class Summarizer:
+    """Background compaction of long conversations into a rolling summary.
+
+    `complete(model, messages, max_tokens)` returns the model's reply text.
+    """
+
+    def __init__(self, store, complete, model, trigger_tokens=3000, keep_tokens=1000,
+                 max_tokens=400, max_workers=2):
+        self.store = store
+        self.complete = complete
+        self.model = model
+        self.trigger_tokens = trigger_tokens
+        self.keep_tokens = keep_tokens
+        self.max_tokens = max_tokens
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="summarize")
+        self._pending = set()
+        self._lock = threading.Lock()
+
+    def schedule(self, conversation_id):
+        """Queue a compaction check for `conversation_id`; returns immediately."""
+        with self._lock:
+            if conversation_id in self._pending:
+                return
+            self._pending.add(conversation_id)
+        self._executor.submit(self._run, conversation_id)
+
+    def _run(self, conversation_id):
+        try:
+            self.compact(conversation_id)
+        except Exception:
+            logger.exception("summarization failed", extra={"fields": {"conversation_id": conversation_id}})
+        finally:
+            with self._lock:
+                self._pending.discard(conversation_id)
+
+    def compact(self, conversation_id):
+        """Fold older turns into the summary if the unsummarized tail is over the trigger."""
+        state = self.store.unsummarized(conversation_id)
+        if state is None:
+            return False
+        total, summary, summary_upto, turns = state
+        if total - summary_upto <= self.trigger_tokens:
+            return False
+        # Keep the newest turns that fit keep_tokens verbatim, cutting at a user turn
+        user_positions = [position for role, _, position in turns if role == "user"]
+        recent = [p for p in user_positions if total - p <= self.keep_tokens]
+        cutoff = recent[0] if recent else (user_positions[-1] if user_positions else total)
+        older = [(role, content) for role, content, position in turns if position < cutoff]
+        if not older:
+            return False
+        transcript = "\n".join(f"{role.capitalize()}: {content}" for role, content in older)
+        messages = [
+            {"role": "system", "content": SUMMARY_PROMPT},
+            {"role": "user", "content": f"Previous summary:\n{summary or '(none)'}\n\nNew turns:\n{transcript}"},
+        ]
+        updated = (self.complete(self.model, messages, self.max_tokens) or "").strip()
+        if not updated:
+            return False
+        return self.store.save_summary(conversation_id, updated, cutoff, summary_upto)
+
+
+def summarizer_from_env(store, complete):
+    """Build the summarizer when CHAT_SUMMARY_MODEL is set and history is enabled, else None."""
+    model = os.getenv("CHAT_SUMMARY_MODEL")
+    if store is None or not model:
+        return None
+    return Summarizer(
+        store,
+        complete,
+        model,
+        trigger_tokens=int(os.getenv("CHAT_SUMMARY_TRIGGER_TOKENS", "3000")),
+        keep_tokens=int(os.getenv("CHAT_SUMMARY_KEEP_TOKENS", "1000")),
+        max_tokens=int(os.getenv("CHAT_SUMMARY_MAX_TOKENS", "400")),
+        max_workers=int(os.getenv("CHAT_SUMMARY_WORKERS", "2")),
+    )
+
+
+def conversations_from_env():
+    """Build the conversation store from CHAT_HISTORY / CHAT_CONTEXT_* settings, or None when disabled."""
+    if os.getenv("CHAT_HISTORY", "1").strip().lower() in ("0", "false", "no", "off"):
+        return None
+    return ConversationStore(
+        db_path=resolve_db_path(),
+        default_budget=int(os.getenv("CHAT_CONTEXT_TOKENS", "4000")),
+        model_budgets=parse_model_budgets(os.getenv("CHAT_CONTEXT_MODEL_TOKENS")),
+    )
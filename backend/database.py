@@ -0,0 +1,130 @@
+"""
+Shared SQLite data access.
+
+Every part of the app that touches the app database goes through `get_db()`
+so that there is one database path and one way of connecting:
+
+- one long-lived connection per thread (SQLite connections must not be shared
+  across threads), so the sqlite3 prepared-statement cache is reused from
+  request to request instead of being thrown away with each connection;
+- WAL journal mode, so readers never block the writer and vice versa;
+- a busy timeout, so concurrent writers wait for the lock instead of failing
+  with "database is locked".
+
+The path is DB_PATH, else a `sqlite:///` DATABASE_URL, else jarvis.db.
+"""
+import os
+import atexit
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+DEFAULT_DB_PATH = "jarvis.db"
+
+
+def resolve_db_path():
+    path = os.getenv("DB_PATH")
+    if path:
+        return path
+    url = os.getenv("DATABASE_URL", "")
+    if url.startswith("sqlite:///"):
+        return url[len("sqlite:///"):]
+    return DEFAULT_DB_PATH
+
+
+class Database:
+    def __init__(self, path, busy_timeout=5.0, cached_statements=256):
+        self.path = path
+        self.busy_timeout = busy_timeout
+        self.cached_statements = cached_statements
+        self._local = threading.local()
+        self._conns = []
+        self._lock = threading.Lock()
+
+    def connection(self):
+        """This thread's connection, opened (and tuned) on first use."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.busy_timeout, cached_statements=self.cached_statements)
+            conn.execute(f"PRAGMA busy_timeout = {int(self.busy_timeout * 1000)}")
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("PRAGMA synchronous = NORMAL")
+            self._local.conn = conn
+            with self._lock:
+                self._conns.append(conn)
+        return conn
+
+    def execute(self, sql, params=()):
+        return self.connection().execute(sql, params)
+
+    def query_one(self, sql, params=()):
+        return self.connection().execute(sql, params).fetchone()
+
+    def query_all(self, sql, params=()):
+        return self.connection().execute(sql, params).fetchall()
+
+    @contextmanager
+    def transaction(self, immediate=False):
+        """Commit on success, roll back on error. `immediate` takes the write lock up front."""
+        conn = self.connection()
+        if immediate:
+            conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+
+    def close_all(self):
+        with self._lock:
+            conns, self._conns = self._conns, []
+        for conn in conns:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+        self._local = threading.local()
+
+    def _forget(self):
+        # Connections opened before a fork belong to the parent
+        self._conns = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+
+_databases = {}
+_databases_lock = threading.Lock()
+
+
+def get_db(path=None):
+    """The shared Database for `path` (default: the app database)."""
+    path = path or resolve_db_path()
+    db = _databases.get(path)
+    if db is None:
+        with _databases_lock:
+            db = _databases.get(path)
+            if db is None:
+                db = _databases[path] = Database(
+                    path,
+                    busy_timeout=float(os.getenv("DB_BUSY_TIMEOUT", "5")),
+                    cached_statements=int(os.getenv("DB_CACHED_STATEMENTS", "256")),
+                )
+    return db
+
+
+def close_all():
+    for db in list(_databases.values()):
+        db.close_all()
+
+
+def _reset_after_fork():
+    global _databases_lock
+    _databases_lock = threading.Lock()
+    for db in _databases.values():
+        db._forget()
+
+
+atexit.register(close_all)
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
@@ -1,7 +1,13 @@
+import os
+import sys
 import csv
-import sqlite3
 
-conn = sqlite3.connect("jarvis.db")
+# Allow running as a script (python backend/db.py) from anywhere
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend.database import get_db
+
+conn = get_db().connection()
 cursor = conn.cursor()
 
 query = "CREATE TABLE IF NOT EXISTS sys_command(id integer primary key, name VARCHAR(100), path VARCHAR(1000))"
@@ -5,37 +5,32 @@ import sys
 project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 sys.path.append(project_root)
 
-import time
 import atexit
 import sqlite3
 import pygame
 import webbrowser
 import subprocess
 from datetime import datetime
-from backend.command import speak
+from backend.command import speak, stop_speaking
 from backend.config import ASSISTANT_NAME
 from backend.helper import extract_yt_term, remove_words
 import pyautogui
 import pywhatkit as kit
 import pvporcupine
-import pyaudio
-import struct
 import hugchat
 import eel
 import openai
-import httpx
+from backend.providers import build_messages, build_router
+from backend.database import get_db
+from backend.audio import open_source, porcupine_processor
+from backend.audio_bus import AudioBus, set_audio_bus
+from backend.vad import vad_gate_from_env
 
 # Initialize pygame mixer
 pygame.mixer.init()
 
-# SQLite connection
-conn = sqlite3.connect("jarvis.db")
-cursor = conn.cursor()
-
-# Register cleanup function
+# Register cleanup function (the shared database closes its own connections at exit)
 def cleanup():
-    if conn:
-        conn.close()
     if pygame.mixer.get_init():
         pygame.mixer.quit()
 
@@ -62,16 +57,15 @@ def openCommand(query):
         return
 
     try:
-        cursor.execute('SELECT path FROM sys_command WHERE name IN (?)', (query,))
-        results = cursor.fetchall()
+        db = get_db()
+        results = db.query_all('SELECT path FROM sys_command WHERE name IN (?)', (query,))
 
         if results:
             speak(f"Opening {query}")
             os.system(f'open "{results[0][0]}"')
             return
 
-        cursor.execute('SELECT url FROM web_command WHERE name IN (?)', (query,))
-        results = cursor.fetchall()
+        results = db.query_all('SELECT url FROM web_command WHERE name IN (?)', (query,))
 
         if results:
             speak(f"Opening {query}")
@@ -106,10 +100,15 @@ def PlayYoutube(query):
         print(f"YouTube error: {e}")
 
 # Function to listen for hotword ("jarvis" or "alexa")
-def hotword():
+def hotword(share_audio=False):
+    """Listen for the wake word.
+
+    With `share_audio` (the listener runs in the UI process), the audio after
+    the wake word is recorded on the spot and takecommand() picks it up from
+    the audio bus instead of opening the microphone again.
+    """
     porcupine = None
-    paud = None
-    audio_stream = None
+    source = None
     
     try:
         # Replace 'YOUR_ACCESS_KEY' with your actual Picovoice access key
@@ -117,50 +116,41 @@ def hotword():
             access_key='ZiS8TaEHPkh0pJfCJcPLheyG+UMIhoJZccxPRyK8bJrUnvNzJiK3zA==',
             keywords=["jarvis", "alexa"]
         )
-        paud = pyaudio.PyAudio()
-        audio_stream = paud.open(
-            rate=porcupine.sample_rate,
-            channels=1,
-            format=pyaudio.paInt16,
-            input=True,
-            frames_per_buffer=porcupine.frame_length,
-            input_device_index=None,  # Use default input device
-            stream_callback=None,     # No callback
-            start=False              # Don't start immediately
-        )
-        
-        # Start the stream
-        audio_stream.start_stream()
-
-        while True:
-            try:
-                keyword = audio_stream.read(porcupine.frame_length, exception_on_overflow=False)
-                keyword = struct.unpack_from("h" * porcupine.frame_length, keyword)
-                keyword_index = porcupine.process(keyword)
+        # Microphone (or HOTWORD_WAV) frames arrive as int16 views into a preallocated ring
+        source = open_source(porcupine.sample_rate, porcupine.frame_length).start()
+        process = porcupine_processor(porcupine)
+        # Skip keyword processing on silence; the gate replays a short pre-roll when speech starts
+        gate = vad_gate_from_env(porcupine.sample_rate, porcupine.frame_length)
+        bus = AudioBus(porcupine.sample_rate, porcupine.frame_length) if share_audio else None
+        set_audio_bus(bus)
+
+        for frame in source.frames():
+            if bus is not None:
+                bus.feed(frame)
+                if bus.capturing:
+                    # A command is being recorded; don't look for the wake word inside it
+                    continue
 
-                if keyword_index >= 0:
+            for keyword_frame in (gate.push(frame) if gate else (frame,)):
+                if process(keyword_frame) >= 0:
                     print("Hotword detected")
-                    pyautogui.keyDown("win")
-                    pyautogui.press("j")
-                    time.sleep(2)
-                    pyautogui.keyUp("win")
-            except IOError as e:
-                if e.errno == -9981:  # Input overflow
-                    print("Audio buffer overflow, continuing...")
-                    continue
-                else:
-                    raise
+                    stop_speaking()
+                    if bus is not None:
+                        bus.arm()
+                    # The UI shows the listening view and calls takeAllCommands
+                    pyautogui.hotkey("win", "j")
+                    if gate:
+                        gate.reset()
+                    break
                 
     except Exception as e:
         print(f"Error in hotword detection: {e}")
     finally:
+        set_audio_bus(None)
         if porcupine is not None:
             porcupine.delete()
-        if audio_stream is not None:
-            audio_stream.stop_stream()
-            audio_stream.close()
-        if paud is not None:
-            paud.terminate()
+        if source is not None:
+            source.stop()
 
 # Function to find contact from the contacts database
 def findContact(query):
@@ -169,8 +159,7 @@ def findContact(query):
 
     try:
         query = query.strip().lower()
-        cursor.execute("SELECT Phone FROM contacts WHERE LOWER(name) LIKE ? OR LOWER(name) LIKE ?", ('%' + query + '%', query + '%'))
-        results = cursor.fetchall()
+        results = get_db().query_all("SELECT Phone FROM contacts WHERE LOWER(name) LIKE ? OR LOWER(name) LIKE ?", ('%' + query + '%', query + '%'))
 
         if results:
             mobile_number_str = str(results[0][0])
@@ -219,8 +208,6 @@ class OpenAIChat:
         self.provider = os.getenv("LLM_PROVIDER", "openai").lower()
         self.model = model
         if self.provider == "copilot":
-            self.token = os.getenv("GITHUB_TOKEN") or os.getenv("COPILOT_TOKEN")
-            self.api_base = os.getenv("COPILOT_API_BASE", "https://models.inference.ai.azure.com")
             if model == "gpt-3.5-turbo":
                 # Default to a reasonable Copilot model if caller uses old default
                 self.model = os.getenv("COPILOT_MODEL", "gpt-4o-mini")
@@ -232,41 +219,15 @@ class OpenAIChat:
                 openai.api_key = os.getenv("OPENAI_API_KEY")
             if os.getenv("OPENAI_API_BASE"):
                 openai.api_base = os.getenv("OPENAI_API_BASE")
+        self.router = build_router(self.provider)
 
     def chat(self, user_message: str, system_prompt: str = "You are a helpful assistant."):
-        messages = [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_message},
-        ]
+        messages = build_messages(user_message, system_prompt)
         try:
-            if self.provider == "copilot":
-                if not self.token:
-                    return "Error: Copilot token not set (GITHUB_TOKEN or COPILOT_TOKEN)."
-                url = f"{self.api_base.rstrip('/')}/chat/completions"
-                headers = {
-                    "Authorization": f"Bearer {self.token}",
-                    "Content-Type": "application/json",
-                }
-                payload = {
-                    "model": self.model,
-                    "messages": messages,
-                    "max_tokens": 512,
-                    "temperature": 0.7,
-                }
-                with httpx.Client(timeout=60) as client:
-                    r = client.post(url, headers=headers, json=payload)
-                if r.status_code >= 400:
-                    return f"Error: Copilot API {r.status_code}: {r.text}"
-                data = r.json()
-                return data["choices"][0]["message"]["content"].strip()
-            else:
-                response = openai.ChatCompletion.create(
-                    model=self.model,
-                    messages=messages,
-                    max_tokens=512,
-                    temperature=0.7,
-                )
-                return response.choices[0].message.content.strip()
+            if self.provider == "copilot" and not (os.getenv("GITHUB_TOKEN") or os.getenv("COPILOT_TOKEN")):
+                return "Error: Copilot token not set (GITHUB_TOKEN or COPILOT_TOKEN)."
+            adapter = self.router.resolve(self.model)
+            return adapter.chat(self.model, messages, temperature=0.7, max_tokens=512).strip()
         except Exception as e:
             return f"Error: {e}"
 
@@ -0,0 +1,411 @@
+"""
+Hedged requests and multi-provider failover for /chat.
+
+Models are grouped into tiers of roughly equivalent models. Within a tier,
+a model on a different provider can stand in for the requested one:
+
+- Hedging (opt-in): if the requested model has not answered within its
+  p95-derived deadline, or fails with a retryable error, a backup request
+  goes to an equivalent model on another provider that has credentials
+  configured. On the asyncio path the first successful answer wins and the
+  loser is cancelled. On the threaded path the request thread makes the
+  primary call itself, because a blocking socket read cannot be
+  interrupted. The backup runs on a pool thread, and only if one is free,
+  so abandoned calls never queue other requests. Its answer is used when
+  the primary fails.
+- Failover: when a call fails with 429/5xx, a timeout or a connection
+  error, the next model of the chain is tried. Streams only fail over before
+  their first token has been sent.
+"""
+import os
+import time
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from backend.providers import is_retryable
+
+logger = logging.getLogger(__name__)
+
+# Tiers of interchangeable models, drawn from the app's default_model_list
+DEFAULT_MODEL_GROUPS = [
+    ["gpt-5-mini", "gemini-2.5-flash", "sonar", "o4-mini", "Phi-4-mini", "Llama-3.1-8B-Instruct", "gpt-3.5-turbo"],
+    ["gpt-5", "gemini-2.5-pro", "sonar-pro", "Llama-3.1-70B-Instruct", "Mistral-large", "gpt-4o", "gpt-4"],
+    ["o3-mini", "sonar-reasoning"],
+]
+
+
+def parse_model_groups(spec):
+    """Parse "a|b|c;d|e" into [["a", "b", "c"], ["d", "e"]]."""
+    groups = []
+    for group in (spec or "").split(";"):
+        models = [m.strip() for m in group.split("|") if m.strip()]
+        if len(models) > 1:
+            groups.append(models)
+    return groups
+
+
+class LatencyTracker:
+    """Rolling per-model window of completion latencies."""
+
+    def __init__(self, window=200):
+        self.window = window
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    def record(self, model, seconds):
+        with self._lock:
+            samples = self._samples.get(model)
+            if samples is None:
+                samples = self._samples[model] = deque(maxlen=self.window)
+            samples.append(seconds)
+
+    def percentile(self, model, q=0.95, min_samples=20):
+        with self._lock:
+            samples = list(self._samples.get(model, ()))
+        if len(samples) < min_samples:
+            return None
+        samples.sort()
+        return samples[min(int(q * len(samples)), len(samples) - 1)]
+
+
+class Dispatcher:
+    def __init__(self, router, groups=None, available=None, hedging=False, failover=False,
+                 default_delay=3.0, min_delay=0.5, max_delay=30.0, max_workers=16, guards=None, metrics=None):
+        self.router = router
+        # Per-provider circuit breakers / concurrency limits (backend.resilience), optional
+        self.guards = guards
+        # Upstream latency / TTFT / token recording (backend.metrics), optional
+        self.metrics = metrics
+        self.hedging = hedging
+        self.failover = failover
+        self.default_delay = default_delay
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.latencies = LatencyTracker()
+        self._executor = None
+        self._max_workers = max_workers
+        self._executor_lock = threading.Lock()
+        self._backups = 0  # backup calls holding a pool thread
+        # Precompute each model's alternatives once: same tier, different provider with credentials
+        self._alternatives = {}
+        for group in groups if groups is not None else DEFAULT_MODEL_GROUPS:
+            usable = [m for m in group if router.serves(m) and (not available or m in available)]
+            for model in usable:
+                home = router.resolve(model).name
+                self._alternatives[model] = [
+                    m for m in usable if router.resolve(m).name != home and router.resolve(m).configured()
+                ]
+
+    def alternatives(self, model):
+        return self._alternatives.get(model, [])
+
+    def deadline(self, model):
+        p95 = self.latencies.percentile(model)
+        if p95 is None:
+            return self.default_delay
+        return min(max(p95, self.min_delay), self.max_delay)
+
+    def _chain(self, model):
+        return [model] + (self.alternatives(model) if self.failover else [])
+
+    def _backup(self, model):
+        """The first alternative whose provider would take a call now (breaker not open), or None."""
+        for backup in self.alternatives(model):
+            if self.guards is None or self.guards(self.router.resolve(backup).name).breaker.accepting():
+                return backup
+        return None
+
+    @staticmethod
+    def _failed_over(model, error, next_model):
+        logger.warning("failover", extra={"fields": {"model": model, "error": str(error), "next_model": next_model}})
+
+    def _pool(self):
+        if self._executor is None:
+            with self._executor_lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self._max_workers, thread_name_prefix="hedge")
+        return self._executor
+
+    def _submit_backup(self, fn):
+        """Run `fn` on a free pool thread, or return None when every thread is taken."""
+        with self._executor_lock:
+            if self._backups >= self._max_workers:
+                return None
+            self._backups += 1
+        future = self._pool().submit(fn)
+        future.add_done_callback(self._backup_done)
+        return future
+
+    def _backup_done(self, future):
+        with self._executor_lock:
+            self._backups -= 1
+
+    def _guard(self, adapter):
+        if self.guards is None:
+            return None
+        guard = self.guards(adapter.name)
+        guard.admit()
+        return guard
+
+    def _started(self, adapter):
+        if self.metrics is not None:
+            self.metrics.upstream_started(adapter.name)
+        return time.monotonic()
+
+    def _finished(self, adapter, model, outcome, started, first_token=None):
+        if self.metrics is not None:
+            self.metrics.upstream_finished(adapter.name, model, outcome, time.monotonic() - started, first_token)
+
+    # --- Blocking (threaded) path ---
+    def _call(self, model, messages, temperature, max_tokens):
+        adapter = self.router.resolve(model)
+        guard = self._guard(adapter)
+        started = self._started(adapter)
+        try:
+            content = adapter.chat(model, messages, temperature, max_tokens)
+        except Exception as e:
+            if guard:
+                guard.release(time.monotonic() - started, e)
+            self._finished(adapter, model, "error", started)
+            raise
+        elapsed = time.monotonic() - started
+        if guard:
+            guard.release(elapsed)
+        self.latencies.record(model, elapsed)
+        if self.metrics is not None:
+            self._finished(adapter, model, "ok", started)
+            self.metrics.count_tokens(model, messages, content)
+        return content
+
+    def _stream(self, model, messages, temperature, max_tokens):
+        adapter = self.router.resolve(model)
+        guard = self._guard(adapter)
+        started = self._started(adapter)
+        first_token = None
+        parts = [] if self.metrics is not None else None
+        try:
+            for delta in adapter.stream(model, messages, temperature, max_tokens):
+                if first_token is None:
+                    first_token = time.monotonic() - started
+                if parts is not None:
+                    parts.append(delta)
+                yield delta
+        except GeneratorExit:
+            if guard:
+                guard.abandon()
+            self._finished(adapter, model, "cancelled", started, first_token)
+            raise
+        except Exception as e:
+            if guard:
+                guard.release(time.monotonic() - started, e)
+            self._finished(adapter, model, "error", started, first_token)
+            raise
+        # Judge a stream by its time to first token; the slot is held until it ends
+        if guard:
+            guard.release(first_token if first_token is not None else time.monotonic() - started)
+        if self.metrics is not None:
+            self._finished(adapter, model, "ok", started, first_token)
+            self.metrics.count_tokens(model, messages, "".join(parts))
+
+    def complete(self, model, messages, temperature=0.7, max_tokens=512, hedge=None):
+        """Return (content, served_model) for `model`, hedging and failing over as configured."""
+        hedge = self.hedging if hedge is None else hedge
+        chain = self._chain(model)
+        for i, candidate in enumerate(chain):
+            try:
+                backup = self._backup(candidate) if hedge and i == 0 else None
+                if backup is not None:
+                    return self._hedged(candidate, backup, messages, temperature, max_tokens)
+                return self._call(candidate, messages, temperature, max_tokens), candidate
+            except Exception as e:
+                if i == len(chain) - 1 or not is_retryable(e):
+                    raise
+                self._failed_over(candidate, e, chain[i + 1])
+
+    def _hedged(self, model, backup, messages, temperature, max_tokens):
+        decided = threading.Event()
+        stand_down = threading.Event()
+
+        def backup_call():
+            # Parked until the deadline, or until the primary's outcome decides
+            decided.wait(self.deadline(model))
+            if stand_down.is_set():
+                return None
+            return self._call(backup, messages, temperature, max_tokens)
+
+        standby = self._submit_backup(backup_call)
+        if standby is None:
+            return self._call(model, messages, temperature, max_tokens), model
+        try:
+            content = self._call(model, messages, temperature, max_tokens)
+        except Exception as e:
+            if not is_retryable(e):
+                stand_down.set()
+                decided.set()
+                raise
+            # Fire now if still parked, then take the backup's answer
+            decided.set()
+            try:
+                return standby.result(), backup
+            except Exception:
+                raise e
+        # Stand the backup down; one that already fired is left to finish and discarded
+        stand_down.set()
+        decided.set()
+        return content, model
+
+    def stream(self, model, messages, temperature=0.7, max_tokens=512, served=None):
+        """Yield deltas, failing over before the first one; the model that answered is appended to `served`."""
+        chain = self._chain(model)
+        for i, candidate in enumerate(chain):
+            started = False
+            try:
+                for delta in self._stream(candidate, messages, temperature, max_tokens):
+                    if not started and served is not None:
+                        served.append(candidate)
+                    started = True
+                    yield delta
+                return
+            except Exception as e:
+                if started or i == len(chain) - 1 or not is_retryable(e):
+                    raise
+                self._failed_over(candidate, e, chain[i + 1])
+
+    # --- asyncio path ---
+    async def _acall(self, model, messages, temperature, max_tokens):
+        import asyncio  # only the ASGI app needs it; kept off the WSGI cold start
+        adapter = self.router.resolve(model)
+        guard = self._guard(adapter)
+        started = self._started(adapter)
+        try:
+            content = await adapter.achat(model, messages, temperature, max_tokens)
+        except asyncio.CancelledError:
+            # A cancelled hedging loser frees its slot without a verdict
+            if guard:
+                guard.abandon()
+            self._finished(adapter, model, "cancelled", started)
+            raise
+        except Exception as e:
+            if guard:
+                guard.release(time.monotonic() - started, e)
+            self._finished(adapter, model, "error", started)
+            raise
+        elapsed = time.monotonic() - started
+        if guard:
+            guard.release(elapsed)
+        self.latencies.record(model, elapsed)
+        if self.metrics is not None:
+            self._finished(adapter, model, "ok", started)
+            self.metrics.count_tokens(model, messages, content)
+        return content
+
+    async def _astream(self, model, messages, temperature, max_tokens):
+        import asyncio
+        adapter = self.router.resolve(model)
+        guard = self._guard(adapter)
+        started = self._started(adapter)
+        first_token = None
+        parts = [] if self.metrics is not None else None
+        try:
+            async for delta in adapter.astream(model, messages, temperature, max_tokens):
+                if first_token is None:
+                    first_token = time.monotonic() - started
+                if parts is not None:
+                    parts.append(delta)
+                yield delta
+        except (GeneratorExit, asyncio.CancelledError):
+            if guard:
+                guard.abandon()
+            self._finished(adapter, model, "cancelled", started, first_token)
+            raise
+        except Exception as e:
+            if guard:
+                guard.release(time.monotonic() - started, e)
+            self._finished(adapter, model, "error", started, first_token)
+            raise
+        if guard:
+            guard.release(first_token if first_token is not None else time.monotonic() - started)
+        if self.metrics is not None:
+            self._finished(adapter, model, "ok", started, first_token)
+            self.metrics.count_tokens(model, messages, "".join(parts))
+
+    async def acomplete(self, model, messages, temperature=0.7, max_tokens=512, hedge=None):
+        hedge = self.hedging if hedge is None else hedge
+        chain = self._chain(model)
+        for i, candidate in enumerate(chain):
+            try:
+                backup = self._backup(candidate) if hedge and i == 0 else None
+                if backup is not None:
+                    return await self._ahedged(candidate, backup, messages, temperature, max_tokens)
+                return await self._acall(candidate, messages, temperature, max_tokens), candidate
+            except Exception as e:
+                if i == len(chain) - 1 or not is_retryable(e):
+                    raise
+                self._failed_over(candidate, e, chain[i + 1])
+
+    async def _ahedged(self, model, backup, messages, temperature, max_tokens):
+        import asyncio
+        primary = asyncio.ensure_future(self._acall(model, messages, temperature, max_tokens))
+        tasks = {primary: model}
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=self.deadline(model))
+            if done and primary.exception() is None:
+                return primary.result(), model
+            if done and not is_retryable(primary.exception()):
+                raise primary.exception()
+            tasks[asyncio.ensure_future(self._acall(backup, messages, temperature, max_tokens))] = backup
+            pending = set(tasks)
+            errors = []
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result(), tasks[task]
+                    if task is primary and not is_retryable(task.exception()):
+                        # A bad request: the backup would be rejected too
+                        raise task.exception()
+                    errors.append(task.exception())
+            raise errors[0]
+        finally:
+            # Cancel the loser (or everything, if we were cancelled ourselves)
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    async def astream(self, model, messages, temperature=0.7, max_tokens=512, served=None):
+        chain = self._chain(model)
+        for i, candidate in enumerate(chain):
+            started = False
+            try:
+                async for delta in self._astream(candidate, messages, temperature, max_tokens):
+                    if not started and served is not None:
+                        served.append(candidate)
+                    started = True
+                    yield delta
+                return
+            except Exception as e:
+                if started or i == len(chain) - 1 or not is_retryable(e):
+                    raise
+                self._failed_over(candidate, e, chain[i + 1])
+
+
+def _flag(name, default="0"):
+    return os.getenv(name, default).strip().lower() in ("1", "true", "yes", "on")
+
+
+def dispatcher_from_env(router, available=None, guards=None, metrics=None):
+    groups = parse_model_groups(os.getenv("CHAT_MODEL_GROUPS")) or DEFAULT_MODEL_GROUPS
+    return Dispatcher(
+        router,
+        groups=groups,
+        available=available,
+        hedging=_flag("CHAT_HEDGING"),
+        failover=_flag("CHAT_FAILOVER"),
+        default_delay=float(os.getenv("HEDGE_DEFAULT_DELAY", "3")),
+        min_delay=float(os.getenv("HEDGE_MIN_DELAY", "0.5")),
+        max_delay=float(os.getenv("HEDGE_MAX_DELAY", "30")),
+        guards=guards,
+        metrics=metrics,
+    )
@@ -0,0 +1,142 @@
+"""
+Process-wide pooled HTTP clients for upstream LLM providers.
+
+One keep-alive client is kept per upstream origin (scheme://host:port) and
+shared by every request and worker thread, so chat calls reuse warm TCP/TLS
+connections instead of handshaking on every message.
+
+httpx itself is imported when the first client is created, and asyncio only
+by the async helpers.
+"""
+import os
+import atexit
+import threading
+from urllib.parse import urlsplit
+
+_clients = {}
+_async_clients = {}
+_lock = threading.Lock()
+
+
+def _env_int(name, default):
+    try:
+        return int(os.getenv(name, str(default)))
+    except ValueError:
+        return default
+
+
+def _env_float(name, default):
+    try:
+        return float(os.getenv(name, str(default)))
+    except ValueError:
+        return default
+
+
+def _httpx():
+    import httpx
+    return httpx
+
+
+def pool_limits():
+    return _httpx().Limits(
+        max_connections=_env_int("HTTP_MAX_CONNECTIONS", 100),
+        max_keepalive_connections=_env_int("HTTP_MAX_KEEPALIVE", 20),
+        keepalive_expiry=_env_float("HTTP_KEEPALIVE_EXPIRY", 30.0),
+    )
+
+
+def http2_enabled():
+    if os.getenv("HTTP2", "1").strip().lower() in ("0", "false", "no", "off"):
+        return False
+    # HTTP/2 needs the optional `h2` package (pip install httpx[http2])
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def origin_of(url):
+    u = urlsplit(url)
+    scheme = u.scheme.lower()
+    port = u.port or (443 if scheme == "https" else 80)
+    return f"{scheme}://{u.hostname}:{port}"
+
+
+def get_client(base_url):
+    """Return the shared httpx.Client for the origin of `base_url`.
+
+    Callers pass per-call timeouts to `client.post(..., timeout=...)` and
+    must not close the returned client.
+    """
+    key = origin_of(base_url)
+    client = _clients.get(key)
+    if client is not None:
+        return client
+    with _lock:
+        client = _clients.get(key)
+        if client is None:
+            client = _httpx().Client(
+                limits=pool_limits(),
+                http2=http2_enabled(),
+                timeout=_env_float("HTTP_TIMEOUT", 60.0),
+            )
+            _clients[key] = client
+    return client
+
+
+def get_async_client(base_url):
+    """Return the shared httpx.AsyncClient for `base_url` on the running event loop.
+
+    Async clients are bound to the loop that created them, so one is kept per
+    (loop, origin) pair; in an ASGI worker that is a single pool per origin.
+    """
+    import asyncio
+    loop = asyncio.get_running_loop()
+    key = (id(loop), origin_of(base_url))
+    entry = _async_clients.get(key)
+    if entry is None or entry[0] is not loop:
+        client = _httpx().AsyncClient(
+            limits=pool_limits(),
+            http2=http2_enabled(),
+            timeout=_env_float("HTTP_TIMEOUT", 60.0),
+        )
+        _async_clients[key] = entry = (loop, client)
+    return entry[1]
+
+
+async def aclose_all():
+    import asyncio
+    loop = asyncio.get_running_loop()
+    for key, (owner, client) in list(_async_clients.items()):
+        if owner is loop:
+            _async_clients.pop(key, None)
+            try:
+                await client.aclose()
+            except Exception:
+                pass
+
+
+def close_all():
+    with _lock:
+        clients = list(_clients.values())
+        _clients.clear()
+    for client in clients:
+        try:
+            client.close()
+        except Exception:
+            pass
+
+
+def _reset_after_fork():
+    # Sockets inherited from the parent must not be shared with it; drop the
+    # references without closing so the parent's connections stay intact.
+    global _lock
+    _clients.clear()
+    _async_clients.clear()
+    _lock = threading.Lock()
+
+
+atexit.register(close_all)
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
@@ -0,0 +1,203 @@
+"""
+Prometheus metrics for the web app, served at /metrics.
+
+Recorded: HTTP requests (count, status, latency, in flight) per route;
+upstream calls (count by outcome, latency, time to first token, in flight)
+per provider and model; estimated prompt/completion tokens per model; and
+response-cache lookups by status (hit ratio = hit / all).
+
+Under gunicorn, set METRICS_DIR (PROMETHEUS_MULTIPROC_DIR) to a directory
+that is emptied on deploy: every worker then writes its samples to mmap'd
+files there and /metrics sums them across workers. gunicorn.conf.py clears
+the directory on start and drops exited workers' live gauges.
+
+prometheus_client is optional and imported only when metrics are enabled;
+without it, recording is skipped and /metrics is not served. With LAZY_INIT
+the import waits for the first request (`LazyMetrics`).
+"""
+import os
+import threading
+
+from backend.conversations import estimate_tokens
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2, 4, 8, 16, 32, 64)
+TTFT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2, 4, 8, 16)
+
+
+class Metrics:
+    def __init__(self, prometheus, multiprocess_dir=None, max_models=50):
+        self._prometheus = prometheus
+        self.multiprocess_dir = multiprocess_dir
+        # Model names come from requests; cap them so label cardinality stays bounded
+        self.max_models = max_models
+        self._models = set()
+        self._lock = threading.Lock()
+        if multiprocess_dir:
+            # Samples live in the shared directory; a fresh registry reads them back at scrape time
+            registry = None
+        else:
+            registry = self.registry = prometheus.CollectorRegistry()
+        Counter, Gauge, Histogram = prometheus.Counter, prometheus.Gauge, prometheus.Histogram
+        self.http_requests = Counter(
+            "jarvis_http_requests_total", "HTTP requests", ["route", "method", "status"], registry=registry,
+        )
+        self.http_latency = Histogram(
+            "jarvis_http_request_duration_seconds", "HTTP request duration (to the end of the stream for SSE)",
+            ["route"], buckets=LATENCY_BUCKETS, registry=registry,
+        )
+        self.http_in_flight = Gauge(
+            "jarvis_http_requests_in_flight", "HTTP requests being served", ["route"],
+            multiprocess_mode="livesum", registry=registry,
+        )
+        self.upstream_requests = Counter(
+            "jarvis_upstream_requests_total", "Upstream LLM calls", ["provider", "model", "outcome"], registry=registry,
+        )
+        self.upstream_latency = Histogram(
+            "jarvis_upstream_duration_seconds", "Upstream call duration (whole stream for streams)",
+            ["provider", "model"], buckets=LATENCY_BUCKETS, registry=registry,
+        )
+        self.upstream_ttft = Histogram(
+            "jarvis_upstream_ttft_seconds", "Upstream time to first token (streams)", ["provider", "model"],
+            buckets=TTFT_BUCKETS, registry=registry,
+        )
+        self.upstream_in_flight = Gauge(
+            "jarvis_upstream_in_flight", "Upstream calls in progress", ["provider"],
+            multiprocess_mode="livesum", registry=registry,
+        )
+        self.tokens = Counter(
+            "jarvis_tokens_total", "Estimated tokens sent to and received from upstreams", ["model", "kind"],
+            registry=registry,
+        )
+        self.cache_lookups = Counter(
+            "jarvis_cache_lookups_total", "Response cache lookups for /chat", ["status"], registry=registry,
+        )
+
+    def _model(self, model):
+        if model in self._models:
+            return model
+        with self._lock:
+            if len(self._models) < self.max_models:
+                self._models.add(model)
+                return model
+        return "other"
+
+    # --- HTTP ---
+    def http_started(self, route):
+        self.http_in_flight.labels(route).inc()
+
+    def http_finished(self, route, method, status, elapsed):
+        self.http_in_flight.labels(route).dec()
+        self.http_requests.labels(route, method, str(status)).inc()
+        self.http_latency.labels(route).observe(elapsed)
+
+    # --- Upstream ---
+    def upstream_started(self, provider):
+        self.upstream_in_flight.labels(provider).inc()
+
+    def upstream_finished(self, provider, model, outcome, elapsed, ttft=None):
+        model = self._model(model)
+        self.upstream_in_flight.labels(provider).dec()
+        self.upstream_requests.labels(provider, model, outcome).inc()
+        if outcome == "ok":
+            self.upstream_latency.labels(provider, model).observe(elapsed)
+        if ttft is not None:
+            self.upstream_ttft.labels(provider, model).observe(ttft)
+
+    def count_tokens(self, model, messages, completion):
+        model = self._model(model)
+        prompt = sum(estimate_tokens(m.get("content")) for m in messages)
+        self.tokens.labels(model, "prompt").inc(prompt)
+        self.tokens.labels(model, "completion").inc(estimate_tokens(completion))
+
+    # --- Cache ---
+    def cache_lookup(self, status):
+        self.cache_lookups.labels(status).inc()
+
+    def render(self):
+        """Return (body, content_type) in the Prometheus text format."""
+        prometheus = self._prometheus
+        if self.multiprocess_dir:
+            registry = prometheus.CollectorRegistry()
+            prometheus.multiprocess.MultiProcessCollector(registry, path=self.multiprocess_dir)
+        else:
+            registry = self.registry
+        return prometheus.generate_latest(registry), prometheus.CONTENT_TYPE_LATEST
+
+
+def _skip(*args, **kwargs):
+    return None
+
+
+class LazyMetrics:
+    """Stands in for Metrics and builds it (importing prometheus_client) on first use.
+
+    If prometheus_client turns out to be missing, every call is a no-op and
+    render() returns None.
+    """
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._metrics = None
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def _load(self):
+        with self._lock:
+            if not self._loaded:
+                self._metrics = self._factory()
+                self._loaded = True
+        return self._metrics
+
+    def __getattr__(self, name):
+        metrics = self._metrics if self._loaded else self._load()
+        return _skip if metrics is None else getattr(metrics, name)
+
+
+def metrics_dir():
+    return os.getenv("METRICS_DIR") or os.getenv("PROMETHEUS_MULTIPROC_DIR")
+
+
+def clear_metrics_dir():
+    """Remove samples left by a previous run (called once from the gunicorn master on start)."""
+    directory = metrics_dir()
+    if not directory or not os.path.isdir(directory):
+        return
+    for name in os.listdir(directory):
+        if name.endswith(".db"):
+            os.remove(os.path.join(directory, name))
+
+
+def mark_process_dead(pid):
+    """Drop a dead worker's live gauges (called from gunicorn's child_exit hook)."""
+    directory = metrics_dir()
+    if not directory:
+        return
+    try:
+        from prometheus_client import multiprocess
+    except ImportError:
+        return
+    multiprocess.mark_process_dead(pid, directory)
+
+
+def metrics_from_env(lazy=False):
+    """Build the metrics recorder, or None when METRICS=0 or prometheus_client is missing.
+
+    With `lazy`, return a LazyMetrics that does the import on first use.
+    """
+    if os.getenv("METRICS", "1").strip().lower() in ("0", "false", "no", "off"):
+        return None
+    if lazy:
+        return LazyMetrics(metrics_from_env)
+    directory = metrics_dir()
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+        # prometheus_client picks its storage when first imported, so this must come first
+        os.environ["PROMETHEUS_MULTIPROC_DIR"] = directory
+    try:
+        import prometheus_client
+        import prometheus_client.multiprocess  # noqa: F401
+    except ImportError:
+        print("Metrics disabled: prometheus_client is not installed")
+        return None
+    return Metrics(prometheus_client, multiprocess_dir=directory,
+                   max_models=int(os.getenv("METRICS_MAX_MODELS", "50")))
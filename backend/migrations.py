@@ -0,0 +1,114 @@
+"""
+One-time schema setup for the app database, guarded by a version marker.
+
+`migrate()` compares SQLite's `PRAGMA user_version` with SCHEMA_VERSION and
+only runs the migrations that are missing, so a cold start against an
+up-to-date database costs a single pragma read instead of the full DDL. Each
+migration is idempotent (IF NOT EXISTS, columns added only when missing),
+which makes it safe on databases created before the marker existed.
+
+`app_meta` holds small key/value markers for other one-time startup work,
+such as the admin seed.
+"""
+import hmac
+import hashlib
+
+from backend.users import ensure_user_indexes
+
+
+def _add_column(conn, table, column):
+    """ALTER TABLE ... ADD COLUMN `column` ("name TYPE ...") unless the table already has it."""
+    name = column.split()[0]
+    if not any(row[1] == name for row in conn.execute(f"PRAGMA table_info({table})")):
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN {column}")
+
+
+def _v1_users(conn):
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT UNIQUE NOT NULL,
+            password_hash TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """
+    )
+    _add_column(conn, "users", "is_admin INTEGER DEFAULT 0")
+    ensure_user_indexes(conn)
+    conn.execute("CREATE TABLE IF NOT EXISTS app_meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+
+
+def _v2_conversations(conn):
+    """Server-side chat history (backend.conversations)."""
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS conversations (
+            id TEXT PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            title TEXT,
+            token_total INTEGER NOT NULL DEFAULT 0,
+            created_at REAL NOT NULL,
+            updated_at REAL NOT NULL
+        )
+        """
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_conversations_user ON conversations (user_id, updated_at)")
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS conversation_messages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            conversation_id TEXT NOT NULL,
+            role TEXT NOT NULL,
+            content TEXT NOT NULL,
+            tokens INTEGER NOT NULL,
+            position INTEGER NOT NULL,
+            created_at REAL NOT NULL
+        )
+        """
+    )
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_conversation_messages_position "
+        "ON conversation_messages (conversation_id, position)"
+    )
+
+
+def _v3_conversation_summaries(conn):
+    """Rolling summary of the turns before `summary_upto` (backend.conversations.Summarizer)."""
+    for column in ("summary TEXT", "summary_upto INTEGER NOT NULL DEFAULT 0", "summary_tokens INTEGER NOT NULL DEFAULT 0"):
+        _add_column(conn, "conversations", column)
+
+
+MIGRATIONS = [_v1_users, _v2_conversations, _v3_conversation_summaries]
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def migrate(db):
+    """Bring the schema up to SCHEMA_VERSION; returns the number of migrations applied."""
+    if db.query_one("PRAGMA user_version")[0] >= SCHEMA_VERSION:
+        return 0
+    with db.transaction(immediate=True) as conn:
+        # Another worker may have migrated while we waited for the write lock
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        for migration in MIGRATIONS[version:]:
+            migration(conn)
+        conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+    return SCHEMA_VERSION - version
+
+
+def get_meta(db, key):
+    row = db.query_one("SELECT value FROM app_meta WHERE key = ?", (key,))
+    return row[0] if row else None
+
+
+def set_meta(conn, key, value):
+    conn.execute(
+        "INSERT INTO app_meta (key, value) VALUES (?, ?) ON CONFLICT (key) DO UPDATE SET value = excluded.value",
+        (key, value),
+    )
+
+
+def fingerprint(secret, *parts):
+    """Keyed digest of `parts`, for markers that must not reveal what they were made from."""
+    message = "\0".join(str(p) for p in parts).encode("utf-8")
+    return hmac.new(str(secret).encode("utf-8"), message, hashlib.sha256).hexdigest()
@@ -0,0 +1,199 @@
+"""
+Password hashing off the request thread.
+
+The KDF behind `generate_password_hash` / `check_password_hash` is CPU-bound
+by design; run inline, a login storm starves the worker that also serves
+chat. `PasswordHasher` runs it in a small process pool instead:
+
+- the pool is bounded, and so is the number of hashes waiting for it: past
+  `max_queue`, callers get `HasherBusy` right away rather than queueing up;
+- the hash method (e.g. "scrypt:32768:8:1" or "pbkdf2:sha256:600000") is
+  configurable, and `needs_rehash` tells the login route when a stored hash
+  was made with older parameters so it can be upgraded transparently;
+- `AuthThrottle` caps hashing attempts per client IP.
+
+Where worker processes are unavailable (e.g. serverless sandboxes), hashing
+falls back to running inline. multiprocessing is imported only when the pool
+starts, so importing this module stays cheap for LAZY_INIT cold starts.
+"""
+import os
+import time
+import threading
+from collections import deque
+from concurrent.futures import TimeoutError as FutureTimeout
+
+from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS, generate_password_hash, check_password_hash
+
+
+class HasherBusy(RuntimeError):
+    """Too many password hashes are already queued."""
+
+
+def _hash(password, method):
+    return generate_password_hash(password, method=method)
+
+
+def _verify(pwhash, password):
+    return check_password_hash(pwhash, password)
+
+
+def _method_prefix(pwhash):
+    return (pwhash or "").split("$", 1)[0]
+
+
+def canonical_method(method):
+    """The method as werkzeug records it in a hash ("scrypt" -> "scrypt:32768:8:1"), or None if unrecognized.
+
+    Mirrors werkzeug's defaults, so needs_rehash() can compare stored hashes
+    without running the KDF.
+    """
+    name, *args = (method or "").split(":")
+    if not all(a.strip() for a in args):
+        return None
+    if name == "scrypt":
+        if not args:
+            return f"scrypt:{2 ** 15}:8:1"
+        if len(args) == 3 and all(a.isdigit() for a in args):
+            return "scrypt:" + ":".join(str(int(a)) for a in args)
+    elif name == "pbkdf2":
+        if len(args) <= 1:
+            return f"pbkdf2:{args[0] if args else 'sha256'}:{DEFAULT_PBKDF2_ITERATIONS}"
+        if len(args) == 2 and args[1].isdigit():
+            return f"pbkdf2:{args[0]}:{int(args[1])}"
+    return None
+
+
+class PasswordHasher:
+    def __init__(self, method="scrypt", workers=2, max_queue=32, timeout=10.0):
+        self.method = method
+        self._prefix = None
+        self.workers = workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self._executor = None
+        self._pending = 0
+        self._lock = threading.Lock()
+        # Concurrent first calls (LAZY_INIT) must not each create a pool
+        self._start_lock = threading.Lock()
+
+    def start(self):
+        """Start the worker processes (at import, or on first use with LAZY_INIT)."""
+        with self._start_lock:
+            if self.workers <= 0 or self._executor is not None:
+                return
+            try:
+                import multiprocessing
+                from concurrent.futures import ProcessPoolExecutor
+                ctx = multiprocessing.get_context("fork") if "fork" in multiprocessing.get_all_start_methods() else None
+                executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=ctx)
+                # With fork, the first submit creates every worker process
+                warmup = executor.submit(_verify, "", "")
+                self._executor = executor
+                warmup.result(timeout=self.timeout)
+            except FutureTimeout:
+                pass  # slow to warm up, but usable
+            except (OSError, ImportError, NotImplementedError) as e:
+                print("Password hashing pool unavailable, hashing inline:", e)
+                self._executor = None
+                self.workers = 0
+
+    def _run(self, fn, *args):
+        if self._executor is None:
+            self.start()
+        if self._executor is None:
+            return fn(*args)
+        with self._lock:
+            if self._pending >= self.max_queue:
+                raise HasherBusy("Too many sign-in attempts in progress; try again shortly.")
+            self._pending += 1
+        try:
+            future = self._executor.submit(fn, *args)
+        except BaseException:
+            self._release()
+            raise
+        # The slot is held until the hash is done, not until we stop waiting for it,
+        # so max_queue bounds the work actually queued in the pool
+        future.add_done_callback(self._release)
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeout:
+            raise HasherBusy("Sign-in is taking longer than usual; try again shortly.") from None
+
+    def _release(self, future=None):
+        with self._lock:
+            self._pending -= 1
+
+    @property
+    def prefix(self):
+        """Canonical form of the configured method, e.g. "scrypt" -> "scrypt:32768:8:1"."""
+        if self._prefix is None:
+            prefix = canonical_method(self.method)
+            if prefix is None:
+                # A form we can't resolve ourselves: let werkzeug hash once, in the pool like any other hash
+                prefix = _method_prefix(self._run(_hash, "probe", self.method))
+            self._prefix = prefix
+        return self._prefix
+
+    def hash(self, password):
+        return self._run(_hash, password, self.method)
+
+    def verify(self, pwhash, password):
+        if not pwhash:
+            return False
+        return self._run(_verify, pwhash, password)
+
+    def needs_rehash(self, pwhash):
+        return _method_prefix(pwhash) != self.prefix
+
+    def snapshot(self):
+        with self._lock:
+            return {"method": self.prefix, "workers": self.workers, "pending": self._pending, "max_queue": self.max_queue}
+
+
+class AuthThrottle:
+    """Sliding-window limit on password attempts per client IP."""
+
+    def __init__(self, limit=10, window=60.0, max_clients=10000):
+        self.limit = limit
+        self.window = window
+        self.max_clients = max_clients
+        self._attempts = {}
+        self._lock = threading.Lock()
+
+    def allow(self, client):
+        """Record an attempt by `client`; returns 0 if allowed, else seconds until it may retry."""
+        if self.limit <= 0:
+            return 0
+        now = time.monotonic()
+        with self._lock:
+            attempts = self._attempts.get(client)
+            if attempts is None:
+                if len(self._attempts) >= self.max_clients:
+                    self._prune(now)
+                attempts = self._attempts[client] = deque()
+            while attempts and now - attempts[0] >= self.window:
+                attempts.popleft()
+            if len(attempts) >= self.limit:
+                return max(1, int(self.window - (now - attempts[0])) + 1)
+            attempts.append(now)
+            return 0
+
+    def _prune(self, now):
+        for client in [c for c, a in self._attempts.items() if not a or now - a[-1] >= self.window]:
+            del self._attempts[client]
+
+
+def hasher_from_env():
+    return PasswordHasher(
+        method=os.getenv("PASSWORD_HASH_METHOD", "scrypt"),
+        workers=int(os.getenv("PASSWORD_HASH_WORKERS", "2")),
+        max_queue=int(os.getenv("PASSWORD_HASH_QUEUE", "32")),
+        timeout=float(os.getenv("PASSWORD_HASH_TIMEOUT", "10")),
+    )
+
+
+def throttle_from_env():
+    return AuthThrottle(
+        limit=int(os.getenv("AUTH_RATE_LIMIT", "10")),
+        window=float(os.getenv("AUTH_RATE_WINDOW", "60")),
+    )
@@ -0,0 +1,210 @@
+"""
+Pre-synthesized audio for the assistant's fixed phrases.
+
+Greetings, confirmations and error messages are the same few sentences
+said over and over, and synthesizing each of them again makes every reply
+wait for the TTS engine. The speech worker (backend/tts.py) checks this
+cache before it speaks:
+
+- Only known phrases are cached: the entries of PHRASES, and text matching
+  one of TEMPLATES such as "Opening {app}". Chat replies and other one-off
+  text always go to the engine.
+- On a miss the phrase is spoken as usual, and the worker then renders it
+  to WAV with the same engine (`save_to_file`) at low priority. The next
+  time it plays from disk.
+- Files are keyed by text, driver, voice and rate, so changing
+  TTS_VOICE_INDEX or TTS_RATE never plays audio in the old voice.
+- The directory is an LRU bounded by TTS_CACHE_MAX_MB. A hit refreshes the
+  file's mtime, and the oldest files are evicted first.
+- Playback goes through pygame.mixer, which feature.py has already
+  initialized. Decoded Sounds for the most recent phrases stay in memory.
+
+Render everything up front (e.g. after install) with
+
+    python -m backend.phrase_cache
+
+which covers PHRASES plus "Opening <name>" for every app and site in the
+command tables.
+"""
+import os
+import re
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+from backend import config
+
+PHRASES = [
+    "Welcome to Jarvis",
+    "Ready for Face Authentication",
+    "Face recognized successfully",
+    "Welcome to Your Assistant",
+    "Face not recognized. Please try again",
+    "Please specify what to open",
+    "What message to send?",
+    "No command was given.",
+    "Sorry, something went wrong.",
+    "Contact not found.",
+    "No phone number provided",
+    "Invalid flag provided",
+    "Database error occurred",
+    "An unexpected error occurred",
+    "Database error occurred while searching for contact.",
+    "An error occurred while searching for contact.",
+    "Error playing YouTube video",
+    "Error in WhatsApp operation",
+]
+
+TEMPLATES = [
+    "Opening {app}",
+    "Calling {name}",
+    "Message sent successfully to {name}",
+]
+
+# Longer template values are almost never repeated (and often error text), so they are not cached
+MAX_SLOT_LENGTH = 40
+
+
+def _template_pattern(template):
+    slot = r"(.{1,%d})" % MAX_SLOT_LENGTH
+    return re.compile(slot.join(re.escape(part) for part in re.split(r"\{\w+\}", template)))
+
+
+class PhraseCache:
+    def __init__(self, directory, max_bytes, phrases=PHRASES, templates=TEMPLATES, max_sounds=32):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_sounds = max_sounds
+        self.voice = ""  # set by the speech worker once its engine is configured
+        self._phrases = set(phrases)
+        self._patterns = [_template_pattern(t) for t in templates]
+        self._sounds = OrderedDict()
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def wants(self, text):
+        """True if `text` is a known phrase worth keeping on disk."""
+        return text in self._phrases or any(p.fullmatch(text) for p in self._patterns)
+
+    def path_for(self, text):
+        key = hashlib.sha256(f"{self.voice}\0{text}".encode("utf-8")).hexdigest()[:32]
+        return os.path.join(self.directory, f"{key}.wav")
+
+    def lookup(self, text):
+        """Path of the rendered phrase, or None. A hit counts as a use for LRU eviction."""
+        if not self.wants(text):
+            return None
+        path = self.path_for(text)
+        try:
+            os.utime(path)
+        except OSError:
+            return None
+        return path
+
+    def render(self, engine, text):
+        """Synthesize `text` to the cache with `engine`; must run on the engine's thread."""
+        path = self.path_for(text)
+        # Hidden temp name: a half-written file is never picked up by lookup() or eviction
+        partial = os.path.join(self.directory, "." + os.path.basename(path))
+        try:
+            engine.save_to_file(text, partial)
+            engine.runAndWait()
+            if os.path.getsize(partial) <= 44:  # WAV header only
+                raise OSError("engine wrote no audio")
+            os.replace(partial, path)
+        except Exception:
+            try:
+                os.remove(partial)
+            except OSError:
+                pass
+            raise
+        self.evict()
+        return path
+
+    def evict(self):
+        """Delete least recently used files until the directory fits in max_bytes."""
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".wav") and not entry.name.startswith("."):
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            with self._lock:
+                self._sounds.pop(path, None)
+
+    def _sound(self, path):
+        import pygame
+        with self._lock:
+            sound = self._sounds.pop(path, None)
+        if sound is None:
+            if not pygame.mixer.get_init():
+                pygame.mixer.init()
+            sound = pygame.mixer.Sound(path)
+        with self._lock:
+            self._sounds[path] = sound
+            while len(self._sounds) > self.max_sounds:
+                self._sounds.popitem(last=False)
+        return sound
+
+    def play(self, path, cancelled=lambda: False):
+        """Play a rendered phrase to the end; returns False if `cancelled()` cut it short."""
+        channel = self._sound(path).play()
+        if channel is None:
+            raise RuntimeError("no free mixer channel")
+        while channel.get_busy():
+            if cancelled():
+                channel.stop()
+                return False
+            time.sleep(0.01)
+        return True
+
+
+def phrase_cache_from_env():
+    """The phrase cache from TTS_CACHE* settings, or None when TTS_CACHE=0."""
+    if not config.TTS_CACHE:
+        return None
+    try:
+        return PhraseCache(config.TTS_CACHE_DIR, int(config.TTS_CACHE_MAX_MB * 1024 * 1024))
+    except OSError as e:
+        print(f"Phrase cache disabled: {e}")
+        return None
+
+
+def known_phrases():
+    """PHRASES plus "Opening <name>" for each app and site the assistant can open."""
+    phrases = list(PHRASES)
+    try:
+        from backend.database import get_db
+        db = get_db()
+        for table in ("sys_command", "web_command"):
+            phrases += [f"Opening {name.lower().strip()}" for (name,) in db.query_all(f"SELECT name FROM {table}")]
+    except Exception as e:
+        print(f"Skipping command names: {e}")
+    return phrases
+
+
+def main():
+    from backend.tts import get_speech_worker
+    worker = get_speech_worker()
+    if worker.cache is None:
+        print("TTS_CACHE is off; nothing to render.")
+        return
+    jobs = worker.prerender(known_phrases())
+    rendered = sum(1 for job in jobs if job.wait())
+    print(f"{rendered} of {len(jobs)} phrases cached in {worker.cache.directory}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,593 @@
+"""
+Pluggable LLM provider adapters and the model -> adapter router.
+
+Every upstream is an adapter class exposing the same interface:
+
+    chat(model, messages, temperature, max_tokens)         -> str
+    achat(model, messages, temperature, max_tokens)        -> str (awaitable)
+    stream(model, messages, temperature, max_tokens)       -> iterator of text deltas
+    astream(model, messages, temperature, max_tokens)      -> async iterator of text deltas
+
+`build_router()` instantiates the registered adapters once at startup and
+builds a dict lookup table from model name to adapter, so dispatch is a
+single O(1) lookup. Adding a provider means writing a new adapter class and
+decorating it with `@register_adapter`.
+
+The openai SDK and httpx are only imported when first needed, which keeps
+them off the cold-start path of the serverless handlers.
+"""
+import os
+import sys
+import json
+
+from backend.http_clients import get_client, get_async_client
+from backend.capabilities import (
+    TOKEN_PARAM, SUPPORTS_TEMPERATURE, SUPPORTS_SYSTEM_ROLE, SUPPORTS_STREAMING,
+)
+
+DEFAULT_SYSTEM_PROMPT = "You are Jarvis, a helpful AI assistant."
+
+ADAPTERS = {}
+
+
+def register_adapter(cls):
+    ADAPTERS[cls.name] = cls
+    return cls
+
+
+def build_messages(user_message, system_prompt=DEFAULT_SYSTEM_PROMPT, history=None):
+    messages = []
+    if system_prompt:
+        messages.append({"role": "system", "content": system_prompt})
+    messages.extend(history or ())
+    messages.append({"role": "user", "content": user_message})
+    return messages
+
+
+def fold_system_prompt(messages):
+    """Merge system messages into the first user turn for models without a system role."""
+    system = "\n\n".join(m["content"] for m in messages if m["role"] == "system")
+    rest = [dict(m) for m in messages if m["role"] != "system"]
+    if system and rest:
+        rest[0]["content"] = f"{system}\n\n{rest[0]['content']}"
+    return rest
+
+
+def iter_sse_json(response):
+    """Yield decoded JSON objects from the `data:` lines of an upstream SSE response."""
+    for line in response.iter_lines():
+        data = _sse_data(line)
+        if data is not None:
+            yield data
+
+
+async def aiter_sse_json(response):
+    async for line in response.aiter_lines():
+        data = _sse_data(line)
+        if data is not None:
+            yield data
+
+
+def _sse_data(line):
+    if not line.startswith("data:"):
+        return None
+    data = line[5:].strip()
+    if not data or data == "[DONE]":
+        return None
+    return json.loads(data)
+
+
+class UpstreamError(RuntimeError):
+    """An upstream answered with an HTTP error; `status` is its status code."""
+
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+
+def is_retryable(exc):
+    """True for failures another provider might not have: 429, 5xx, timeouts, connection errors."""
+    status = getattr(exc, "status", None) or getattr(exc, "http_status", None)
+    if status is not None:
+        return status == 429 or status >= 500
+    # httpx cannot have raised anything if it was never imported
+    httpx = sys.modules.get("httpx")
+    if httpx is not None and isinstance(exc, httpx.TransportError):
+        return True
+    # openai 0.28 SDK errors without an HTTP status
+    return type(exc).__name__ in ("Timeout", "APIConnectionError", "ServiceUnavailableError", "TryAgain")
+
+
+def _first_env(names):
+    for name in names:
+        value = os.getenv(name)
+        if value:
+            return value
+    return None
+
+
+class ProviderAdapter:
+    """Base class for upstream adapters.
+
+    `models` lists the model names routed to the adapter, `prefixes` catches
+    families such as "gemini-*". Adapters with `primary = True` are mutually
+    exclusive and selected by LLM_PROVIDER; the selected one also serves any
+    model no other adapter claims.
+    """
+    name = None
+    models = ()
+    prefixes = ()
+    primary = False
+
+    def __init__(self, config=None, capabilities=None):
+        self.config = self.default_config()
+        self.config.update(config or {})
+        self.capabilities = capabilities
+
+    def default_config(self):
+        return {}
+
+    def configured(self):
+        """True if the credentials this adapter needs are set."""
+        return True
+
+    def chat(self, model, messages, temperature=0.7, max_tokens=512):
+        raise NotImplementedError
+
+    async def achat(self, model, messages, temperature=0.7, max_tokens=512):
+        raise NotImplementedError
+
+    def stream(self, model, messages, temperature=0.7, max_tokens=512):
+        raise NotImplementedError
+
+    def astream(self, model, messages, temperature=0.7, max_tokens=512):
+        raise NotImplementedError
+
+
+class ChatCompletionsAdapter(ProviderAdapter):
+    """OpenAI-style `/chat/completions` endpoints over the shared httpx pools.
+
+    When an upstream rejects a request with a 400 that names the offending
+    parameter, the request is adjusted and retried, and the quirk is recorded
+    in the capability store so the next request is sent correctly up front.
+    """
+    label = "Upstream"
+    max_attempts = 4
+
+    def default_config(self):
+        return {"api_base": None, "key_envs": (), "auth_scheme": "bearer", "timeout": 60}
+
+    @property
+    def base_url(self):
+        return self.config["api_base"].rstrip("/")
+
+    @property
+    def url(self):
+        return f"{self.base_url}/chat/completions"
+
+    def headers(self):
+        key = _first_env(self.config["key_envs"])
+        if self.config["auth_scheme"] == "api-key":
+            return {"api-key": key, "Content-Type": "application/json"}
+        return {"Authorization": f"Bearer {key}", "Content-Type": "application/json"}
+
+    def configured(self):
+        return not self.config["key_envs"] or _first_env(self.config["key_envs"]) is not None
+
+    def token_param(self, model):
+        return "max_tokens"
+
+    def request_options(self, model, blocking=True):
+        """Request options for `model`; `blocking=False` (the asyncio path) reads only the in-memory capabilities."""
+        if not self.capabilities:
+            learned = {}
+        else:
+            learned = self.capabilities.get(model) if blocking else self.capabilities.cached(model)
+        return {
+            TOKEN_PARAM: learned.get(TOKEN_PARAM) or self.token_param(model),
+            SUPPORTS_TEMPERATURE: learned.get(SUPPORTS_TEMPERATURE, True),
+            SUPPORTS_SYSTEM_ROLE: learned.get(SUPPORTS_SYSTEM_ROLE, True),
+            SUPPORTS_STREAMING: learned.get(SUPPORTS_STREAMING, True),
+        }
+
+    @staticmethod
+    def adapt(options, error_text):
+        """Adjust `options` for the parameter a 400 body complains about.
+
+        Returns the (capability, value) pair that changed, or None when the
+        error is not one we know how to work around.
+        """
+        text = error_text.lower()
+        token_param = options[TOKEN_PARAM]
+        if token_param == "max_tokens" and "max_tokens" in text:
+            options[TOKEN_PARAM] = "max_completion_tokens"
+        elif token_param == "max_completion_tokens" and "max_completion_tokens" in text:
+            options[TOKEN_PARAM] = "max_tokens"
+        elif options[SUPPORTS_TEMPERATURE] and "temperature" in text:
+            options[SUPPORTS_TEMPERATURE] = False
+            return SUPPORTS_TEMPERATURE, False
+        elif options[SUPPORTS_SYSTEM_ROLE] and "system" in text and "role" in text:
+            options[SUPPORTS_SYSTEM_ROLE] = False
+            return SUPPORTS_SYSTEM_ROLE, False
+        else:
+            return None
+        return TOKEN_PARAM, options[TOKEN_PARAM]
+
+    def payload(self, model, messages, temperature, max_tokens, options, stream=False):
+        if not options[SUPPORTS_SYSTEM_ROLE]:
+            messages = fold_system_prompt(messages)
+        payload = {"model": model, "messages": messages}
+        if options[SUPPORTS_TEMPERATURE]:
+            payload["temperature"] = temperature
+        if options[TOKEN_PARAM]:
+            payload[options[TOKEN_PARAM]] = max_tokens
+        if stream:
+            payload["stream"] = True
+        return payload
+
+    def remember(self, model, learned, options, blocking=True):
+        if not self.capabilities:
+            return
+        if options[TOKEN_PARAM]:
+            # Record the accepted token parameter even when the first guess was right
+            learned = learned + [(TOKEN_PARAM, options[TOKEN_PARAM])]
+        for capability, value in learned:
+            self.capabilities.learn(model, capability, value, background=not blocking)
+
+    def _error(self, status, text):
+        return UpstreamError(f"{self.label} API error {status}: {text}", status)
+
+    @staticmethod
+    def _content(data):
+        return data["choices"][0]["message"]["content"]
+
+    @staticmethod
+    def _delta(chunk):
+        choices = chunk.get("choices") or [{}]
+        return (choices[0].get("delta") or {}).get("content")
+
+    def chat(self, model, messages, temperature=0.7, max_tokens=512):
+        client = get_client(self.base_url)
+        options = self.request_options(model)
+        learned = []
+        for _ in range(self.max_attempts):
+            r = client.post(self.url, headers=self.headers(), timeout=self.config["timeout"],
+                            json=self.payload(model, messages, temperature, max_tokens, options))
+            change = self.adapt(options, r.text) if r.status_code == 400 else None
+            if change is None:
+                break
+            learned.append(change)
+        if r.status_code >= 400:
+            raise self._error(r.status_code, r.text)
+        self.remember(model, learned, options)
+        return self._content(r.json())
+
+    async def achat(self, model, messages, temperature=0.7, max_tokens=512):
+        client = get_async_client(self.base_url)
+        options = self.request_options(model, blocking=False)
+        learned = []
+        for _ in range(self.max_attempts):
+            r = await client.post(self.url, headers=self.headers(), timeout=self.config["timeout"],
+                                  json=self.payload(model, messages, temperature, max_tokens, options))
+            change = self.adapt(options, r.text) if r.status_code == 400 else None
+            if change is None:
+                break
+            learned.append(change)
+        if r.status_code >= 400:
+            raise self._error(r.status_code, r.text)
+        self.remember(model, learned, options, blocking=False)
+        return self._content(r.json())
+
+    def stream(self, model, messages, temperature=0.7, max_tokens=512):
+        options = self.request_options(model)
+        if not options[SUPPORTS_STREAMING]:
+            yield self.chat(model, messages, temperature, max_tokens)
+            return
+        client = get_client(self.base_url)
+        learned = []
+        for _ in range(self.max_attempts):
+            payload = self.payload(model, messages, temperature, max_tokens, options, stream=True)
+            with client.stream("POST", self.url, headers=self.headers(), json=payload,
+                               timeout=self.config["timeout"]) as r:
+                if r.status_code >= 400:
+                    text = r.read().decode("utf-8", "replace")
+                    change = self.adapt(options, text) if r.status_code == 400 else None
+                    if change is not None:
+                        learned.append(change)
+                        continue
+                    if r.status_code == 400 and "stream" in text.lower():
+                        self.remember(model, learned + [(SUPPORTS_STREAMING, False)], options)
+                        yield self.chat(model, messages, temperature, max_tokens)
+                        return
+                    raise self._error(r.status_code, text)
+                self.remember(model, learned, options)
+                for chunk in iter_sse_json(r):
+                    delta = self._delta(chunk)
+                    if delta:
+                        yield delta
+                return
+        raise self._error(r.status_code, text)
+
+    async def astream(self, model, messages, temperature=0.7, max_tokens=512):
+        options = self.request_options(model, blocking=False)
+        if not options[SUPPORTS_STREAMING]:
+            yield await self.achat(model, messages, temperature, max_tokens)
+            return
+        client = get_async_client(self.base_url)
+        learned = []
+        for _ in range(self.max_attempts):
+            payload = self.payload(model, messages, temperature, max_tokens, options, stream=True)
+            async with client.stream("POST", self.url, headers=self.headers(), json=payload,
+                                     timeout=self.config["timeout"]) as r:
+                if r.status_code >= 400:
+                    text = (await r.aread()).decode("utf-8", "replace")
+                    change = self.adapt(options, text) if r.status_code == 400 else None
+                    if change is not None:
+                        learned.append(change)
+                        continue
+                    if r.status_code == 400 and "stream" in text.lower():
+                        self.remember(model, learned + [(SUPPORTS_STREAMING, False)], options, blocking=False)
+                        yield await self.achat(model, messages, temperature, max_tokens)
+                        return
+                    raise self._error(r.status_code, text)
+                self.remember(model, learned, options, blocking=False)
+                async for chunk in aiter_sse_json(r):
+                    delta = self._delta(chunk)
+                    if delta:
+                        yield delta
+                return
+        raise self._error(r.status_code, text)
+
+
+@register_adapter
+class PerplexityAdapter(ChatCompletionsAdapter):
+    name = "perplexity"
+    label = "Perplexity"
+    models = ("sonar-pro", "sonar", "sonar-reasoning", "sonar-deep-research")
+
+    def default_config(self):
+        config = super().default_config()
+        config.update(
+            api_base=os.getenv("PERPLEXITY_API_BASE", "https://api.perplexity.ai"),
+            key_envs=("PERPLEXITY_API_KEY",),
+            timeout=30,
+        )
+        return config
+
+    def token_param(self, model):
+        # Perplexity answers are not length-capped
+        return None
+
+    def request_options(self, model, blocking=True):
+        options = super().request_options(model, blocking)
+        # Sampling is left at Perplexity's defaults
+        options[SUPPORTS_TEMPERATURE] = False
+        return options
+
+
+@register_adapter
+class CopilotAdapter(ChatCompletionsAdapter):
+    """GitHub Models via Azure AI Inference."""
+    name = "copilot"
+    label = "Copilot"
+    primary = True
+    models = (
+        "gpt-5", "gpt-5-mini", "o4-mini", "o3-mini",
+        "Llama-3.1-8B-Instruct", "Llama-3.1-70B-Instruct",
+        "Mistral-large", "Phi-4-mini",
+    )
+
+    def default_config(self):
+        config = super().default_config()
+        config.update(
+            api_base=os.getenv("COPILOT_API_BASE", "https://models.inference.ai.azure.com"),
+            key_envs=("GITHUB_TOKEN", "COPILOT_TOKEN"),
+            auth_scheme=os.getenv("COPILOT_AUTH_SCHEME", "bearer").lower(),
+            token_param=os.getenv("COPILOT_TOKEN_PARAM"),
+        )
+        return config
+
+    def token_param(self, model):
+        if self.config.get("token_param"):
+            return self.config["token_param"]
+        sml = model.lower()
+        return "max_completion_tokens" if (sml.startswith("o3") or sml.startswith("o4")) else "max_tokens"
+
+
+@register_adapter
+class GeminiAdapter(ProviderAdapter):
+    name = "gemini"
+    models = ("gemini-2.5-flash", "gemini-2.5-pro")
+    prefixes = ("gemini-",)
+
+    def default_config(self):
+        return {
+            "api_base": os.getenv("GEMINI_API_BASE", "https://generativelanguage.googleapis.com/v1"),
+            "timeout": 30,
+        }
+
+    def configured(self):
+        return bool(os.getenv("GEMINI_API_KEY"))
+
+    def _url(self, model, method):
+        key = os.getenv("GEMINI_API_KEY")
+        suffix = "alt=sse&" if method == "streamGenerateContent" else ""
+        return f"{self.config['api_base'].rstrip('/')}/models/{model}:{method}?{suffix}key={key}"
+
+    @staticmethod
+    def payload(messages):
+        # Gemini takes user/model turns; the system prompt is not forwarded
+        contents = [
+            {"role": "model" if m["role"] == "assistant" else "user", "parts": [{"text": m["content"]}]}
+            for m in messages if m["role"] != "system"
+        ]
+        return {"contents": contents}
+
+    @staticmethod
+    def _check(response, text=None):
+        if response.status_code >= 400:
+            body = text if text is not None else response.text
+            raise UpstreamError(f"Gemini API error {response.status_code}: {body}", response.status_code)
+
+    @staticmethod
+    def _texts(chunk):
+        # Safety-blocked and usage-only chunks come with "candidates": [] or without content
+        candidate = (chunk.get("candidates") or [{}])[0]
+        for part in (candidate.get("content") or {}).get("parts") or []:
+            if part.get("text"):
+                yield part["text"]
+
+    @classmethod
+    def _reply(cls, data):
+        text = "".join(cls._texts(data))
+        if not text:
+            candidate = (data.get("candidates") or [{}])[0]
+            reason = (data.get("promptFeedback") or {}).get("blockReason") or candidate.get("finishReason")
+            # 502 like any other unusable upstream answer, so the request can fail over
+            raise UpstreamError(f"Gemini API returned no content (reason: {reason or 'unknown'})", 502)
+        return text
+
+    def chat(self, model, messages, temperature=0.7, max_tokens=512):
+        url = self._url(model, "generateContent")
+        response = get_client(url).post(url, json=self.payload(messages), timeout=self.config["timeout"])
+        self._check(response)
+        return self._reply(response.json())
+
+    async def achat(self, model, messages, temperature=0.7, max_tokens=512):
+        url = self._url(model, "generateContent")
+        response = await get_async_client(url).post(url, json=self.payload(messages), timeout=self.config["timeout"])
+        self._check(response)
+        return self._reply(response.json())
+
+    def stream(self, model, messages, temperature=0.7, max_tokens=512):
+        url = self._url(model, "streamGenerateContent")
+        with get_client(url).stream("POST", url, json=self.payload(messages), timeout=self.config["timeout"]) as response:
+            if response.status_code >= 400:
+                self._check(response, response.read().decode("utf-8", "replace"))
+            for chunk in iter_sse_json(response):
+                yield from self._texts(chunk)
+
+    async def astream(self, model, messages, temperature=0.7, max_tokens=512):
+        url = self._url(model, "streamGenerateContent")
+        async with get_async_client(url).stream("POST", url, json=self.payload(messages),
+                                                timeout=self.config["timeout"]) as response:
+            if response.status_code >= 400:
+                self._check(response, (await response.aread()).decode("utf-8", "replace"))
+            async for chunk in aiter_sse_json(response):
+                for text in self._texts(chunk):
+                    yield text
+
+
+_openai = None
+
+
+def openai_sdk():
+    """The openai module, imported and configured from OPENAI_API_KEY / OPENAI_API_BASE on first use."""
+    global _openai
+    if _openai is None:
+        import openai
+        if os.getenv("OPENAI_API_KEY"):
+            openai.api_key = os.getenv("OPENAI_API_KEY")
+        # api_base can be overridden for Azure OpenAI or proxies
+        if os.getenv("OPENAI_API_BASE"):
+            openai.api_base = os.getenv("OPENAI_API_BASE")
+        _openai = openai
+    return _openai
+
+
+@register_adapter
+class OpenAIAdapter(ProviderAdapter):
+    """OpenAI platform (or an Azure/proxy base) through the openai SDK."""
+    name = "openai"
+    primary = True
+    models = (
+        "gpt-4", "gpt-4o", "gpt-4-turbo", "gpt-4-32k", "gpt-4-vision-preview",
+        "gpt-3.5-turbo", "gpt-3.5-turbo-16k",
+    )
+
+    def configured(self):
+        return bool(os.getenv("OPENAI_API_KEY"))
+
+    def chat(self, model, messages, temperature=0.7, max_tokens=512):
+        response = openai_sdk().ChatCompletion.create(
+            model=model, messages=messages, max_tokens=max_tokens, temperature=temperature,
+        )
+        return response.choices[0].message.content
+
+    async def achat(self, model, messages, temperature=0.7, max_tokens=512):
+        response = await openai_sdk().ChatCompletion.acreate(
+            model=model, messages=messages, max_tokens=max_tokens, temperature=temperature,
+        )
+        return response.choices[0].message.content
+
+    def stream(self, model, messages, temperature=0.7, max_tokens=512):
+        response = openai_sdk().ChatCompletion.create(
+            model=model, messages=messages, max_tokens=max_tokens, temperature=temperature, stream=True,
+        )
+        for chunk in response:
+            delta = chunk["choices"][0].get("delta", {}).get("content")
+            if delta:
+                yield delta
+
+    async def astream(self, model, messages, temperature=0.7, max_tokens=512):
+        response = await openai_sdk().ChatCompletion.acreate(
+            model=model, messages=messages, max_tokens=max_tokens, temperature=temperature, stream=True,
+        )
+        async for chunk in response:
+            delta = chunk["choices"][0].get("delta", {}).get("content")
+            if delta:
+                yield delta
+
+
+class ProviderRouter:
+    def __init__(self, adapters, default=None):
+        self.adapters = {adapter.name: adapter for adapter in adapters}
+        self.default = default
+        self._table = {}
+        self._prefixes = []
+        for adapter in adapters:
+            for model in adapter.models:
+                self._table.setdefault(model, adapter)
+            for prefix in adapter.prefixes:
+                self._prefixes.append((prefix, adapter))
+
+    def serves(self, model):
+        """True when an adapter claims `model` explicitly (not via the default)."""
+        return self._match(model) is not None
+
+    def resolve(self, model):
+        return self._match(model) or self.default
+
+    def _match(self, model):
+        adapter = self._table.get(model)
+        if adapter is None:
+            for prefix, candidate in self._prefixes:
+                if model.startswith(prefix):
+                    return candidate
+        return adapter
+
+    def models_for(self, name):
+        return [model for model, adapter in self._table.items() if adapter.name == name]
+
+
+def build_router(provider="openai", configs=None, capabilities=None):
+    """Instantiate the registered adapters for this deployment.
+
+    `provider` picks the primary adapter (LLM_PROVIDER); `configs` maps an
+    adapter name to overrides for its default configuration, and
+    `capabilities` is the shared CapabilityStore adapters learn quirks into.
+    """
+    configs = configs or {}
+    adapters = []
+    primary = None
+    for name, cls in ADAPTERS.items():
+        if cls.primary and name != provider:
+            continue
+        adapter = cls(configs.get(name), capabilities)
+        adapters.append(adapter)
+        if name == provider:
+            primary = adapter
+    if primary is None:
+        primary = OpenAIAdapter(configs.get("openai"), capabilities)
+        adapters.append(primary)
+    return ProviderRouter(adapters, default=primary)
@@ -0,0 +1,290 @@
+"""
+Per-user / per-IP token-bucket rate limits and a weighted fair queue for /chat.
+
+Rate limits: every request takes one token from the caller's IP bucket and
+from their user bucket (a per-model bucket when the model has its own rule).
+Buckets live in a small SQLite table (in the app database unless
+RATE_LIMIT_DB says otherwise) so all gunicorn workers on the host share
+them; each check is a single atomic UPSERT ... RETURNING. If that database
+cannot be used, the buckets fall back to per-process memory.
+
+Fair queue: at most `concurrency` requests per worker are dispatched
+upstream at once. When that is exceeded, waiting requests are served in
+start-time fair order: each user's requests are tagged with a virtual time
+that advances by 1/weight per request, so one user's burst queues behind
+itself instead of in front of everyone else.
+"""
+import os
+import time
+import heapq
+import logging
+import sqlite3
+import itertools
+import threading
+from contextlib import contextmanager, asynccontextmanager
+
+from backend.database import get_db, resolve_db_path
+
+logger = logging.getLogger(__name__)
+
+
+class QueueFull(RuntimeError):
+    """The fair queue is at its waiting limit, or a request waited too long for a slot."""
+
+    retry_after = 1
+
+
+def parse_rule(spec):
+    """Parse "requests/seconds" (e.g. "20/60") into (capacity, refill per second), or None."""
+    try:
+        count, _, seconds = (spec or "").partition("/")
+        count, seconds = float(count), float(seconds or 60)
+    except ValueError:
+        return None
+    if count <= 0 or seconds <= 0:
+        return None
+    return count, count / seconds
+
+
+def parse_model_rules(spec):
+    """Parse "model=20/60,model2=5/60" into {model: (capacity, rate)}."""
+    rules = {}
+    for item in (spec or "").split(","):
+        name, _, rule = item.partition("=")
+        parsed = parse_rule(rule)
+        if name.strip() and parsed:
+            rules[name.strip()] = parsed
+    return rules
+
+
+class SQLiteBuckets:
+    """Token buckets shared by every process using the same database file."""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.db = get_db(db_path)
+        # Set up on the first check, not at import; per-process buckets if the database is unusable
+        self._ready = False
+        self._fallback = None
+        self._setup_lock = threading.Lock()
+
+    def _setup(self):
+        with self._setup_lock:
+            if self._ready:
+                return
+            try:
+                with self.db.transaction() as conn:
+                    conn.execute(
+                        """
+                        CREATE TABLE IF NOT EXISTS rate_buckets (
+                            key TEXT PRIMARY KEY,
+                            tokens REAL NOT NULL,
+                            updated_at REAL NOT NULL
+                        )
+                        """
+                    )
+            except sqlite3.Error as e:
+                logger.warning("rate limit database unavailable; using per-process buckets",
+                               extra={"fields": {"db_path": self.db_path, "error": str(e)}})
+                self._fallback = MemoryBuckets()
+            self._ready = True
+
+    def take(self, key, capacity, rate, cost=1.0):
+        """Take `cost` tokens; returns 0 if granted, else seconds until they would be available."""
+        if not self._ready:
+            self._setup()
+        if self._fallback is not None:
+            return self._fallback.take(key, capacity, rate, cost)
+        now = time.time()
+        with self.db.transaction() as conn:
+            row = conn.execute(
+                """
+                INSERT INTO rate_buckets (key, tokens, updated_at) VALUES (?1, ?2 - ?4, ?5)
+                ON CONFLICT (key) DO UPDATE SET
+                    tokens = MIN(?2, tokens + (?5 - updated_at) * ?3) - ?4,
+                    updated_at = ?5
+                WHERE MIN(?2, tokens + (?5 - updated_at) * ?3) >= ?4
+                RETURNING tokens
+                """,
+                (key, capacity, rate, cost, now),
+            ).fetchone()
+            if row is not None:
+                return 0
+            available = conn.execute(
+                "SELECT MIN(?, tokens + (? - updated_at) * ?) FROM rate_buckets WHERE key = ?",
+                (capacity, now, rate, key),
+            ).fetchone()[0]
+        return max(1, int((cost - available) / rate) + 1)
+
+
+class MemoryBuckets:
+    """Per-process token buckets (when no shared store is configured)."""
+
+    def __init__(self):
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def take(self, key, capacity, rate, cost=1.0):
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated) * rate)
+            if tokens >= cost:
+                self._buckets[key] = (tokens - cost, now)
+                return 0
+            self._buckets[key] = (tokens, now)
+        return max(1, int((cost - tokens) / rate) + 1)
+
+
+class RateLimiter:
+    def __init__(self, buckets, user_rule=None, ip_rule=None, model_rules=None):
+        self.buckets = buckets
+        self.user_rule = user_rule
+        self.ip_rule = ip_rule
+        self.model_rules = model_rules or {}
+
+    def check(self, user_id, ip, model=None):
+        """Charge one request; returns 0 if allowed, else the Retry-After in seconds."""
+        if self.ip_rule and ip:
+            wait = self.buckets.take(f"ip:{ip}", *self.ip_rule)
+            if wait:
+                return wait
+        rule = self.model_rules.get(model)
+        if rule and user_id is not None:
+            return self.buckets.take(f"user:{user_id}:{model}", *rule)
+        if self.user_rule and user_id is not None:
+            return self.buckets.take(f"user:{user_id}", *self.user_rule)
+        return 0
+
+
+class _Waiter:
+    __slots__ = ("wake", "granted", "cancelled")
+
+    def __init__(self, wake):
+        self.wake = wake
+        self.granted = False
+        self.cancelled = False
+
+
+class FairQueue:
+    """Bounded concurrency with start-time fair queuing across users (threads and asyncio)."""
+
+    def __init__(self, concurrency=32, max_waiting=256, timeout=30.0):
+        self.concurrency = concurrency
+        self.max_waiting = max_waiting
+        self.timeout = timeout
+        self.active = 0
+        self._heap = []
+        self._finish = {}
+        self._vtime = 0.0
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+
+    def _try_enter(self, user, weight, wake):
+        """Take a slot now (returns None) or enqueue a waiter and return it."""
+        with self._lock:
+            if self.active < self.concurrency and not self._heap:
+                self.active += 1
+                return None
+            if len(self._heap) >= self.max_waiting:
+                raise QueueFull("Too many requests are waiting; try again shortly.")
+            start = max(self._vtime, self._finish.get(user, 0.0))
+            self._finish[user] = start + 1.0 / max(weight, 0.01)
+            waiter = _Waiter(wake)
+            heapq.heappush(self._heap, (start, next(self._seq), waiter))
+            return waiter
+
+    def _abandon(self, waiter):
+        """Give up waiting; returns True if a slot was handed over meanwhile (caller must release)."""
+        with self._lock:
+            if waiter.granted:
+                return True
+            waiter.cancelled = True
+            return False
+
+    def release(self):
+        with self._lock:
+            while self._heap:
+                start, _, waiter = heapq.heappop(self._heap)
+                if waiter.cancelled:
+                    continue
+                # Hand the slot straight to the next waiter in virtual-time order
+                self._vtime = start
+                waiter.granted = True
+                waiter.wake()
+                return
+            self.active -= 1
+            if not self.active:
+                # Idle: forget per-user history so it cannot grow without bound
+                self._finish.clear()
+                self._vtime = 0.0
+
+    @contextmanager
+    def slot(self, user, weight=1.0):
+        event = threading.Event()
+        waiter = self._try_enter(user, weight, event.set)
+        if waiter is not None and not event.wait(self.timeout):
+            if not self._abandon(waiter):
+                raise QueueFull("Timed out waiting for a free slot; try again shortly.")
+        try:
+            yield
+        finally:
+            self.release()
+
+    @asynccontextmanager
+    async def aslot(self, user, weight=1.0):
+        import asyncio  # only the ASGI app needs it; kept off the WSGI cold start
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        def wake():
+            loop.call_soon_threadsafe(lambda: future.done() or future.set_result(None))
+
+        waiter = self._try_enter(user, weight, wake)
+        if waiter is not None:
+            try:
+                await asyncio.wait_for(asyncio.shield(future), self.timeout)
+            except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+                if self._abandon(waiter):
+                    self.release()
+                if isinstance(e, asyncio.TimeoutError):
+                    raise QueueFull("Timed out waiting for a free slot; try again shortly.")
+                raise
+        try:
+            yield
+        finally:
+            self.release()
+
+    def snapshot(self):
+        with self._lock:
+            return {"active": self.active, "waiting": sum(1 for *_, w in self._heap if not w.cancelled),
+                    "concurrency": self.concurrency}
+
+
+def _disabled(name):
+    return os.getenv(name, "1").strip().lower() in ("0", "false", "no", "off")
+
+
+def rate_limiter_from_env():
+    if _disabled("RATE_LIMIT"):
+        return None
+    # Unset: the shared app database; empty: per-process buckets
+    db_path = os.getenv("RATE_LIMIT_DB")
+    if db_path is None:
+        db_path = resolve_db_path()
+    return RateLimiter(
+        SQLiteBuckets(db_path) if db_path else MemoryBuckets(),
+        user_rule=parse_rule(os.getenv("RATE_LIMIT_USER", "60/60")),
+        ip_rule=parse_rule(os.getenv("RATE_LIMIT_IP", "300/60")),
+        model_rules=parse_model_rules(os.getenv("RATE_LIMIT_MODELS")),
+    )
+
+
+def fair_queue_from_env():
+    if _disabled("CHAT_QUEUE"):
+        return None
+    return FairQueue(
+        concurrency=int(os.getenv("CHAT_QUEUE_CONCURRENCY", "32")),
+        max_waiting=int(os.getenv("CHAT_QUEUE_MAX_WAITING", "256")),
+        timeout=float(os.getenv("CHAT_QUEUE_TIMEOUT", "30")),
+    )
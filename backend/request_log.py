@@ -0,0 +1,181 @@
+"""
+Structured, non-blocking request logging.
+
+Request threads (and the ASGI event loop) only put log records on a bounded
+in-memory queue; a background thread formats them as one JSON object per
+line and writes them to stderr or LOG_FILE. If the queue is full, records
+are dropped and counted instead of blocking the request, and the next
+written record carries the `dropped` count.
+
+- LOG_LEVEL / LOG_FILE come from backend.config (empty LOG_FILE = stderr);
+  the file is rotated at LOG_FILE_MAX_BYTES.
+- LOG_SAMPLE_RATE keeps that fraction of routine per-request records;
+  warnings, errors and 5xx responses are always kept.
+- String fields are cut at LOG_MAX_FIELD_CHARS.
+- Module loggers under `backend.` (`logging.getLogger(__name__)`) go through
+  the same queue, so their warnings are JSON records too.
+
+`RequestLog` collects one request's fields and phase timings (prepare,
+cache, queue, upstream, store) and emits them as a single record when the
+request ends.
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import queue
+import random
+import atexit
+import logging
+import logging.handlers
+
+from backend import config
+
+logger = logging.getLogger("jarvis")
+# Loggers routed through the queue: the app's own, and backend.* module loggers
+_ROUTED = ("jarvis", "backend")
+
+
+class RequestLog:
+    """Fields and per-phase timings (ms) for one request, emitted as one record."""
+
+    def __init__(self, route, method, request_id=None):
+        self.request_id = request_id or uuid.uuid4().hex[:16]
+        self.fields = {"route": route, "method": method}
+        self.timings = {}
+        self.started = self._last = time.perf_counter()
+
+    def set(self, **fields):
+        self.fields.update(fields)
+
+    def mark(self, phase):
+        """Charge the time since the previous mark to `phase`."""
+        now = time.perf_counter()
+        self.timings[phase] = self.timings.get(phase, 0.0) + round((now - self._last) * 1000, 1)
+        self._last = now
+
+    def emit(self, status):
+        level = logging.ERROR if status >= 500 else logging.INFO
+        if not logger.isEnabledFor(level):
+            return
+        self.timings["total"] = round((time.perf_counter() - self.started) * 1000, 1)
+        logger.log(level, "request", extra={"fields": {
+            "request_id": self.request_id, **self.fields, "status": status, "ms": self.timings,
+        }})
+
+
+class JsonFormatter(logging.Formatter):
+    def __init__(self, max_field_chars=1000, handler=None):
+        super().__init__()
+        self.max_field_chars = max_field_chars
+        self.handler = handler
+
+    def _cap(self, value):
+        if isinstance(value, str) and len(value) > self.max_field_chars:
+            return value[:self.max_field_chars] + "...[truncated]"
+        return value
+
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname.lower(),
+            "logger": record.name,
+            "msg": self._cap(record.getMessage()),
+        }
+        for key, value in getattr(record, "fields", {}).items():
+            entry[key] = self._cap(value)
+        if record.exc_info:
+            # Keep the end of a long traceback: the innermost frames and the error itself
+            exc = self.formatException(record.exc_info)
+            entry["exc"] = exc if len(exc) <= self.max_field_chars else "..." + exc[-self.max_field_chars:]
+        dropped = self.handler.take_dropped() if self.handler else 0
+        if dropped:
+            entry["dropped"] = dropped
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class SampledQueueHandler(logging.handlers.QueueHandler):
+    """Enqueue without blocking or formatting; sample routine records and drop when full."""
+
+    def __init__(self, q, sample_rate=1.0):
+        super().__init__(q)
+        self.sample_rate = sample_rate
+        self.dropped = 0
+
+    def filter(self, record):
+        if record.levelno < logging.WARNING and self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            return False
+        return super().filter(record)
+
+    def prepare(self, record):
+        # Formatting happens on the listener thread; the record never leaves this process
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def take_dropped(self):
+        dropped, self.dropped = self.dropped, 0
+        return dropped
+
+
+_listener = None
+
+
+def _output_handler(log_file):
+    if log_file and log_file != "-":
+        try:
+            return logging.handlers.RotatingFileHandler(
+                log_file,
+                maxBytes=int(os.getenv("LOG_FILE_MAX_BYTES", str(10 * 1024 * 1024))),
+                backupCount=int(os.getenv("LOG_FILE_BACKUPS", "3")),
+                encoding="utf-8",
+            )
+        except OSError as e:
+            print(f"Cannot open LOG_FILE {log_file!r} ({e}); logging to stderr", file=sys.stderr)
+    return logging.StreamHandler(sys.stderr)
+
+
+def setup_logging():
+    """Route the "jarvis" and "backend.*" loggers through the background queue (idempotent)."""
+    global _listener
+    if _listener is not None:
+        return logger
+    q = queue.Queue(maxsize=int(os.getenv("LOG_QUEUE_SIZE", "10000")))
+    handler = SampledQueueHandler(q, sample_rate=float(os.getenv("LOG_SAMPLE_RATE", "1")))
+    output = _output_handler(config.LOG_FILE)
+    output.setFormatter(JsonFormatter(int(os.getenv("LOG_MAX_FIELD_CHARS", "1000")), handler))
+    level = getattr(logging, str(config.LOG_LEVEL).upper(), logging.INFO)
+    for name in _ROUTED:
+        routed = logging.getLogger(name)
+        routed.handlers = [handler]
+        routed.setLevel(level)
+        routed.propagate = False
+    _listener = logging.handlers.QueueListener(q, output, respect_handler_level=False)
+    _listener.start()
+    return logger
+
+
+def shutdown_logging():
+    """Flush queued records and stop the writer thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def _restart_after_fork():
+    # The writer thread does not survive fork; give the child its own queue and thread
+    global _listener
+    if _listener is not None:
+        _listener = None
+        setup_logging()
+
+
+atexit.register(shutdown_logging)
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_restart_after_fork)
@@ -0,0 +1,237 @@
+"""
+Per-provider circuit breaker and adaptive (AIMD) concurrency limiter.
+
+When an upstream degrades, requests would otherwise each wait out the full
+HTTP timeout and pile up workers. Every call to a provider goes through its
+`ProviderGuard`:
+
+- The circuit breaker watches a rolling window of outcomes. Once enough of
+  them fail (429/5xx, timeouts, connection errors) or run slower than the
+  slow-call threshold, it opens and calls fail fast with `ProviderUnavailable`
+  (a retryable 503, so the dispatcher can fail over). After a cool-down it
+  lets a single probe through (half-open) and closes again when that succeeds.
+- The limiter caps in-flight calls per provider. The cap grows by about one
+  per round of fast successes and is cut multiplicatively on a failure or a
+  slow call (additive increase, multiplicative decrease).
+
+State is per process; `snapshot()` feeds the admin upstreams view.
+"""
+import os
+import time
+import threading
+from collections import deque
+
+from backend.providers import UpstreamError, is_retryable
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class ProviderUnavailable(UpstreamError):
+    """Rejected locally: the provider's breaker is open or its concurrency limit is reached."""
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message, status=503)
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    def __init__(self, window=20, min_calls=10, failure_rate=0.5, open_seconds=30.0):
+        self.window = window
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.open_seconds = open_seconds
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self._outcomes = deque(maxlen=window)
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """Return True if a call may go out now."""
+        with self._lock:
+            if self.state == OPEN:
+                if time.monotonic() - self.opened_at < self.open_seconds:
+                    return False
+                self.state = HALF_OPEN
+                self._probing = False
+            if self.state == HALF_OPEN:
+                # One probe at a time decides whether the upstream has recovered
+                if self._probing:
+                    return False
+                self._probing = True
+            return True
+
+    def accepting(self):
+        """True if allow() would let a call through now; unlike allow(), changes nothing."""
+        with self._lock:
+            if self.state == OPEN:
+                return time.monotonic() - self.opened_at >= self.open_seconds
+            return not (self.state == HALF_OPEN and self._probing)
+
+    def retry_after(self):
+        with self._lock:
+            if self.state != OPEN:
+                return 1
+            return max(1, int(self.open_seconds - (time.monotonic() - self.opened_at)) + 1)
+
+    def record(self, failed):
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._probing = False
+                if failed:
+                    self._trip()
+                else:
+                    self.state = CLOSED
+                    self._outcomes.clear()
+                return
+            self._outcomes.append(bool(failed))
+            if len(self._outcomes) >= self.min_calls:
+                rate = sum(self._outcomes) / len(self._outcomes)
+                if rate >= self.failure_rate:
+                    self._trip()
+
+    def release_probe(self):
+        """Give the half-open probe slot back without an outcome (e.g. a 400 from the caller's input)."""
+        with self._lock:
+            self._probing = False
+
+    def _trip(self):
+        self.state = OPEN
+        self.opened_at = time.monotonic()
+        self._outcomes.clear()
+
+    def snapshot(self):
+        with self._lock:
+            outcomes = list(self._outcomes)
+            return {
+                "state": self.state,
+                "failure_rate": round(sum(outcomes) / len(outcomes), 3) if outcomes else 0.0,
+                "calls_in_window": len(outcomes),
+                "open_for": round(max(0.0, self.open_seconds - (time.monotonic() - self.opened_at)), 1)
+                if self.state == OPEN else 0.0,
+            }
+
+
+class AIMDLimiter:
+    def __init__(self, initial=50, min_limit=1, max_limit=200, backoff=0.5, backoff_interval=1.0):
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.backoff = backoff
+        # A burst of failures from one incident should shrink the limit once, not collapse it
+        self.backoff_interval = backoff_interval
+        self.in_flight = 0
+        self._last_backoff = 0.0
+        self._lock = threading.Lock()
+
+    def try_acquire(self):
+        with self._lock:
+            if self.in_flight >= int(self.limit):
+                return False
+            self.in_flight += 1
+            return True
+
+    def release(self, congested=None):
+        """Free a slot; `congested` True shrinks the limit, False grows it, None leaves it."""
+        with self._lock:
+            self.in_flight = max(0, self.in_flight - 1)
+            if congested:
+                now = time.monotonic()
+                if now - self._last_backoff >= self.backoff_interval:
+                    self._last_backoff = now
+                    self.limit = max(self.min_limit, self.limit * self.backoff)
+            elif congested is False:
+                self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+
+    def snapshot(self):
+        with self._lock:
+            return {"limit": int(self.limit), "in_flight": self.in_flight}
+
+
+class ProviderGuard:
+    def __init__(self, name, breaker, limiter, slow_call_seconds=20.0):
+        self.name = name
+        self.breaker = breaker
+        self.limiter = limiter
+        self.slow_call_seconds = slow_call_seconds
+        self.rejected = 0
+
+    def admit(self):
+        """Take a concurrency slot or raise ProviderUnavailable."""
+        if not self.breaker.allow():
+            self.rejected += 1
+            raise ProviderUnavailable(
+                f"{self.name} circuit open; failing fast", retry_after=self.breaker.retry_after()
+            )
+        if not self.limiter.try_acquire():
+            # The breaker let this call through; don't leave a half-open probe hanging
+            self.breaker.release_probe()
+            self.rejected += 1
+            raise ProviderUnavailable(f"{self.name} concurrency limit reached", retry_after=1)
+
+    def release(self, elapsed, error=None):
+        """Record a finished call: `elapsed` seconds (time to first token for streams) and its error."""
+        if error is not None and not is_retryable(error):
+            # The upstream is healthy; the request itself was bad
+            self.abandon()
+            return
+        failed = error is not None or elapsed > self.slow_call_seconds
+        self.breaker.record(failed)
+        self.limiter.release(failed)
+
+    def abandon(self):
+        """Free the slot without a verdict (cancelled hedge, client went away, bad request)."""
+        self.breaker.release_probe()
+        self.limiter.release(None)
+
+    def snapshot(self):
+        return {"breaker": self.breaker.snapshot(), "limiter": self.limiter.snapshot(), "rejected": self.rejected}
+
+
+class Guards:
+    """One ProviderGuard per provider name, created on first use."""
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._guards = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, name):
+        guard = self._guards.get(name)
+        if guard is None:
+            with self._lock:
+                guard = self._guards.get(name)
+                if guard is None:
+                    guard = self._guards[name] = self._factory(name)
+        return guard
+
+    def snapshot(self):
+        return {name: guard.snapshot() for name, guard in sorted(self._guards.items())}
+
+
+def guards_from_env():
+    """Build the per-provider guards from BREAKER_* / LIMITER_* settings, or None when disabled."""
+    if os.getenv("CIRCUIT_BREAKER", "1").strip().lower() in ("0", "false", "no", "off"):
+        return None
+
+    def factory(name):
+        return ProviderGuard(
+            name,
+            CircuitBreaker(
+                window=int(os.getenv("BREAKER_WINDOW", "20")),
+                min_calls=int(os.getenv("BREAKER_MIN_CALLS", "10")),
+                failure_rate=float(os.getenv("BREAKER_FAILURE_RATE", "0.5")),
+                open_seconds=float(os.getenv("BREAKER_OPEN_SECONDS", "30")),
+            ),
+            AIMDLimiter(
+                initial=int(os.getenv("LIMITER_INITIAL", "50")),
+                min_limit=int(os.getenv("LIMITER_MIN", "1")),
+                max_limit=int(os.getenv("LIMITER_MAX", "200")),
+                backoff=float(os.getenv("LIMITER_BACKOFF", "0.5")),
+            ),
+            slow_call_seconds=float(os.getenv("BREAKER_SLOW_CALL_SECONDS", "20")),
+        )
+
+    return Guards(factory)
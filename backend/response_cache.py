@@ -0,0 +1,173 @@
+"""
+Exact-match response cache for /chat.
+
+Entries are keyed on (provider, model, normalized message, system prompt,
+temperature, max tokens). A bounded in-memory LRU tier sits in front of an
+optional SQLite tier that every gunicorn worker on the host can share. TTLs
+can be set per model; a TTL of 0 disables caching for that model.
+"""
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+import unicodedata
+from collections import OrderedDict
+
+from backend.database import get_db
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_message(message):
+    text = unicodedata.normalize("NFKC", str(message or ""))
+    return " ".join(text.split())
+
+
+def parse_model_ttls(spec):
+    """Parse "model=seconds,model2=seconds" into a dict."""
+    ttls = {}
+    for item in (spec or "").split(","):
+        if "=" not in item:
+            continue
+        name, _, seconds = item.partition("=")
+        try:
+            ttls[name.strip()] = float(seconds)
+        except ValueError:
+            continue
+    return ttls
+
+
+class ResponseCache:
+    def __init__(self, max_entries=1024, default_ttl=3600.0, model_ttls=None, db_path=None):
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self.model_ttls = model_ttls or {}
+        self.db_path = db_path
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # The SQLite tier's table is created on first use, not at import
+        self._db_ready = False
+
+    @staticmethod
+    def make_key(provider, model, message, system_prompt, temperature, max_tokens, history=None):
+        parts = [provider, model, normalize_message(message), system_prompt or "", temperature, max_tokens]
+        if history:
+            # Prior turns change the answer; keys without history stay as they were
+            parts.append([[m["role"], m["content"]] for m in history])
+        raw = json.dumps(parts, ensure_ascii=False)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def ttl_for(self, model):
+        return self.model_ttls.get(model, self.default_ttl)
+
+    # --- SQLite tier ---
+    def _db(self):
+        return get_db(self.db_path)
+
+    def _init_db(self):
+        """Create the table once; drop to the in-memory tier alone if the database is unusable."""
+        if self._db_ready:
+            return self.db_path is not None
+        try:
+            self._create_table()
+        except sqlite3.Error as e:
+            logger.warning("response cache database unavailable; caching in memory only",
+                           extra={"fields": {"db_path": self.db_path, "error": str(e)}})
+            self.db_path = None
+        self._db_ready = True
+        return self.db_path is not None
+
+    def _create_table(self):
+        with self._db().transaction() as conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS response_cache (
+                    key TEXT PRIMARY KEY,
+                    response TEXT NOT NULL,
+                    expires_at REAL NOT NULL
+                )
+                """
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_response_cache_expires ON response_cache(expires_at)")
+
+    def _db_get(self, key, now):
+        if not self._init_db():
+            return None
+        try:
+            row = self._db().query_one("SELECT response, expires_at FROM response_cache WHERE key = ?", (key,))
+        except sqlite3.Error as e:
+            logger.warning("response cache read failed", extra={"fields": {"error": str(e)}})
+            return None
+        if row and row[1] > now:
+            return row
+        return None
+
+    def _db_set(self, key, value, expires_at):
+        if not self._init_db():
+            return
+        try:
+            # A failed write rolls back, so this thread's shared connection is not left mid-transaction
+            with self._db().transaction() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO response_cache (key, response, expires_at) VALUES (?, ?, ?)",
+                    (key, value, expires_at),
+                )
+                # Opportunistic pruning keeps the shared table from growing forever
+                conn.execute("DELETE FROM response_cache WHERE expires_at <= ?", (time.time(),))
+        except sqlite3.Error as e:
+            logger.warning("response cache write failed", extra={"fields": {"error": str(e)}})
+
+    # --- Public API ---
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._entries.move_to_end(key)
+                    return entry[1]
+                del self._entries[key]
+        if self.db_path:
+            row = self._db_get(key, now)
+            if row:
+                self._remember(key, row[0], row[1])
+                return row[0]
+        return None
+
+    def set(self, key, model, value):
+        ttl = self.ttl_for(model)
+        if ttl <= 0 or not value:
+            return
+        expires_at = time.time() + ttl
+        self._remember(key, value, expires_at)
+        if self.db_path:
+            self._db_set(key, value, expires_at)
+
+    def _remember(self, key, value, expires_at):
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        if self.db_path and self._init_db():
+            with self._db().transaction() as conn:
+                conn.execute("DELETE FROM response_cache")
+
+
+def cache_from_env():
+    """Build the process cache from CHAT_CACHE* settings, or None when disabled."""
+    if os.getenv("CHAT_CACHE", "1").strip().lower() in ("0", "false", "no", "off"):
+        return None
+    return ResponseCache(
+        max_entries=int(os.getenv("CHAT_CACHE_SIZE", "1024")),
+        default_ttl=float(os.getenv("CHAT_CACHE_TTL", "3600")),
+        model_ttls=parse_model_ttls(os.getenv("CHAT_CACHE_MODEL_TTLS")),
+        db_path=os.getenv("CHAT_CACHE_DB") or None,
+    )
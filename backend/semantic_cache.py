@@ -0,0 +1,188 @@
+"""
+Semantic (near-duplicate) prompt cache for /chat.
+
+Prompts are embedded on the CPU with hashed character n-grams and kept in a
+fixed-capacity NumPy index. A lookup is one matrix-vector product over the
+whole index; when the best match for the same model clears the similarity
+threshold, the exact-match cache key it was stored under is returned and the
+caller serves that cached response.
+
+With a `path`, the index lives in a memory-mapped file so every worker on
+the host searches the same vectors without copying them. The vectors are one
+contiguous float32 block, with the per-slot metadata (model, key, stamp)
+stored after it, so the matmul reads the mapping in place.
+"""
+import os
+import zlib
+import time
+import threading
+import unicodedata
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to in-process locking only
+    fcntl = None
+
+_MAGIC = 0x4A53454D  # "JSEM"
+# Bumped when the file layout changes; files in an older layout are recreated
+_LAYOUT = 2
+_HEADER = np.dtype([("magic", "<u4"), ("dim", "<u4"), ("capacity", "<u4"), ("layout", "<u4")])
+_META = np.dtype([("model", "<u4"), ("key", "S32"), ("stamp", "<f8")])
+
+
+def _stable_hash(text):
+    # Python's hash() is salted per process; workers sharing an index need a stable one
+    return zlib.crc32(text.encode("utf-8"))
+
+
+def _ngrams(text, n):
+    padded = f" {text} "
+    return [padded[i:i + n] for i in range(max(len(padded) - n + 1, 1))]
+
+
+def embed(texts, dim=512, n=3):
+    """Embed `texts` as L2-normalized hashed n-gram count vectors, shape (len(texts), dim)."""
+    out = np.zeros((len(texts), dim), dtype=np.float32)
+    for row, text in enumerate(texts):
+        norm = " ".join(unicodedata.normalize("NFKC", str(text)).casefold().split())
+        grams = _ngrams(norm, n) + norm.split()
+        idx = np.fromiter((_stable_hash(g) % dim for g in grams), dtype=np.int64, count=len(grams))
+        out[row] = np.bincount(idx, minlength=dim)
+    lengths = np.linalg.norm(out, axis=1, keepdims=True)
+    np.divide(out, lengths, out=out, where=lengths > 0)
+    return out
+
+
+class SemanticCache:
+    def __init__(self, dim=512, capacity=4096, threshold=0.9, path=None):
+        self.dim = dim
+        self.capacity = capacity
+        self.threshold = threshold
+        self.path = path
+        self._lock = threading.Lock()
+        if path:
+            self._vecs, self._meta = self._open_mmap(path)
+        else:
+            self._vecs = np.zeros((capacity, dim), dtype=np.float32)
+            self._meta = np.zeros(capacity, dtype=_META)
+
+    def _open_mmap(self, path):
+        vec_bytes = self.capacity * self.dim * 4
+        size = _HEADER.itemsize + vec_bytes + self.capacity * _META.itemsize
+        # Check and (re)create under the file lock so concurrent workers agree on one layout
+        with self._file_lock(path):
+            fresh = not os.path.exists(path) or os.path.getsize(path) != size
+            if not fresh:
+                header = np.memmap(path, dtype=_HEADER, mode="r", shape=(1,))[0]
+                fresh = ((int(header["magic"]), int(header["dim"]), int(header["capacity"]), int(header["layout"]))
+                         != (_MAGIC, self.dim, self.capacity, _LAYOUT))
+                del header
+            if fresh:
+                with open(path, "wb") as f:
+                    f.truncate(size)
+                header = np.memmap(path, dtype=_HEADER, mode="r+", shape=(1,))
+                header[0] = (_MAGIC, self.dim, self.capacity, _LAYOUT)
+                header.flush()
+                del header
+        vecs = np.memmap(path, dtype=np.float32, mode="r+", offset=_HEADER.itemsize, shape=(self.capacity, self.dim))
+        meta = np.memmap(path, dtype=_META, mode="r+", offset=_HEADER.itemsize + vec_bytes, shape=(self.capacity,))
+        return vecs, meta
+
+    def _file_lock(self, path=None):
+        return _FileLock((path or self.path) + ".lock") if (path or self.path) and fcntl else _NullLock()
+
+    @staticmethod
+    def model_id(model):
+        # 0 marks an empty slot, so never hand it out as a model id
+        return _stable_hash(model) or 1
+
+    def search(self, queries, model, k=1):
+        """Vectorized top-k cosine search for a batch of query vectors.
+
+        Returns (indices, scores), each of shape (len(queries), k); slots that
+        belong to another model or are empty score -1.
+        """
+        queries = np.atleast_2d(queries).astype(np.float32, copy=False)
+        scores = queries @ self._vecs.T
+        meta = self._meta
+        valid = (meta["model"] == self.model_id(model)) & (meta["stamp"] > 0)
+        scores[:, ~valid] = -1.0
+        k = min(k, self.capacity)
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1)
+        return np.take_along_axis(top, order, axis=1), np.take_along_axis(top_scores, order, axis=1)
+
+    def lookup(self, message, model):
+        """Return the exact-cache key of the closest prompt above threshold, or None."""
+        query = embed([message], self.dim)
+        indices, scores = self.search(query, model, k=1)
+        slot, score = int(indices[0, 0]), float(scores[0, 0])
+        if score < self.threshold:
+            return None
+        with self._lock, self._file_lock():
+            # The search ran unlocked; the slot may have been evicted and reused since
+            entry = self._meta[slot]
+            if entry["model"] != self.model_id(model) or entry["stamp"] <= 0:
+                return None
+            if float(self._vecs[slot] @ query[0]) < self.threshold:
+                return None
+            key = bytes(entry["key"]).hex()
+            # Refresh the stamp so hot entries survive eviction
+            self._meta["stamp"][slot] = time.time()
+        return key
+
+    def add(self, message, model, key):
+        vec = embed([message], self.dim)[0]
+        with self._lock, self._file_lock():
+            # Reuse an empty slot if there is one, otherwise evict the least recently used
+            slot = int(np.argmin(self._meta["stamp"]))
+            # Invalidate the slot while its vector is rewritten, so readers never match a half-updated entry
+            self._meta["stamp"][slot] = 0
+            self._vecs[slot] = vec
+            self._meta[slot] = (self.model_id(model), bytes.fromhex(key), time.time())
+            if self.path:
+                self._vecs.flush()
+                self._meta.flush()
+
+    def clear(self):
+        with self._lock, self._file_lock():
+            self._meta["stamp"] = 0
+            self._meta["model"] = 0
+
+
+class _FileLock:
+    def __init__(self, path):
+        self.path = path
+        self._fd = None
+
+    def __enter__(self):
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        fcntl.flock(self._fd, fcntl.LOCK_UN)
+        os.close(self._fd)
+
+
+class _NullLock:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+def semantic_cache_from_env():
+    """Build the semantic cache from SEMANTIC_CACHE* settings, or None when disabled."""
+    if os.getenv("SEMANTIC_CACHE", "0").strip().lower() not in ("1", "true", "yes", "on"):
+        return None
+    return SemanticCache(
+        dim=int(os.getenv("SEMANTIC_CACHE_DIM", "512")),
+        capacity=int(os.getenv("SEMANTIC_CACHE_SIZE", "4096")),
+        threshold=float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.9")),
+        path=os.getenv("SEMANTIC_CACHE_PATH") or None,
+    )
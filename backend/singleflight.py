@@ -0,0 +1,209 @@
+"""
+In-flight request coalescing (single-flight) for identical chat requests.
+
+While a call for a key is running, later callers with the same key wait for
+it and share its result (or its exception) instead of issuing their own
+upstream request. Streams are fanned out: one pump consumes the upstream
+token stream and every subscriber replays the chunks seen so far, then
+follows along live.
+
+`SingleFlight` serves threaded WSGI workers; `AsyncSingleFlight` serves the
+asyncio (ASGI) path. asyncio is imported only by the latter, keeping it off
+the WSGI app's cold start.
+"""
+import threading
+
+
+class FlightCancelled(RuntimeError):
+    """The shared upstream call was cancelled before it finished."""
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.followers = 0  # callers sharing the leader's result
+
+
+class _Broadcast:
+    def __init__(self):
+        self._chunks = []
+        self._cond = threading.Condition()
+        self._finished = False
+        self._error = None
+
+    def publish(self, chunk):
+        with self._cond:
+            self._chunks.append(chunk)
+            self._cond.notify_all()
+
+    def finish(self, error=None):
+        with self._cond:
+            self._error = error
+            self._finished = True
+            self._cond.notify_all()
+
+    def subscribe(self):
+        seen = 0
+        while True:
+            with self._cond:
+                while seen >= len(self._chunks) and not self._finished:
+                    self._cond.wait()
+                pending = self._chunks[seen:]
+                seen = len(self._chunks)
+                finished, error = self._finished, self._error
+            yield from pending
+            if finished and seen == len(self._chunks):
+                if error is not None:
+                    raise error
+                return
+
+
+class SingleFlight:
+    def __init__(self):
+        self._calls = {}
+        self._streams = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn):
+        """Run `fn()` once for all concurrent callers with the same `key`."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                call.followers += 1
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = fn()
+        except Exception as e:
+            call.error = e
+            raise
+        except BaseException:
+            call.error = FlightCancelled("the shared call was interrupted")
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+        return call.result
+
+    def stream(self, key, factory):
+        """Subscribe to the shared stream for `key`, starting `factory()` if none is running.
+
+        The upstream iterator is drained on a background thread so a
+        subscriber that disconnects does not cut the stream off for the others.
+        """
+        with self._lock:
+            flight = self._streams.get(key)
+            if flight is None:
+                flight = self._streams[key] = _Broadcast()
+                threading.Thread(target=self._pump, args=(key, flight, factory), daemon=True).start()
+        return flight.subscribe()
+
+    def _pump(self, key, flight, factory):
+        error = None
+        try:
+            for chunk in factory():
+                flight.publish(chunk)
+        except Exception as e:
+            error = e
+        except BaseException:
+            error = FlightCancelled("the shared stream was interrupted")
+            raise
+        finally:
+            with self._lock:
+                if self._streams.get(key) is flight:
+                    del self._streams[key]
+            flight.finish(error)
+
+
+class _AsyncBroadcast:
+    def __init__(self):
+        import asyncio
+        self._chunks = []
+        self._cond = asyncio.Condition()
+        self._finished = False
+        self._error = None
+
+    async def publish(self, chunk):
+        async with self._cond:
+            self._chunks.append(chunk)
+            self._cond.notify_all()
+
+    async def finish(self, error=None):
+        async with self._cond:
+            self._error = error
+            self._finished = True
+            self._cond.notify_all()
+
+    async def subscribe(self):
+        seen = 0
+        while True:
+            async with self._cond:
+                await self._cond.wait_for(lambda: seen < len(self._chunks) or self._finished)
+                pending = self._chunks[seen:]
+                seen = len(self._chunks)
+                finished, error = self._finished, self._error
+            for chunk in pending:
+                yield chunk
+            if finished and seen == len(self._chunks):
+                if error is not None:
+                    raise error
+                return
+
+
+class AsyncSingleFlight:
+    def __init__(self):
+        self._calls = {}
+        self._streams = {}
+
+    async def do(self, key, fn):
+        """Await `fn()` once for all concurrent callers with the same `key`.
+
+        The shared call runs as its own task, so a caller that is cancelled
+        (e.g. the client went away) does not cancel it for the others.
+        """
+        import asyncio
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda t: self._forget(self._calls, key, t))
+        return await asyncio.shield(task)
+
+    def stream(self, key, factory):
+        import asyncio
+        flight = self._streams.get(key)
+        if flight is None:
+            flight = self._streams[key] = _AsyncBroadcast()
+            task = asyncio.ensure_future(self._pump(flight, factory))
+            task.add_done_callback(lambda t: self._forget(self._streams, key, flight))
+        return flight.subscribe()
+
+    async def _pump(self, flight, factory):
+        import asyncio
+        error = None
+        try:
+            async for chunk in factory():
+                await flight.publish(chunk)
+        except asyncio.CancelledError:
+            # Subscribers get an ordinary error; the cancellation itself stays with this task
+            error = FlightCancelled("the shared stream was cancelled")
+            raise
+        except Exception as e:
+            error = e
+        finally:
+            # Shielded: a second cancellation must not leave subscribers waiting forever
+            await asyncio.shield(flight.finish(error))
+
+    @staticmethod
+    def _forget(table, key, value):
+        if table.get(key) is value:
+            del table[key]
@@ -0,0 +1,175 @@
+import threading
+
+import numpy as np
+import pytest
+
+from backend.audio import FrameRing
+from backend.vad import VADGate
+
+SAMPLE_RATE = 16000
+FRAME = 512  # 32 ms
+
+
+def numbered(n, frame_length=4):
+    """Frames whose samples all equal the frame's index, as one int16 array."""
+    return np.repeat(np.arange(n, dtype=np.int16), frame_length)
+
+
+def drain(ring):
+    frames = []
+    while True:
+        frame = ring.read(timeout=0)
+        if frame is None:
+            return frames
+        frames.append(int(frame[0]))
+
+
+def test_frames_come_back_in_order():
+    ring = FrameRing(4, ring_frames=4)
+    ring.write(numbered(3))
+    assert drain(ring) == [0, 1, 2]
+    assert ring.overruns == 0
+
+
+def test_read_returns_a_view_into_the_ring():
+    ring = FrameRing(4, ring_frames=4)
+    ring.write(numbered(1).tobytes())
+    assert np.shares_memory(ring.read(timeout=0), ring.samples)
+
+
+def test_overrun_skips_to_oldest_intact_frame():
+    ring = FrameRing(4, ring_frames=4)
+    ring.write(numbered(6))
+    assert drain(ring) == [2, 3, 4, 5]
+    assert ring.overruns == 2
+
+
+def test_partly_written_frame_counts_as_overwritten():
+    ring = FrameRing(4, ring_frames=4)
+    ring.write(numbered(5)[:18])  # four frames plus half of the fifth, which lands on frame 0's slot
+    assert drain(ring) == [1, 2, 3]
+    assert ring.overruns == 1
+
+
+def test_writes_may_straddle_the_end_of_the_ring():
+    ring = FrameRing(4, ring_frames=4)
+    pcm = numbered(7)
+    ring.write(pcm[:10])
+    assert drain(ring) == [0, 1]
+    ring.write(pcm[10:])
+    assert drain(ring) == [3, 4, 5, 6]
+    assert ring.overruns == 1
+
+
+def test_blocking_writer_never_overruns():
+    ring = FrameRing(4, ring_frames=4)
+    writer = threading.Thread(target=ring.write, args=(numbered(20),), kwargs={"block": True})
+    writer.start()
+    frames = [int(ring.read(timeout=5)[0]) for _ in range(20)]
+    writer.join(5)
+    assert frames == list(range(20))
+    assert ring.overruns == 0
+
+
+def test_drop_pending_and_close():
+    ring = FrameRing(4, ring_frames=4)
+    ring.write(numbered(3))
+    ring.drop_pending()
+    assert ring.read(timeout=0) is None
+    ring.close()
+    assert ring.read() is None
+
+
+def test_ring_needs_two_frames():
+    with pytest.raises(ValueError):
+        FrameRing(4, ring_frames=1)
+
+
+def noise(seed, dbfs=-60.0):
+    rng = np.random.default_rng(seed)
+    return rng.normal(0.0, 10 ** (dbfs / 20) * 32767, FRAME).astype(np.int16)
+
+
+def voice(dbfs=-20.0):
+    t = np.arange(FRAME) / SAMPLE_RATE
+    return (np.sin(2 * np.pi * 200 * t) * 10 ** (dbfs / 20) * 32767).astype(np.int16)
+
+
+def gate(**kwargs):
+    # 3 frames of pre-roll, 2 of hangover
+    options = dict(preroll_ms=96, hangover_ms=64)
+    options.update(kwargs)
+    return VADGate(SAMPLE_RATE, FRAME, **options)
+
+
+def push(vad, frame):
+    return [f.copy() for f in vad.push(frame)]
+
+
+def same(actual, expected):
+    return len(actual) == len(expected) and all(np.array_equal(a, e) for a, e in zip(actual, expected))
+
+
+def test_silence_is_gated_out():
+    vad = gate()
+    assert all(push(vad, noise(i)) == [] for i in range(50))
+    assert vad.pass_ratio == 0.0
+
+
+def test_speech_onset_replays_preroll_oldest_first():
+    vad = gate()
+    silence = [noise(i) for i in range(10)]
+    for frame in silence:
+        push(vad, frame)
+    speech = voice()
+    assert same(push(vad, speech), silence[-3:] + [speech])
+    assert vad.frames_passed == 4
+
+
+def test_short_silence_replays_only_what_was_stored():
+    vad = gate()
+    silence = [noise(i) for i in range(2)]
+    for frame in silence:
+        push(vad, frame)
+    speech = voice()
+    assert same(push(vad, speech), silence + [speech])
+
+
+def test_hangover_then_preroll_starts_over():
+    vad = gate()
+    for i in range(10):
+        push(vad, noise(i))
+    push(vad, voice())
+    tail = [noise(100 + i) for i in range(3)]
+    # The gate stays open for the hangover, then closes again
+    assert same(push(vad, tail[0]), [tail[0]])
+    assert same(push(vad, tail[1]), [tail[1]])
+    assert push(vad, tail[2]) == []
+    # Frames the engine already saw are not replayed a second time
+    speech = voice()
+    assert same(push(vad, speech), [tail[2], speech])
+
+
+def test_continuous_speech_is_not_replayed_again():
+    vad = gate()
+    for i in range(5):
+        push(vad, noise(i))
+    assert len(push(vad, voice())) == 4
+    assert len(push(vad, voice())) == 1
+
+
+def test_no_preroll():
+    vad = gate(preroll_ms=0)
+    for i in range(5):
+        push(vad, noise(i))
+    speech = voice()
+    assert same(push(vad, speech), [speech])
+
+
+def test_reset_forgets_preroll():
+    vad = gate()
+    for i in range(5):
+        push(vad, noise(i))
+    vad.reset()
+    speech = voice()
+    assert same(push(vad, speech), [speech])
@@ -0,0 +1,117 @@
+import time
+import wave
+import threading
+
+import numpy as np
+import pytest
+
+from backend.audio import WavSource
+from backend.audio_bus import AudioBus
+
+SAMPLE_RATE = 16000
+FRAME = 512  # 32 ms
+
+
+def noise(frames, seed=0, dbfs=-60.0):
+    rng = np.random.default_rng(seed)
+    return rng.normal(0.0, 10 ** (dbfs / 20) * 32767, frames * FRAME).astype(np.int16)
+
+
+def voice(frames, dbfs=-20.0):
+    t = np.arange(frames * FRAME) / SAMPLE_RATE
+    return (np.sin(2 * np.pi * 200 * t) * 10 ** (dbfs / 20) * 32767).astype(np.int16)
+
+
+@pytest.fixture
+def wav(tmp_path):
+    def write(*parts):
+        path = str(tmp_path / "clip.wav")
+        with wave.open(path, "wb") as out:
+            out.setnchannels(1)
+            out.setsampwidth(2)
+            out.setframerate(SAMPLE_RATE)
+            out.writeframes(np.concatenate(parts).tobytes())
+        return path
+    return write
+
+
+def bus(**kwargs):
+    # 3 frames of pre-roll, 8 frames of pause
+    options = dict(timeout=1.0, phrase_time_limit=2.0, pause_threshold=0.256, pre_speech=0.096)
+    options.update(kwargs)
+    return AudioBus(SAMPLE_RATE, FRAME, **options)
+
+
+def play(bus, path):
+    with WavSource(path, FRAME) as source:
+        for frame in source.frames():
+            bus.feed(frame)
+
+
+def play_once_armed(bus, path):
+    """Feed `path` from a listener thread as soon as a capture is armed."""
+    def listen():
+        deadline = time.monotonic() + 5
+        while not bus.capturing and time.monotonic() < deadline:
+            time.sleep(0.001)
+        play(bus, path)
+
+    listener = threading.Thread(target=listen)
+    listener.start()
+    return listener
+
+
+def frames_of(pcm):
+    return np.frombuffer(pcm, dtype=np.int16).reshape(-1, FRAME)
+
+
+def test_silence_ends_the_phrase_and_keeps_the_preroll(wav):
+    lead, speech, tail = noise(20, seed=1), voice(10), noise(20, seed=2)
+    audio = bus()
+    audio.arm()
+    play(audio, wav(lead, speech, tail))
+    # 3 frames of lead-in, the speech, then the 8 quiet frames that ended it
+    expected = np.concatenate([lead[-3 * FRAME:], speech, tail[:8 * FRAME]])
+    assert np.array_equal(np.frombuffer(audio.capture(), dtype=np.int16), expected)
+    assert not audio.capturing
+
+
+def test_speech_right_after_arming_has_no_preroll(wav):
+    speech, tail = voice(5), noise(20)
+    audio = bus()
+    audio.arm()
+    play(audio, wav(speech, tail))
+    assert np.array_equal(np.frombuffer(audio.capture(), dtype=np.int16), np.concatenate([speech, tail[:8 * FRAME]]))
+
+
+def test_phrase_time_limit_cuts_long_speech(wav):
+    audio = bus(phrase_time_limit=1.0)
+    audio.arm()
+    play(audio, wav(noise(10), voice(100)))
+    # Pre-roll plus one second of speech, rounded up to whole frames
+    assert len(frames_of(audio.capture())) == 35
+
+
+def test_capture_arms_and_waits_for_the_listener(wav):
+    audio = bus()
+    listener = play_once_armed(audio, wav(noise(5), voice(10), noise(20)))
+    pcm = audio.capture()
+    listener.join(5)
+    assert len(frames_of(pcm)) == 3 + 10 + 8
+
+
+def test_no_speech_before_the_timeout_returns_none(wav):
+    audio = bus(timeout=0.5)
+    listener = play_once_armed(audio, wav(noise(40)))
+    assert audio.capture() is None
+    listener.join(5)
+    assert not audio.capturing
+
+
+def test_capture_gives_up_when_the_listener_stops(wav):
+    audio = bus(timeout=0.1, phrase_time_limit=0.1, pause_threshold=0.1)
+    listener = play_once_armed(audio, wav(noise(2)))
+    assert audio.capture() is None
+    listener.join(5)
+    assert not audio.capturing
+
@@ -0,0 +1,61 @@
+import time
+
+import pytest
+
+from backend.capabilities import TOKEN_PARAM, SUPPORTS_TEMPERATURE, CapabilityStore
+
+
+def settle(store):
+    """Wait for the store's background thread to finish what was queued so far."""
+    if store._background is not None:
+        store._background.submit(lambda: None).result(5)
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "app.db")
+
+
+def test_learned_values_are_shared_through_the_database(db_path):
+    CapabilityStore(db_path).learn("o3-mini", TOKEN_PARAM, "max_completion_tokens")
+    assert CapabilityStore(db_path).get("o3-mini") == {TOKEN_PARAM: "max_completion_tokens"}
+
+
+def test_cached_never_reads_the_database_itself(db_path):
+    CapabilityStore(db_path).learn("o3-mini", TOKEN_PARAM, "max_completion_tokens")
+    store = CapabilityStore(db_path)
+    assert store.cached("o3-mini") == {}
+    settle(store)
+    assert store.cached("o3-mini") == {TOKEN_PARAM: "max_completion_tokens"}
+
+
+def test_cached_refreshes_stale_entries_in_the_background(db_path):
+    store = CapabilityStore(db_path, refresh_seconds=0.05)
+    assert store.get("gpt-5") == {}
+    CapabilityStore(db_path).learn("gpt-5", SUPPORTS_TEMPERATURE, False)
+    time.sleep(0.05)
+    assert store.cached("gpt-5") == {}
+    settle(store)
+    assert store.cached("gpt-5") == {SUPPORTS_TEMPERATURE: False}
+
+
+def test_background_learn_updates_memory_at_once_and_persists_later(db_path):
+    store = CapabilityStore(db_path)
+    store.learn("gpt-5", SUPPORTS_TEMPERATURE, False, background=True)
+    assert store.cached("gpt-5") == {SUPPORTS_TEMPERATURE: False}
+    settle(store)
+    assert CapabilityStore(db_path).get("gpt-5") == {SUPPORTS_TEMPERATURE: False}
+
+
+def test_memory_only_store_has_no_background_thread():
+    store = CapabilityStore()
+    store.learn("gpt-5", SUPPORTS_TEMPERATURE, False, background=True)
+    assert store.cached("gpt-5") == {SUPPORTS_TEMPERATURE: False}
+    assert store._background is None
+
+
+def test_unusable_database_falls_back_to_memory(tmp_path):
+    store = CapabilityStore(str(tmp_path / "missing" / "app.db"))
+    store.learn("gpt-5", TOKEN_PARAM, "max_tokens")
+    assert store.db is None
+    assert store.get("gpt-5") == {TOKEN_PARAM: "max_tokens"}
@@ -0,0 +1,175 @@
+import pytest
+
+from backend.conversations import ConversationStore, Summarizer, estimate_tokens, parse_model_budgets
+from backend.database import get_db
+from backend.migrations import migrate
+
+TURNS = [
+    ("What is the capital of France?", "Paris."),
+    ("And of Italy?", "Rome is the capital of Italy."),
+    ("How far apart are they by train?", "About eleven hours with one change in Milan."),
+]
+
+
+@pytest.fixture
+def store(tmp_path):
+    db_path = str(tmp_path / "app.db")
+    migrate(get_db(db_path))
+    return ConversationStore(db_path, default_budget=1000, model_budgets={"small": 40})
+
+
+@pytest.fixture
+def conversation(store):
+    conversation_id = store.create(user_id=1)
+    for user_message, reply in TURNS:
+        store.append_turn(conversation_id, user_message, reply)
+    return conversation_id
+
+
+def tokens(*texts):
+    return sum(estimate_tokens(text) for text in texts)
+
+
+def as_messages(turns):
+    messages = []
+    for user_message, reply in turns:
+        messages += [{"role": "user", "content": user_message}, {"role": "assistant", "content": reply}]
+    return messages
+
+
+def test_positions_are_running_token_totals(store, conversation):
+    assert store.get(conversation, user_id=1)["tokens"] == tokens(*sum(TURNS, ()))
+    assert store.get(conversation, user_id=2) is None
+
+
+def test_large_budget_returns_whole_conversation(store, conversation):
+    assert store.window(conversation, 10_000) == as_messages(TURNS)
+
+
+def test_budget_keeps_newest_turns_that_fit(store, conversation):
+    assert store.window(conversation, tokens(*TURNS[2])) == as_messages(TURNS[2:])
+    assert store.window(conversation, tokens(*TURNS[1], *TURNS[2])) == as_messages(TURNS[1:])
+
+
+def test_window_never_starts_on_assistant_turn(store, conversation):
+    # Room for the last turn and the reply before it, but not the question that reply answered
+    budget = tokens(TURNS[1][1], *TURNS[2])
+    assert store.window(conversation, budget) == as_messages(TURNS[2:])
+
+
+def test_partial_message_is_left_out(store, conversation):
+    budget = tokens(*TURNS[2]) - 1
+    assert store.window(conversation, budget) == []
+
+
+def test_empty_budget_or_unknown_conversation(store, conversation):
+    assert store.window(conversation, 0) == []
+    assert store.window(conversation, -5) == []
+    assert store.window("missing", 1000) == []
+
+
+def test_summary_replaces_folded_turns(store, conversation):
+    upto = tokens(*TURNS[0], *TURNS[1])
+    assert store.save_summary(conversation, "Capitals of France and Italy.", upto, previous_upto=0)
+    summary = {"role": "system", "content": "Summary of the earlier conversation:\nCapitals of France and Italy."}
+    assert store.window(conversation, 10_000) == [summary] + as_messages(TURNS[2:])
+
+
+def test_summary_counts_against_budget(store, conversation):
+    summary_text = "Capitals of France and Italy."
+    store.save_summary(conversation, summary_text, tokens(*TURNS[0]), previous_upto=0)
+    summary = {"role": "system", "content": f"Summary of the earlier conversation:\n{summary_text}"}
+    budget = estimate_tokens(summary_text) + tokens(*TURNS[2])
+    assert store.window(conversation, budget) == [summary] + as_messages(TURNS[2:])
+    assert store.window(conversation, budget - 1) == [summary]
+
+
+def test_stale_summary_is_not_saved(store, conversation):
+    assert store.save_summary(conversation, "first", tokens(*TURNS[0]), previous_upto=0)
+    assert not store.save_summary(conversation, "second", tokens(*TURNS[0], *TURNS[1]), previous_upto=0)
+
+
+def test_history_uses_model_budget_minus_reserve(store, conversation):
+    assert store.history(conversation, "gpt-4o") == as_messages(TURNS)
+    assert store.history(conversation, "gpt-4o", reserve=1000) == []
+    assert store.history(conversation, "small") == store.window(conversation, 40)
+
+
+def test_parse_model_budgets():
+    assert parse_model_budgets(" gpt-4o = 8000,sonar=1.5e3,small=0,=100,bad,gemini=x") == {"gpt-4o": 8000}
+    assert parse_model_budgets(None) == {}
+
+
+class FakeModel:
+    def __init__(self, reply="Capitals of France and Italy.", during=None):
+        self.reply = reply
+        self.during = during
+        self.calls = []
+
+    def __call__(self, model, messages, max_tokens):
+        self.calls.append(messages[-1]["content"])
+        if self.during:
+            self.during()
+        return self.reply
+
+
+def summarizer(store, complete, **kwargs):
+    options = dict(trigger_tokens=0, keep_tokens=tokens(*TURNS[2]))
+    options.update(kwargs)
+    return Summarizer(store, complete, "cheap", **options)
+
+
+def test_compaction_waits_for_the_trigger(store, conversation):
+    total = tokens(*sum(TURNS, ()))
+    complete = FakeModel()
+    assert not summarizer(store, complete, trigger_tokens=total).compact(conversation)
+    assert complete.calls == []
+    assert summarizer(store, complete, trigger_tokens=total - 1).compact(conversation)
+    assert len(complete.calls) == 1
+
+
+def test_trigger_counts_only_the_unsummarized_tail(store, conversation):
+    upto = tokens(*TURNS[0])
+    store.save_summary(conversation, "France.", upto, previous_upto=0)
+    complete = FakeModel()
+    assert not summarizer(store, complete, trigger_tokens=tokens(*TURNS[1], *TURNS[2])).compact(conversation)
+    assert complete.calls == []
+
+
+def test_compaction_keeps_recent_turns_and_folds_the_rest(store, conversation):
+    complete = FakeModel()
+    assert summarizer(store, complete).compact(conversation)
+    assert "Previous summary:\n(none)" in complete.calls[0]
+    assert "User: And of Italy?" in complete.calls[0]
+    assert TURNS[2][0] not in complete.calls[0]
+    summary = {"role": "system", "content": "Summary of the earlier conversation:\nCapitals of France and Italy."}
+    assert store.window(conversation, 10_000) == [summary] + as_messages(TURNS[2:])
+
+
+def test_cutoff_lands_on_a_user_turn(store, conversation):
+    # keep_tokens reaches back into the previous reply; the reply is folded with its question
+    complete = FakeModel()
+    assert summarizer(store, complete, keep_tokens=tokens(TURNS[1][1], *TURNS[2])).compact(conversation)
+    assert TURNS[1][1] in complete.calls[0]
+    assert store.unsummarized(conversation)[2] == tokens(*TURNS[0], *TURNS[1])
+
+
+def test_nothing_to_fold_when_everything_fits(store, conversation):
+    complete = FakeModel()
+    assert not summarizer(store, complete, keep_tokens=10_000).compact(conversation)
+    assert complete.calls == []
+
+
+def test_empty_reply_is_not_saved(store, conversation):
+    assert not summarizer(store, FakeModel(reply="  ")).compact(conversation)
+    assert store.unsummarized(conversation)[1] is None
+
+
+def test_losing_the_race_keeps_the_other_summary(store, conversation):
+    upto = tokens(*TURNS[0])
+
+    def other_worker():
+        assert store.save_summary(conversation, "France.", upto, previous_upto=0)
+
+    assert not summarizer(store, FakeModel(during=other_worker)).compact(conversation)
+    assert store.unsummarized(conversation)[1:3] == ("France.", upto)
@@ -0,0 +1,124 @@
+import pytest
+
+from backend import ratelimit
+from backend.ratelimit import MemoryBuckets, RateLimiter, SQLiteBuckets, parse_model_rules, parse_rule
+
+
+class FakeClock:
+    """Stands in for the time module: SQLiteBuckets reads time(), MemoryBuckets monotonic()."""
+
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(ratelimit, "time", clock)
+    return clock
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def buckets(request, tmp_path):
+    if request.param == "memory":
+        return MemoryBuckets()
+    return SQLiteBuckets(str(tmp_path / "app.db"))
+
+
+def test_parse_rule():
+    assert parse_rule("20/60") == (20.0, 20 / 60)
+    assert parse_rule("5") == (5.0, 5 / 60)
+    for spec in (None, "", "x/60", "0/60", "5/0", "-1/60"):
+        assert parse_rule(spec) is None
+
+
+def test_parse_model_rules_skips_invalid_entries():
+    assert parse_model_rules("gpt-4o=10/60, sonar=bad,=5/60") == {"gpt-4o": (10.0, 10 / 60)}
+
+
+def test_full_bucket_allows_a_burst_up_to_capacity(buckets, clock):
+    assert [buckets.take("k", 3, 1.0) for _ in range(3)] == [0, 0, 0]
+    assert buckets.take("k", 3, 1.0) > 0
+
+
+def test_bucket_refills_at_rate(buckets, clock):
+    for _ in range(2):
+        buckets.take("k", 2, 0.5)
+    assert buckets.take("k", 2, 0.5) > 0
+    clock.now += 1.9
+    assert buckets.take("k", 2, 0.5) > 0
+    clock.now += 0.1
+    assert buckets.take("k", 2, 0.5) == 0
+    assert buckets.take("k", 2, 0.5) > 0
+
+
+def test_refill_is_capped_at_capacity(buckets, clock):
+    buckets.take("k", 2, 1.0)
+    clock.now += 3600
+    assert [buckets.take("k", 2, 1.0) for _ in range(3)] == [0, 0, 2]
+
+
+def test_retry_after_is_whole_seconds_until_a_token(buckets, clock):
+    # 10 requests per minute: a token every 6 seconds
+    rate = 10 / 60
+    for _ in range(10):
+        buckets.take("k", 10, rate)
+    assert buckets.take("k", 10, rate) == 7
+    clock.now += 3
+    assert buckets.take("k", 10, rate) == 4
+    clock.now += 2.9
+    assert buckets.take("k", 10, rate) == 1
+
+
+def test_rejected_requests_do_not_drain_the_bucket(buckets, clock):
+    buckets.take("k", 1, 1.0)
+    for _ in range(5):
+        assert buckets.take("k", 1, 1.0) == 2
+    clock.now += 1
+    assert buckets.take("k", 1, 1.0) == 0
+
+
+def test_keys_are_independent(buckets, clock):
+    buckets.take("a", 1, 0.1)
+    assert buckets.take("a", 1, 0.1) > 0
+    assert buckets.take("b", 1, 0.1) == 0
+
+
+def test_sqlite_buckets_are_shared_between_instances(tmp_path, clock):
+    db_path = str(tmp_path / "app.db")
+    SQLiteBuckets(db_path).take("k", 1, 0.1)
+    assert SQLiteBuckets(db_path).take("k", 1, 0.1) == 11
+
+
+def test_unusable_database_falls_back_to_memory(tmp_path, clock):
+    buckets = SQLiteBuckets(str(tmp_path / "missing" / "app.db"))
+    assert buckets.take("k", 1, 1.0) == 0
+    assert isinstance(buckets._fallback, MemoryBuckets)
+    assert buckets.take("k", 1, 1.0) == 2
+
+
+def test_limiter_charges_ip_then_user(clock):
+    limiter = RateLimiter(MemoryBuckets(), user_rule=(2, 1 / 60), ip_rule=(3, 1 / 60))
+    assert [limiter.check(1, "10.0.0.1") for _ in range(2)] == [0, 0]
+    assert limiter.check(1, "10.0.0.1") == 61
+    # Another user behind the same address still has their own bucket but shares the IP's
+    assert limiter.check(2, "10.0.0.1") == 61
+    assert limiter.check(2, "10.0.0.2") == 0
+
+
+def test_limiter_uses_model_rule_instead_of_user_rule(clock):
+    limiter = RateLimiter(MemoryBuckets(), user_rule=(100, 1.0), model_rules={"gpt-5": (1, 1 / 30)})
+    assert limiter.check(1, None, "gpt-5") == 0
+    assert limiter.check(1, None, "gpt-5") == 31
+    assert limiter.check(1, None, "gpt-4o") == 0
+
+
+def test_limiter_skips_missing_rules_and_anonymous_users(clock):
+    limiter = RateLimiter(MemoryBuckets(), user_rule=(1, 0.01))
+    assert [limiter.check(None, "10.0.0.1") for _ in range(3)] == [0, 0, 0]
@@ -0,0 +1,190 @@
+import pytest
+
+from backend import resilience
+from backend.providers import UpstreamError
+from backend.resilience import (
+    CLOSED, HALF_OPEN, OPEN, AIMDLimiter, CircuitBreaker, ProviderGuard, ProviderUnavailable,
+)
+
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(resilience, "time", clock)
+    return clock
+
+
+def tripped(min_calls=4, open_seconds=10.0):
+    breaker = CircuitBreaker(window=10, min_calls=min_calls, failure_rate=0.5, open_seconds=open_seconds)
+    for _ in range(min_calls):
+        breaker.record(True)
+    assert breaker.state == OPEN
+    return breaker
+
+
+def test_breaker_waits_for_min_calls_before_opening(clock):
+    breaker = CircuitBreaker(window=10, min_calls=4, failure_rate=0.5)
+    for _ in range(3):
+        breaker.record(True)
+    assert breaker.state == CLOSED
+    breaker.record(True)
+    assert breaker.state == OPEN
+
+
+def test_breaker_stays_closed_below_failure_rate(clock):
+    breaker = CircuitBreaker(window=10, min_calls=4, failure_rate=0.5)
+    for failed in (True, False, False, False, True, False):
+        breaker.record(failed)
+    assert breaker.state == CLOSED
+    assert breaker.allow()
+
+
+def test_open_breaker_fails_fast_until_cool_down(clock):
+    breaker = tripped(open_seconds=10)
+    assert not breaker.allow()
+    assert not breaker.accepting()
+    assert breaker.retry_after() == 11
+    clock.now += 9.5
+    assert not breaker.allow()
+    assert breaker.retry_after() == 1
+
+
+def test_half_open_lets_one_probe_through(clock):
+    breaker = tripped(open_seconds=10)
+    clock.now += 10
+    assert breaker.accepting()
+    assert breaker.state == OPEN  # accepting() only looks
+    assert breaker.allow()
+    assert breaker.state == HALF_OPEN
+    assert not breaker.allow()
+    assert not breaker.accepting()
+
+
+def test_successful_probe_closes(clock):
+    breaker = tripped(open_seconds=10)
+    clock.now += 10
+    assert breaker.allow()
+    breaker.record(False)
+    assert breaker.state == CLOSED
+    assert breaker.snapshot()["calls_in_window"] == 0
+    assert breaker.allow()
+
+
+def test_failed_probe_reopens_for_a_full_cool_down(clock):
+    breaker = tripped(open_seconds=10)
+    clock.now += 10
+    assert breaker.allow()
+    breaker.record(True)
+    assert breaker.state == OPEN
+    clock.now += 9
+    assert not breaker.allow()
+    clock.now += 1
+    assert breaker.allow()
+
+
+def test_released_probe_slot_admits_another_probe(clock):
+    breaker = tripped(open_seconds=10)
+    clock.now += 10
+    assert breaker.allow()
+    breaker.release_probe()
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow()
+
+
+def test_limiter_caps_in_flight_calls(clock):
+    limiter = AIMDLimiter(initial=2)
+    assert limiter.try_acquire()
+    assert limiter.try_acquire()
+    assert not limiter.try_acquire()
+    limiter.release()
+    assert limiter.try_acquire()
+
+
+def test_limiter_grows_by_about_one_per_round_of_successes(clock):
+    limiter = AIMDLimiter(initial=4, max_limit=100)
+    for _ in range(4):
+        limiter.try_acquire()
+        limiter.release(congested=False)
+    assert limiter.snapshot()["limit"] == 4
+    assert 4.8 < limiter.limit < 5.0
+    limiter.try_acquire()
+    limiter.release(congested=False)
+    assert limiter.snapshot()["limit"] == 5
+
+
+def test_limiter_growth_stops_at_max(clock):
+    limiter = AIMDLimiter(initial=10, max_limit=10)
+    limiter.try_acquire()
+    limiter.release(congested=False)
+    assert limiter.limit == 10
+
+
+def test_limiter_backs_off_once_per_interval(clock):
+    limiter = AIMDLimiter(initial=40, backoff=0.5, backoff_interval=1.0)
+    for _ in range(3):
+        limiter.try_acquire()
+        limiter.release(congested=True)
+    assert limiter.limit == 20
+    clock.now += 1.0
+    limiter.try_acquire()
+    limiter.release(congested=True)
+    assert limiter.limit == 10
+
+
+def test_limiter_never_drops_below_min(clock):
+    limiter = AIMDLimiter(initial=3, min_limit=2, backoff=0.5, backoff_interval=0)
+    for _ in range(3):
+        limiter.try_acquire()
+        limiter.release(congested=True)
+    assert limiter.limit == 2
+
+
+def test_limiter_release_without_verdict_keeps_limit(clock):
+    limiter = AIMDLimiter(initial=8)
+    limiter.try_acquire()
+    limiter.release(None)
+    assert limiter.limit == 8
+    assert limiter.in_flight == 0
+
+
+def test_guard_counts_slow_calls_as_failures(clock):
+    guard = ProviderGuard("openai", CircuitBreaker(min_calls=1, failure_rate=1.0),
+                          AIMDLimiter(initial=10, backoff_interval=0), slow_call_seconds=5)
+    guard.admit()
+    guard.release(elapsed=6)
+    assert guard.breaker.state == OPEN
+    assert guard.limiter.limit == 5
+    with pytest.raises(ProviderUnavailable) as exc:
+        guard.admit()
+    assert exc.value.status == 503
+    assert guard.rejected == 1
+
+
+def test_guard_ignores_caller_errors(clock):
+    guard = ProviderGuard("openai", CircuitBreaker(min_calls=1, failure_rate=1.0), AIMDLimiter(initial=10))
+    guard.admit()
+    guard.release(elapsed=0.1, error=UpstreamError("bad request", status=400))
+    assert guard.breaker.state == CLOSED
+    assert guard.limiter.limit == 10
+    guard.admit()
+    guard.release(elapsed=0.1, error=UpstreamError("rate limited", status=429))
+    assert guard.breaker.state == OPEN
+
+
+def test_guard_gives_back_probe_when_limiter_is_full(clock):
+    guard = ProviderGuard("openai", tripped(open_seconds=10), AIMDLimiter(initial=1))
+    guard.limiter.try_acquire()
+    clock.now += 10
+    with pytest.raises(ProviderUnavailable, match="concurrency limit"):
+        guard.admit()
+    guard.limiter.release()
+    guard.admit()
+    assert guard.breaker.state == HALF_OPEN
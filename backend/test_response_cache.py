@@ -0,0 +1,117 @@
+import pytest
+
+from backend import response_cache
+from backend.response_cache import ResponseCache, parse_model_ttls
+
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(response_cache, "time", clock)
+    return clock
+
+
+def key(message="Hello", **overrides):
+    args = dict(provider="openai", model="gpt-4o-mini", message=message, system_prompt="Be brief.",
+                temperature=0.7, max_tokens=256)
+    args.update(overrides)
+    return ResponseCache.make_key(**args)
+
+
+def test_key_ignores_whitespace_and_unicode_form():
+    assert key("Hello   world") == key(" Hello world\n")
+    assert key("ｈｅｌｌｏ") == key("hello")
+
+
+@pytest.mark.parametrize("field, value", [
+    ("provider", "copilot"),
+    ("model", "gpt-4o"),
+    ("system_prompt", "Be verbose."),
+    ("temperature", 0.2),
+    ("max_tokens", 512),
+])
+def test_key_changes_with_every_request_parameter(field, value):
+    assert key(**{field: value}) != key()
+
+
+def test_key_includes_history_only_when_given():
+    history = [{"role": "user", "content": "Hi"}, {"role": "assistant", "content": "Hello!"}]
+    assert key(history=[]) == key()
+    assert key(history=history) != key()
+    assert key(history=history[:1]) != key(history=history)
+
+
+def test_parse_model_ttls_skips_malformed_items():
+    assert parse_model_ttls("sonar=300, gpt-5=0,bogus,x=abc") == {"sonar": 300.0, "gpt-5": 0.0}
+
+
+def test_entry_expires_after_ttl(clock):
+    cache = ResponseCache(default_ttl=60)
+    cache.set("k", "gpt-4o-mini", "answer")
+    clock.now += 59
+    assert cache.get("k") == "answer"
+    clock.now += 1
+    assert cache.get("k") is None
+
+
+def test_model_ttl_overrides_default_and_zero_disables(clock):
+    cache = ResponseCache(default_ttl=3600, model_ttls={"sonar": 10, "gpt-5": 0})
+    cache.set("a", "sonar", "fresh")
+    cache.set("b", "gpt-5", "never stored")
+    assert cache.get("b") is None
+    clock.now += 10
+    assert cache.get("a") is None
+
+
+def test_empty_responses_are_not_cached(clock):
+    cache = ResponseCache()
+    cache.set("k", "gpt-4o-mini", "")
+    assert cache.get("k") is None
+
+
+def test_memory_tier_evicts_least_recently_used(clock):
+    cache = ResponseCache(max_entries=2)
+    cache.set("a", "m", "1")
+    cache.set("b", "m", "2")
+    assert cache.get("a") == "1"
+    cache.set("c", "m", "3")
+    assert cache.get("b") is None
+    assert cache.get("a") == "1"
+    assert cache.get("c") == "3"
+
+
+def test_sqlite_tier_is_shared_and_keeps_expiry(clock, tmp_path):
+    db_path = str(tmp_path / "cache.db")
+    writer = ResponseCache(default_ttl=60, db_path=db_path)
+    writer.set("k", "m", "answer")
+
+    # A second worker with an empty memory tier reads the entry from SQLite
+    reader = ResponseCache(default_ttl=60, db_path=db_path)
+    assert reader.get("k") == "answer"
+
+    clock.now += 60
+    assert ResponseCache(db_path=db_path).get("k") is None
+    assert reader.get("k") is None
+
+
+def test_sqlite_tier_clear(clock, tmp_path):
+    cache = ResponseCache(db_path=str(tmp_path / "cache.db"))
+    cache.set("k", "m", "answer")
+    cache.clear()
+    assert cache.get("k") is None
+    assert ResponseCache(db_path=cache.db_path).get("k") is None
+
+
+def test_unusable_database_falls_back_to_memory(clock, tmp_path):
+    cache = ResponseCache(db_path=str(tmp_path / "missing" / "cache.db"))
+    cache.set("k", "m", "answer")
+    assert cache.db_path is None
+    assert cache.get("k") == "answer"
@@ -0,0 +1,125 @@
+import hashlib
+
+import numpy as np
+import pytest
+
+from backend import semantic_cache
+from backend.semantic_cache import SemanticCache, embed
+
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def time(self):
+        self.now += 1
+        return self.now
+
+
+@pytest.fixture(autouse=True)
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(semantic_cache, "time", clock)
+    return clock
+
+
+def key(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+PROMPT = "What is the capital of France?"
+
+
+def test_embed_is_normalized_and_ignores_case_and_spacing():
+    vecs = embed([PROMPT, "  what is the   capital of france?", "Write a haiku about autumn"])
+    assert vecs.dtype == np.float32
+    assert np.allclose(np.linalg.norm(vecs, axis=1), 1.0)
+    assert vecs[0] @ vecs[1] == pytest.approx(1.0)
+    assert vecs[0] @ vecs[2] < 0.5
+
+
+def test_near_duplicate_hits_and_unrelated_misses():
+    cache = SemanticCache(capacity=8)
+    cache.add(PROMPT, "gpt-4o", key(PROMPT))
+    assert cache.lookup("what is the capital of France", "gpt-4o") == key(PROMPT)
+    assert cache.lookup("Write a haiku about autumn", "gpt-4o") is None
+
+
+def test_empty_cache_misses():
+    cache = SemanticCache(capacity=4)
+    assert cache.lookup(PROMPT, "gpt-4o") is None
+    indices, scores = cache.search(embed([PROMPT]), "gpt-4o", k=2)
+    assert indices.shape == scores.shape == (1, 2)
+    assert (scores == -1).all()
+
+
+def test_threshold_controls_hits():
+    strict = SemanticCache(capacity=4, threshold=0.999)
+    strict.add(PROMPT, "gpt-4o", key(PROMPT))
+    assert strict.lookup("What is the capital city of France?", "gpt-4o") is None
+    assert strict.lookup(PROMPT, "gpt-4o") == key(PROMPT)
+
+
+def test_entries_are_isolated_per_model():
+    cache = SemanticCache(capacity=8)
+    cache.add(PROMPT, "gpt-4o", key("gpt-4o"))
+    cache.add(PROMPT, "sonar", key("sonar"))
+    assert cache.lookup(PROMPT, "gpt-4o") == key("gpt-4o")
+    assert cache.lookup(PROMPT, "sonar") == key("sonar")
+    assert cache.lookup(PROMPT, "gemini-2.5-pro") is None
+
+
+def test_batch_search_ranks_best_first():
+    cache = SemanticCache(capacity=8)
+    prompts = [PROMPT, "What is the capital of Italy?", "Write a haiku about autumn"]
+    for prompt in prompts:
+        cache.add(prompt, "gpt-4o", key(prompt))
+    indices, scores = cache.search(embed(prompts), "gpt-4o", k=3)
+    assert (np.diff(scores, axis=1) <= 0).all()
+    assert scores[:, 0] == pytest.approx([1.0, 1.0, 1.0])
+    assert len(set(indices[:, 0].tolist())) == 3
+
+
+def test_eviction_drops_least_recently_used():
+    cache = SemanticCache(capacity=2)
+    a, b, c = PROMPT, "Write a haiku about autumn", "How do I reverse a list in Python?"
+    cache.add(a, "gpt-4o", key(a))
+    cache.add(b, "gpt-4o", key(b))
+    # A hit refreshes a's stamp, so b is now the oldest
+    assert cache.lookup(a, "gpt-4o") == key(a)
+    cache.add(c, "gpt-4o", key(c))
+    assert cache.lookup(a, "gpt-4o") == key(a)
+    assert cache.lookup(b, "gpt-4o") is None
+    assert cache.lookup(c, "gpt-4o") == key(c)
+
+
+def test_clear():
+    cache = SemanticCache(capacity=4)
+    cache.add(PROMPT, "gpt-4o", key(PROMPT))
+    cache.clear()
+    assert cache.lookup(PROMPT, "gpt-4o") is None
+
+
+def test_memmap_is_shared_and_survives_reopening(tmp_path):
+    path = str(tmp_path / "semantic.idx")
+    writer = SemanticCache(dim=256, capacity=16, path=path)
+    reader = SemanticCache(dim=256, capacity=16, path=path)
+    writer.add(PROMPT, "gpt-4o", key(PROMPT))
+    # Another worker's mapping sees the write without reopening
+    assert reader.lookup(PROMPT, "gpt-4o") == key(PROMPT)
+    del writer, reader
+    assert SemanticCache(dim=256, capacity=16, path=path).lookup(PROMPT, "gpt-4o") == key(PROMPT)
+
+
+def test_vectors_are_one_contiguous_float32_block(tmp_path):
+    cache = SemanticCache(dim=256, capacity=16, path=str(tmp_path / "semantic.idx"))
+    assert isinstance(cache._vecs, np.memmap)
+    assert cache._vecs.dtype == np.float32
+    assert cache._vecs.flags["C_CONTIGUOUS"]
+
+
+def test_memmap_with_other_shape_is_recreated(tmp_path):
+    path = str(tmp_path / "semantic.idx")
+    SemanticCache(dim=256, capacity=16, path=path).add(PROMPT, "gpt-4o", key(PROMPT))
+    assert SemanticCache(dim=128, capacity=16, path=path).lookup(PROMPT, "gpt-4o") is None
+    assert SemanticCache(dim=128, capacity=32, path=path).lookup(PROMPT, "gpt-4o") is None
@@ -0,0 +1,211 @@
+import time
+import asyncio
+import threading
+
+import pytest
+
+from backend.singleflight import AsyncSingleFlight, FlightCancelled, SingleFlight
+
+
+def run_callers(n, target):
+    results, errors = [], []
+
+    def call():
+        try:
+            results.append(target())
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=call) for _ in range(n)]
+    for t in threads:
+        t.start()
+    return threads, results, errors
+
+
+def wait_for_followers(flight, key, n):
+    """Block until `n` callers are waiting on the in-flight call for `key`."""
+    deadline = time.monotonic() + 5
+    while flight._calls[key].followers < n:
+        assert time.monotonic() < deadline, "callers never joined the flight"
+        time.sleep(0.001)
+
+
+def test_concurrent_calls_share_one_upstream_call():
+    flight = SingleFlight()
+    release = threading.Event()
+    started = threading.Event()
+    calls = []
+
+    def upstream():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return "answer"
+
+    threads, results, errors = run_callers(5, lambda: flight.do("k", upstream))
+    started.wait(5)
+    wait_for_followers(flight, "k", 4)
+    release.set()
+    for t in threads:
+        t.join(5)
+    assert calls == [1]
+    assert results == ["answer"] * 5
+    assert errors == []
+
+
+def test_error_fans_out_to_every_caller():
+    flight = SingleFlight()
+    release = threading.Event()
+    started = threading.Event()
+
+    def upstream():
+        started.set()
+        release.wait(5)
+        raise ValueError("upstream down")
+
+    threads, results, errors = run_callers(4, lambda: flight.do("k", upstream))
+    started.wait(5)
+    wait_for_followers(flight, "k", 3)
+    release.set()
+    for t in threads:
+        t.join(5)
+    assert results == []
+    assert len(errors) == 4
+    assert all(isinstance(e, ValueError) for e in errors)
+
+
+def test_finished_call_is_not_reused():
+    flight = SingleFlight()
+    assert flight.do("k", lambda: 1) == 1
+    assert flight.do("k", lambda: 2) == 2
+
+
+def test_different_keys_do_not_coalesce():
+    flight = SingleFlight()
+    assert flight.do("a", lambda: "a") == "a"
+    assert flight.do("b", lambda: "b") == "b"
+
+
+def test_stream_subscribers_get_every_chunk_and_the_error():
+    flight = SingleFlight()
+    release = threading.Event()
+
+    def upstream():
+        yield "Hel"
+        release.wait(5)
+        yield "lo"
+        raise ConnectionError("reset")
+
+    first = flight.stream("k", upstream)
+    assert next(first) == "Hel"
+    late = flight.stream("k", lambda: pytest.fail("a second upstream stream was started"))
+    release.set()
+    for subscriber, head in ((first, ["Hel"]), (late, [])):
+        chunks = list(head)
+        with pytest.raises(ConnectionError):
+            for chunk in subscriber:
+                chunks.append(chunk)
+        assert chunks == ["Hel", "lo"]
+
+
+def test_async_calls_share_one_upstream_call():
+    async def main():
+        flight = AsyncSingleFlight()
+        calls = []
+
+        async def upstream():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return "answer"
+
+        results = await asyncio.gather(*(flight.do("k", upstream) for _ in range(5)))
+        return calls, results
+
+    calls, results = asyncio.run(main())
+    assert calls == [1]
+    assert results == ["answer"] * 5
+
+
+def test_async_error_fans_out_to_every_caller():
+    async def main():
+        flight = AsyncSingleFlight()
+
+        async def upstream():
+            await asyncio.sleep(0.01)
+            raise ValueError("upstream down")
+
+        return await asyncio.gather(*(flight.do("k", upstream) for _ in range(3)), return_exceptions=True)
+
+    results = asyncio.run(main())
+    assert len(results) == 3
+    assert all(isinstance(r, ValueError) for r in results)
+
+
+def test_async_cancelled_caller_does_not_cancel_the_others():
+    async def main():
+        flight = AsyncSingleFlight()
+
+        async def upstream():
+            await asyncio.sleep(0.02)
+            return "answer"
+
+        leaving = asyncio.ensure_future(flight.do("k", upstream))
+        staying = asyncio.ensure_future(flight.do("k", upstream))
+        await asyncio.sleep(0)
+        leaving.cancel()
+        return await staying
+
+    assert asyncio.run(main()) == "answer"
+
+
+def test_async_stream_fans_out_chunks_and_error():
+    async def main():
+        flight = AsyncSingleFlight()
+
+        async def upstream():
+            for chunk in ("a", "b", "c"):
+                await asyncio.sleep(0)
+                yield chunk
+            raise ConnectionError("reset")
+
+        async def collect(subscriber):
+            chunks = []
+            try:
+                async for chunk in subscriber:
+                    chunks.append(chunk)
+            except ConnectionError as e:
+                return chunks, e
+            return chunks, None
+
+        subscribers = [flight.stream("k", upstream) for _ in range(3)]
+        return await asyncio.gather(*(collect(s) for s in subscribers))
+
+    for chunks, error in asyncio.run(main()):
+        assert chunks == ["a", "b", "c"]
+        assert isinstance(error, ConnectionError)
+
+
+def test_async_cancelled_pump_releases_subscribers():
+    async def main():
+        flight = AsyncSingleFlight()
+        hang = asyncio.Event()
+
+        async def upstream():
+            yield "a"
+            await hang.wait()
+            yield "never"
+
+        running = asyncio.all_tasks()
+        subscriber = flight.stream("k", upstream)
+        (pump,) = asyncio.all_tasks() - running
+        chunks = [await subscriber.__anext__()]
+        pump.cancel()
+        with pytest.raises(FlightCancelled):
+            async for chunk in subscriber:
+                chunks.append(chunk)
+        await asyncio.sleep(0)
+        return chunks, flight._streams
+
+    chunks, streams = asyncio.run(asyncio.wait_for(main(), 5))
+    assert chunks == ["a"]
+    assert streams == {}
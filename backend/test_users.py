@@ -0,0 +1,115 @@
+import pytest
+
+from backend import users
+from backend.database import get_db
+from backend.migrations import migrate
+from backend.users import has_other_admin, list_users
+
+NAMES = ["alice", "bob", "Carol", "dave", "Alicia", "mallory", "trent", "walice", "peggy", "victor"]
+
+
+@pytest.fixture
+def conn(tmp_path, monkeypatch):
+    monkeypatch.setattr(users, "_has_fts", None)
+    db = get_db(str(tmp_path / "app.db"))
+    migrate(db)
+    with db.transaction() as conn:
+        conn.executemany(
+            "INSERT INTO users (username, password_hash, is_admin) VALUES (?, 'x', ?)",
+            [(name, int(name == "trent")) for name in NAMES],
+        )
+    return db.connection()
+
+
+@pytest.fixture
+def fts(conn):
+    if not users._fts_enabled(conn):
+        pytest.skip("SQLite built without FTS5 trigram support")
+
+
+def names(page):
+    return [u["username"] for u in page[0]]
+
+
+def test_first_page_and_cursors(conn):
+    page, next_after, prev_before = list_users(conn, limit=4)
+    assert [u["username"] for u in page] == NAMES[:4]
+    assert next_after == page[-1]["id"]
+    assert prev_before is None
+
+
+def test_walk_forward_then_back(conn):
+    pages, after = [], None
+    while True:
+        page, after, prev_before = list_users(conn, after=after, limit=4)
+        pages.append((page, prev_before))
+        if after is None:
+            break
+    assert [[u["username"] for u in page] for page, _ in pages] == [NAMES[:4], NAMES[4:8], NAMES[8:]]
+
+    prev_before = pages[-1][1]
+    page, next_after, prev_before = list_users(conn, before=prev_before, limit=4)
+    assert [u["username"] for u in page] == NAMES[4:8]
+    assert next_after == page[-1]["id"]
+    page, next_after, prev_before = list_users(conn, before=prev_before, limit=4)
+    assert [u["username"] for u in page] == NAMES[:4]
+    assert prev_before is None
+
+
+def test_past_the_end_is_empty(conn):
+    last_id = list_users(conn, limit=200)[0][-1]["id"]
+    assert list_users(conn, after=last_id) == ([], None, None)
+
+
+def test_limit_is_clamped(conn):
+    assert len(list_users(conn, limit=0)[0]) == 1
+    assert len(list_users(conn, limit=10_000)[0]) == len(NAMES)
+
+
+def test_fields(conn):
+    trent = next(u for u in list_users(conn)[0] if u["username"] == "trent")
+    assert trent["is_admin"] is True
+    assert trent["created_at"]
+
+
+def test_short_query_is_case_insensitive_prefix(conn):
+    assert names(list_users(conn, query="al")) == ["alice", "Alicia"]
+    assert names(list_users(conn, query=" C ")) == ["Carol"]
+
+
+def test_trigram_search_matches_substrings(conn, fts):
+    assert names(list_users(conn, query="lic")) == ["alice", "Alicia", "walice"]
+    assert names(list_users(conn, query="ALICE")) == ["alice", "walice"]
+    assert names(list_users(conn, query="zzz")) == []
+
+
+def test_trigram_search_quotes_fts_syntax(conn, fts):
+    assert names(list_users(conn, query='al" OR "bob')) == []
+
+
+def test_search_results_paginate(conn, fts):
+    page, next_after, _ = list_users(conn, query="lic", limit=2)
+    assert [u["username"] for u in page] == ["alice", "Alicia"]
+    page, next_after, prev_before = list_users(conn, query="lic", after=next_after, limit=2)
+    assert [u["username"] for u in page] == ["walice"]
+    assert next_after is None
+    assert prev_before == page[0]["id"]
+
+
+def test_trigram_index_follows_renames_and_deletes(conn, fts):
+    conn.execute("UPDATE users SET username = 'malice' WHERE username = 'mallory'")
+    conn.execute("DELETE FROM users WHERE username = 'walice'")
+    conn.commit()
+    assert names(list_users(conn, query="lic")) == ["alice", "Alicia", "malice"]
+
+
+def test_without_fts_substring_query_falls_back_to_prefix(conn, monkeypatch):
+    monkeypatch.setattr(users, "_has_fts", False)
+    assert names(list_users(conn, query="lic")) == []
+    assert names(list_users(conn, query="ali")) == ["alice", "Alicia"]
+
+
+def test_has_other_admin(conn):
+    trent = next(u["id"] for u in list_users(conn)[0] if u["username"] == "trent")
+    assert not has_other_admin(conn, trent)
+    assert has_other_admin(conn, trent + 1)
@@ -0,0 +1,221 @@
+"""
+Text-to-speech on one long-lived worker thread.
+
+The pyttsx3 engine is created once, on the worker thread (SAPI5 is bound to
+the thread that initialized it). Its voice and rate are set once, before
+the first utterance. Callers only enqueue: `speak()` returns immediately
+with an Utterance handle that can be waited on, awaited or cancelled.
+
+- Utterances are spoken in priority order (lower first), FIFO within a
+  priority.
+- `cancel()` drops an utterance that has not started. For one being spoken,
+  the engine is stopped at the next word boundary.
+- `stop_speaking()` cancels everything queued and cuts off the current
+  utterance, e.g. when the user starts a new command.
+
+Known phrases ("Welcome to Jarvis", "Opening {app}", ...) are played from
+pre-rendered WAVs when backend/phrase_cache.py has them. A phrase that was
+missed is rendered after it has been spoken, as a background job that runs
+behind all queued speech.
+
+pyttsx3 is imported on the worker thread, so importing this module needs no
+audio stack.
+"""
+import atexit
+import asyncio
+import itertools
+import threading
+import queue
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+
+from backend import config
+from backend.phrase_cache import phrase_cache_from_env
+
+URGENT = 0
+NORMAL = 5
+LOW = 9
+RENDER = 10  # background cache rendering, behind all speech
+
+
+class Utterance:
+    """Handle for one queued phrase; resolves to True when spoken in full, False if cancelled or failed."""
+
+    def __init__(self, text, priority=NORMAL, render=False):
+        self.text = text
+        self.priority = priority
+        self.render = render  # write to the phrase cache instead of speaking
+        self.future = Future()
+        self.cancelled = False
+        self._started = False
+        self._lock = threading.Lock()
+
+    def _start(self):
+        """Claim the utterance for speaking; False if it was cancelled first."""
+        with self._lock:
+            if self.cancelled:
+                return False
+            self._started = True
+            return True
+
+    def _finish(self, spoken):
+        if not self.future.done():
+            self.future.set_result(spoken)
+
+    def cancel(self):
+        with self._lock:
+            self.cancelled = True
+            if not self._started:
+                self._finish(False)
+
+    @property
+    def done(self):
+        return self.future.done()
+
+    def wait(self, timeout=None):
+        """Block until spoken (True), cancelled (False), or `timeout` passes (None)."""
+        try:
+            return self.future.result(timeout)
+        except FutureTimeout:
+            return None
+
+    def __await__(self):
+        return asyncio.wrap_future(self.future).__await__()
+
+
+class SpeechWorker:
+    def __init__(self, driver=None, voice_index=None, rate=None, cache=None):
+        self.driver = driver
+        self.voice_index = voice_index
+        self.rate = rate
+        self.cache = cache
+        self._queue = queue.PriorityQueue()
+        self._seq = itertools.count()
+        self._pending = set()
+        self._current = None
+        self._engine = None
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="tts", daemon=True)
+        self._thread.start()
+
+    def say(self, text, priority=NORMAL, interrupt=False):
+        if interrupt:
+            self.stop()
+        utterance = Utterance(text, priority)
+        with self._lock:
+            self._pending.add(utterance)
+        self._queue.put((priority, next(self._seq), utterance))
+        return utterance
+
+    def prerender(self, texts):
+        """Queue known phrases for rendering into the cache; returns one handle per distinct phrase."""
+        jobs = []
+        for text in dict.fromkeys(texts):
+            utterance = Utterance(text, RENDER, render=True)
+            self._queue.put((RENDER, next(self._seq), utterance))
+            jobs.append(utterance)
+        return jobs
+
+    def stop(self):
+        """Cancel everything queued and cut off the utterance being spoken."""
+        with self._lock:
+            pending, self._pending = self._pending, set()
+            current = self._current
+        for utterance in pending:
+            utterance.cancel()
+        if current is not None:
+            current.cancel()
+
+    def shutdown(self, timeout=2.0):
+        self.stop()
+        self._queue.put((float("inf"), next(self._seq), None))
+        self._thread.join(timeout)
+
+    def _init_engine(self):
+        import pyttsx3
+        engine = pyttsx3.init(self.driver) if self.driver else pyttsx3.init()
+        voices = engine.getProperty('voices')
+        if voices and self.voice_index is not None:
+            engine.setProperty('voice', voices[min(self.voice_index, len(voices) - 1)].id)
+        if self.rate:
+            engine.setProperty('rate', self.rate)
+        engine.connect('started-word', self._on_word)
+        if self.cache is not None:
+            self.cache.voice = f"{self.driver}|{engine.getProperty('voice')}|{engine.getProperty('rate')}"
+        return engine
+
+    def _on_word(self, name, location, length):
+        # Runs on this thread inside runAndWait(), the one safe place to stop the engine
+        current = self._current
+        if current is not None and current.cancelled:
+            self._engine.stop()
+
+    def _run(self):
+        try:
+            self._engine = self._init_engine()
+        except Exception as e:
+            print(f"Text-to-speech unavailable: {e}")
+        while True:
+            _, _, utterance = self._queue.get()
+            if utterance is None:
+                break
+            if utterance.render:
+                utterance._finish(self._render(utterance.text))
+                continue
+            with self._lock:
+                self._pending.discard(utterance)
+                if not utterance._start():
+                    continue
+                self._current = utterance
+            spoken = False
+            try:
+                spoken = self._speak(utterance)
+            except Exception as e:
+                print(f"Text-to-speech error: {e}")
+            finally:
+                with self._lock:
+                    self._current = None
+                utterance._finish(spoken)
+
+    def _speak(self, utterance):
+        text = utterance.text
+        path = self.cache.lookup(text) if self.cache is not None and self._engine is not None else None
+        if path is not None:
+            try:
+                return self.cache.play(path, lambda: utterance.cancelled)
+            except Exception as e:
+                print(f"Cached phrase playback failed, synthesizing: {e}")
+        if self._engine is None:
+            return False
+        self._engine.say(text)
+        self._engine.runAndWait()
+        if self.cache is not None and path is None and self.cache.wants(text):
+            self._queue.put((RENDER, next(self._seq), Utterance(text, RENDER, render=True)))
+        return not utterance.cancelled
+
+    def _render(self, text):
+        if self._engine is None or self.cache is None or not self.cache.wants(text):
+            return False
+        if self.cache.lookup(text) is not None:
+            return True
+        try:
+            self.cache.render(self._engine, text)
+            return True
+        except Exception as e:
+            print(f"Could not cache {text!r}: {e}")
+            return False
+
+
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def get_speech_worker():
+    """The process-wide speech worker, started on first use."""
+    global _worker
+    if _worker is None:
+        with _worker_lock:
+            if _worker is None:
+                _worker = SpeechWorker(config.TTS_DRIVER, config.TTS_VOICE_INDEX, config.TTS_RATE,
+                                       cache=phrase_cache_from_env())
+                atexit.register(_worker.shutdown)
+    return _worker
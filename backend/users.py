@@ -0,0 +1,125 @@
+"""
+User listing queries for the admin dashboard.
+
+Pages are keyset-paginated on `id` (WHERE id > last-seen id LIMIT n), so the
+cost of a page does not grow with how deep into the table it is. Username
+search is index-backed: a case-insensitive prefix range on a NOCASE index,
+and, where SQLite ships FTS5, substring search through a trigram index kept
+in sync by triggers.
+"""
+import sqlite3
+
+MAX_PAGE_SIZE = 200
+# Trigram matching needs at least three characters; shorter queries use the prefix index
+MIN_SUBSTRING_QUERY = 3
+
+_has_fts = None
+
+
+def ensure_user_indexes(conn):
+    """Create the listing indexes (and the FTS table with its triggers) if missing."""
+    global _has_fts
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_users_username_nocase ON users (username COLLATE NOCASE)")
+    # Partial index: counting admins touches only admin rows
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_users_admins ON users (id) WHERE is_admin = 1")
+    existed = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'users_fts'").fetchone() is not None
+    try:
+        conn.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS users_fts "
+            "USING fts5(username, content='users', content_rowid='id', tokenize='trigram')"
+        )
+    except sqlite3.OperationalError as e:
+        print("Username substring search unavailable (no FTS5 trigram support):", e)
+        _has_fts = False
+        return
+    # One execute() per statement: executescript() would COMMIT the caller's migration transaction first
+    conn.execute(
+        """
+        CREATE TRIGGER IF NOT EXISTS users_fts_insert AFTER INSERT ON users BEGIN
+            INSERT INTO users_fts (rowid, username) VALUES (new.id, new.username);
+        END
+        """
+    )
+    conn.execute(
+        """
+        CREATE TRIGGER IF NOT EXISTS users_fts_delete AFTER DELETE ON users BEGIN
+            INSERT INTO users_fts (users_fts, rowid, username) VALUES ('delete', old.id, old.username);
+        END
+        """
+    )
+    conn.execute(
+        """
+        CREATE TRIGGER IF NOT EXISTS users_fts_update AFTER UPDATE OF username ON users BEGIN
+            INSERT INTO users_fts (users_fts, rowid, username) VALUES ('delete', old.id, old.username);
+            INSERT INTO users_fts (rowid, username) VALUES (new.id, new.username);
+        END
+        """
+    )
+    if not existed:
+        # Index the users that predate the FTS table
+        conn.execute("INSERT INTO users_fts (users_fts) VALUES ('rebuild')")
+    _has_fts = True
+
+
+def _fts_enabled(conn):
+    global _has_fts
+    if _has_fts is None:
+        # The schema was set up by an earlier run (see backend.migrations)
+        _has_fts = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'users_fts'").fetchone() is not None
+    return _has_fts
+
+
+def _search_clause(conn, query):
+    if not query:
+        return "", ()
+    if len(query) >= MIN_SUBSTRING_QUERY and _fts_enabled(conn):
+        phrase = '"' + query.replace('"', '""') + '"'
+        return "id IN (SELECT rowid FROM users_fts WHERE users_fts MATCH ?)", (phrase,)
+    # Case-insensitive prefix as a range, so the NOCASE index is used
+    return "username >= ? COLLATE NOCASE AND username < ? COLLATE NOCASE", (query, query + "\U0010ffff")
+
+
+def list_users(conn, after=None, before=None, query=None, limit=50):
+    """One page of users ordered by id.
+
+    Returns (users, next_after, prev_before): pass `next_after` as `after`
+    for the following page and `prev_before` as `before` for the previous
+    one; either is None at the respective end.
+    """
+    limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+    where, params = _search_clause(conn, (query or "").strip())
+    clauses = [where] if where else []
+    if before is not None:
+        clauses.append("id < ?")
+        params += (before,)
+        order = "DESC"
+    else:
+        if after is not None:
+            clauses.append("id > ?")
+            params += (after,)
+        order = "ASC"
+    sql = "SELECT id, username, COALESCE(is_admin, 0), created_at FROM users"
+    if clauses:
+        sql += " WHERE " + " AND ".join(clauses)
+    # One extra row tells whether there is another page in this direction
+    sql += f" ORDER BY id {order} LIMIT ?"
+    rows = conn.execute(sql, params + (limit + 1,)).fetchall()
+    more = len(rows) > limit
+    rows = rows[:limit]
+    if before is not None:
+        rows.reverse()
+    users = [{"id": r[0], "username": r[1], "is_admin": bool(r[2]), "created_at": r[3]} for r in rows]
+    if not users:
+        return users, None, None
+    if before is not None:
+        next_after, prev_before = users[-1]["id"], users[0]["id"] if more else None
+    else:
+        next_after = users[-1]["id"] if more else None
+        prev_before = users[0]["id"] if after is not None else None
+    return users, next_after, prev_before
+
+
+def has_other_admin(conn, user_id):
+    """True if some admin other than `user_id` exists (reads at most two index entries)."""
+    rows = conn.execute("SELECT id FROM users WHERE is_admin = 1 LIMIT 2").fetchall()
+    return any(r[0] != user_id for r in rows)
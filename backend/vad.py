@@ -0,0 +1,119 @@
+"""
+Voice activity gate in front of the keyword engine.
+
+Most of an always-on listener's audio is room tone, and running the
+keyword engine on it burns a core for nothing. The gate does a cheap
+vectorized check of every frame first. The check uses RMS energy against
+an adaptive noise floor, plus the zero-crossing rate so that quiet
+fricatives still count. Only frames that look like speech go to the
+engine.
+
+- The noise floor tracks the quietest recent frames. It drops at once and
+  rises over about 15 s, so speech does not drag it up but a room that
+  gets louder is relearned.
+- Pre-roll: the last `preroll_ms` of gated-out audio is kept in a small
+  preallocated buffer. It is replayed ahead of the frame that opens the
+  gate, so the start of an utterance that begins just after silence still
+  reaches the engine.
+- Hangover: the gate stays open for `hangover_ms` after the last active
+  frame, covering short pauses inside a phrase.
+
+The level check and the pre-roll copy write into preallocated buffers.
+`push()` is still a generator, so each call creates one generator object.
+What it yields are views (the caller's frame or pre-roll rows), not new
+arrays, and they are only valid until the next push.
+"""
+import numpy as np
+
+from backend import config
+
+
+class VADGate:
+    def __init__(self, sample_rate, frame_length, margin_db=6.0, min_db=-60.0, zcr_min=0.25,
+                 preroll_ms=400, hangover_ms=500):
+        self.frame_length = frame_length
+        frame_ms = 1000.0 * frame_length / sample_rate
+        self.margin_db = margin_db
+        self.min_db = min_db  # frames quieter than this are never speech
+        self.zcr_min = zcr_min
+        self.preroll_frames = int(round(preroll_ms / frame_ms))
+        self.hangover_frames = int(round(hangover_ms / frame_ms))
+        self.noise_db = None
+        self.frames_seen = 0
+        self.frames_passed = 0
+        self._float = np.zeros(frame_length, dtype=np.float32)
+        self._sign = np.zeros(frame_length, dtype=bool)
+        self._cross = np.zeros(frame_length - 1, dtype=bool)
+        self._preroll = np.zeros((max(self.preroll_frames, 1), frame_length), dtype=np.int16)
+        self.reset()
+
+    def reset(self):
+        """Close the gate and forget buffered pre-roll (keeps the learned noise floor)."""
+        self._hang = 0
+        self._stored = 0
+        self._next = 0
+
+    def level(self, frame):
+        """(energy in dBFS, zero-crossing rate) of an int16 frame."""
+        np.copyto(self._float, frame)
+        energy = float(np.dot(self._float, self._float)) / self.frame_length
+        db = 10.0 * np.log10(energy / (32768.0 * 32768.0) + 1e-12)
+        np.signbit(frame, out=self._sign)
+        np.not_equal(self._sign[1:], self._sign[:-1], out=self._cross)
+        return db, np.count_nonzero(self._cross) / (self.frame_length - 1)
+
+    def is_speech(self, frame):
+        db, zcr = self.level(frame)
+        if self.noise_db is None:
+            self.noise_db = db
+        threshold = max(self.noise_db + self.margin_db, self.min_db)
+        active = db > threshold or (db > threshold - self.margin_db / 2 and zcr >= self.zcr_min)
+        # Minimum tracking: fall to quieter frames at once, rise slowly (~15 s) with anything louder
+        rate = 0.2 if db < self.noise_db else 0.002
+        self.noise_db += (db - self.noise_db) * rate
+        return active
+
+    def filter(self, frames):
+        """Yield the frames the keyword engine should see, pre-roll included."""
+        for frame in frames:
+            yield from self.push(frame)
+
+    def push(self, frame):
+        """Yield what the engine should see for this one frame: nothing, the frame, or pre-roll then the frame."""
+        self.frames_seen += 1
+        if self.is_speech(frame):
+            if not self._hang:
+                yield from self._replay()
+            self._hang = self.hangover_frames + 1
+        if self._hang:
+            self._hang -= 1
+            self.frames_passed += 1
+            yield frame
+        elif self.preroll_frames:
+            np.copyto(self._preroll[self._next], frame)
+            self._next = (self._next + 1) % self.preroll_frames
+            self._stored = min(self._stored + 1, self.preroll_frames)
+
+    def _replay(self):
+        start = (self._next - self._stored) % self.preroll_frames if self.preroll_frames else 0
+        for i in range(self._stored):
+            self.frames_passed += 1
+            yield self._preroll[(start + i) % self.preroll_frames]
+        self._stored = 0
+
+    @property
+    def pass_ratio(self):
+        return self.frames_passed / self.frames_seen if self.frames_seen else 0.0
+
+
+def vad_gate_from_env(sample_rate, frame_length):
+    """The hotword VAD gate from HOTWORD_VAD* settings, or None when HOTWORD_VAD=0."""
+    if not config.HOTWORD_VAD:
+        return None
+    return VADGate(
+        sample_rate,
+        frame_length,
+        margin_db=config.HOTWORD_VAD_MARGIN_DB,
+        preroll_ms=config.HOTWORD_VAD_PREROLL_MS,
+        hangover_ms=config.HOTWORD_VAD_HANGOVER_MS,
+    )
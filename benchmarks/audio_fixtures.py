@@ -0,0 +1,66 @@
+"""
+Synthetic 16 kHz mono WAV fixtures for the audio benchmarks.
+
+Real recordings can be passed to the benchmarks instead. These stand in for
+a kiosk's day: mostly room tone, with occasional speech-like bursts (a
+voiced tone with harmonics and a syllable-rate envelope) at a given duty
+cycle. They are generated from a fixed seed, so runs are comparable.
+
+    python benchmarks/audio_fixtures.py out.wav --seconds 60 --speech 0.1
+"""
+import wave
+import argparse
+
+import numpy as np
+
+SAMPLE_RATE = 16000
+
+
+def synth(seconds=60.0, speech=0.1, noise_dbfs=-60.0, speech_dbfs=-20.0, sample_rate=SAMPLE_RATE, seed=7,
+          mask=False):
+    """int16 samples: background noise with speech-like bursts covering `speech` of the time.
+
+    Each burst fades in from silence, so its first tens of milliseconds are
+    barely above the noise. With `mask`, also return a per-sample bool
+    array that is True inside bursts.
+    """
+    rng = np.random.default_rng(seed)
+    n = int(seconds * sample_rate)
+    noise = rng.normal(0.0, 10 ** (noise_dbfs / 20) * 32767, n)
+    signal = np.zeros(n)
+    in_speech = np.zeros(n, dtype=bool)
+    if speech > 0:
+        burst = int(1.5 * sample_rate)
+        gap = int(burst * (1 - speech) / speech)
+        t = np.arange(burst) / sample_rate
+        for start in range(gap // 2, n - burst, burst + gap):
+            pitch = rng.uniform(100, 220)
+            voiced = sum(np.sin(2 * np.pi * pitch * k * t) / k for k in range(1, 6))
+            syllables = 0.5 * (1 - np.cos(2 * np.pi * 4 * t))  # ~4 syllables per second
+            signal[start:start + burst] = voiced * syllables
+            in_speech[start:start + burst] = True
+        signal *= 10 ** (speech_dbfs / 20) * 32767 / max(np.abs(signal).max(), 1e-9)
+    pcm = np.clip(noise + signal, -32768, 32767).astype(np.int16)
+    return (pcm, in_speech) if mask else pcm
+
+
+def write_wav(path, pcm, sample_rate=SAMPLE_RATE):
+    with wave.open(path, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes(pcm.tobytes())
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("path")
+    parser.add_argument("--seconds", type=float, default=60.0)
+    parser.add_argument("--speech", type=float, default=0.1, help="fraction of time with speech")
+    args = parser.parse_args()
+    write_wav(args.path, synth(args.seconds, args.speech))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Per-frame cost of the hotword front-end, old versus new, without a microphone.
+
+Both paths consume the same WAV in Porcupine-sized frames (512 samples at
+16 kHz) and stop at the point where the keyword engine would read the
+samples:
+
+- struct:  what hotword() used to do. Blocking reads return fresh bytes,
+           `struct.unpack_from("h" * n)` turns them into a tuple, and
+           pvporcupine's process() unpacks that into a new ctypes array.
+- ring:    backend.audio.WavSource feeds a preallocated ring from its own
+           thread. Frames are int16 views, handed over as a pointer the way
+           porcupine_processor() does.
+
+pvporcupine itself is not needed; its marshalling step is reproduced so the
+comparison covers everything up to the native call.
+
+    python benchmarks/hotword_frontend.py [recording.wav] [--frames 20000]
+"""
+import os
+import sys
+import time
+import ctypes
+import struct
+import argparse
+import tempfile
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+from audio_fixtures import synth, write_wav  # noqa: E402
+from backend.audio import WavSource  # noqa: E402
+
+FRAME_LENGTH = 512
+
+
+def legacy(pcm_bytes, frames):
+    frame_bytes = FRAME_LENGTH * 2
+    total = len(pcm_bytes) // frame_bytes
+    checksum = 0
+    for i in range(frames):
+        offset = (i % total) * frame_bytes
+        data = pcm_bytes[offset:offset + frame_bytes]           # stream.read() returns new bytes
+        pcm = struct.unpack_from("h" * FRAME_LENGTH, data)    # the old per-frame conversion
+        native = (ctypes.c_short * len(pcm))(*pcm)            # pvporcupine.process() marshalling
+        checksum += native[0]
+    return checksum
+
+
+def ring(source, frames):
+    short_p = ctypes.POINTER(ctypes.c_short)
+    checksum = 0
+    with source:
+        for i, frame in enumerate(source.frames()):
+            pointer = frame.ctypes.data_as(short_p)
+            checksum += pointer[0]
+            if i + 1 >= frames:
+                break
+    return checksum
+
+
+def measure(setup, fn, frames):
+    """(seconds, peak traced bytes) for `frames` frames; loading the audio is not counted."""
+    subject = setup()
+    tracemalloc.start()
+    fn(subject, frames)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    # Separate untraced run for timing; tracemalloc slows allocation-heavy code disproportionately
+    subject = setup()
+    started = time.perf_counter()
+    fn(subject, frames)
+    return time.perf_counter() - started, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("wav", nargs="?", help="16-bit mono 16 kHz recording (default: synthetic fixture)")
+    parser.add_argument("--frames", type=int, default=20000)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        path = args.wav or write_wav(os.path.join(tmp, "fixture.wav"), synth(seconds=30))
+        pcm_bytes = WavSource(path, FRAME_LENGTH).pcm.tobytes()
+        frame_ms = FRAME_LENGTH / 16.0
+        print(f"{args.frames} frames of {FRAME_LENGTH} samples ({frame_ms:g} ms each)\n")
+        print("| path | us/frame | share of a core | peak traced memory |")
+        print("|---|---|---|---|")
+        paths = (
+            ("struct", lambda: pcm_bytes, legacy),
+            ("ring", lambda: WavSource(path, FRAME_LENGTH, loop=True), ring),
+        )
+        for name, setup, fn in paths:
+            elapsed, peak = measure(setup, fn, args.frames)
+            per_frame = elapsed / args.frames * 1e6
+            print(f"| {name} | {per_frame:.1f} | {per_frame / (frame_ms * 1000):.2%} | {peak / 1024:.0f} KiB |")
+
+
+if __name__ == "__main__":
+    main()
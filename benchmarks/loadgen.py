@@ -0,0 +1,331 @@
+"""
+Closed-loop load generator for POST /chat.
+
+`--concurrency` virtual users each send a request, wait for the full reply
+(the end of the SSE stream with --stream), and send the next, for
+`--duration` seconds after a `--warmup`. Reported per run: requests per
+second, latency p50/p95/p99/max, time to first token (first SSE delta) and
+failures by status.
+
+Against a running server:
+
+    python benchmarks/loadgen.py --url http://127.0.0.1:5000 --username bench --password ...
+
+Or let it start benchmarks/stub_llm.py and the app on a throwaway database,
+once per serving mode, and compare them:
+
+    python benchmarks/loadgen.py --serve wsgi --serve asgi --concurrency 32 --stream
+    python benchmarks/loadgen.py --serve asgi --stub-set ttft=lognormal:1:0.5 --model gpt-5 --model sonar
+
+Rate limits are off in --serve mode; every message is unique so the
+response cache stays cold unless --same-message is given. --json writes
+the summary; --compare reads an earlier one and exits non-zero when
+throughput or p95 latency regressed by more than --tolerance.
+"""
+import os
+import sys
+import json
+import math
+import time
+import uuid
+import socket
+import asyncio
+import argparse
+import platform
+import tempfile
+import subprocess
+from contextlib import contextmanager
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+from stub_llm import app_env  # noqa: E402
+
+SERVE_COMMANDS = {
+    "wsgi": ["-m", "gunicorn", "app:app", "--workers", "{workers}", "--threads", "{threads}",
+             "--worker-class", "gthread"],
+    "asgi": ["-m", "gunicorn", "asgi:app", "--workers", "{workers}", "--worker-class", "uvicorn.workers.UvicornWorker"],
+    "flask": ["app.py"],
+}
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a sorted list, or None when empty."""
+    if not values:
+        return None
+    return values[max(0, math.ceil(pct / 100.0 * len(values)) - 1)]
+
+
+class Results:
+    def __init__(self):
+        self.latencies = []
+        self.ttfts = []
+        self.failures = {}
+        self.started = self.finished = None
+
+    def record(self, status, latency, ttft=None):
+        if self.started is None:
+            return
+        if status == 200:
+            self.latencies.append(latency)
+            if ttft is not None:
+                self.ttfts.append(ttft)
+        else:
+            self.failures[str(status)] = self.failures.get(str(status), 0) + 1
+
+    def summary(self):
+        latencies, ttfts = sorted(self.latencies), sorted(self.ttfts)
+        elapsed = (self.finished or time.perf_counter()) - self.started
+
+        def ms(value):
+            return None if value is None else round(value * 1000, 1)
+
+        def percentiles(values):
+            return {f"p{p}": ms(percentile(values, p)) for p in (50, 95, 99)}
+
+        return {
+            "ok": len(latencies),
+            "failed": sum(self.failures.values()),
+            "failures": self.failures,
+            "seconds": round(elapsed, 2),
+            "rps": round(len(latencies) / elapsed, 2) if elapsed > 0 else 0.0,
+            "latency_ms": dict(percentiles(latencies), max=ms(latencies[-1] if latencies else None)),
+            "ttft_ms": percentiles(ttfts) if ttfts else None,
+        }
+
+
+async def login(client, username, password):
+    response = await client.post("/login", data={"username": username, "password": password})
+    if response.status_code != 302 or "session" not in client.cookies:
+        raise SystemExit(f"login as {username!r} failed ({response.status_code})")
+
+
+async def one_request(client, payload, stream):
+    """Send one chat request; returns (status, seconds, seconds to first delta or None)."""
+    started = time.perf_counter()
+    if not stream:
+        response = await client.post("/chat", json=payload)
+        return response.status_code, time.perf_counter() - started, None
+    ttft = None
+    status = None
+    async with client.stream("POST", "/chat?stream=1", json=payload) as response:
+        status = response.status_code
+        event = None
+        async for line in response.aiter_lines():
+            if line.startswith("event:"):
+                event = line[6:].strip()
+            elif line.startswith("data:"):
+                if event == "error":
+                    status = "stream-error"
+                elif ttft is None and event is None and '"delta"' in line:
+                    ttft = time.perf_counter() - started
+                event = None
+    return status, time.perf_counter() - started, ttft
+
+
+async def virtual_user(client, index, args, results, stop_at):
+    n = 0
+    while time.perf_counter() < stop_at:
+        model = args.model[(index + n) % len(args.model)] if args.model else None
+        message = args.message if args.same_message else f"{args.message} [{index}.{n}.{uuid.uuid4().hex[:8]}]"
+        payload = {"message": message}
+        if model:
+            payload["model"] = model
+        try:
+            status, latency, ttft = await one_request(client, payload, args.stream)
+        except Exception as e:
+            status, latency, ttft = type(e).__name__, 0.0, None
+        results.record(status, latency, ttft)
+        n += 1
+
+
+async def run_load(base_url, args):
+    import httpx
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    timeout = httpx.Timeout(args.timeout)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=timeout) as client:
+        await login(client, args.username, args.password)
+        results = Results()
+        begin = time.perf_counter()
+        stop_at = begin + args.warmup + args.duration
+
+        async def start_measuring():
+            await asyncio.sleep(args.warmup)
+            results.started = time.perf_counter()
+
+        users = [virtual_user(client, i, args, results, stop_at) for i in range(args.concurrency)]
+        await asyncio.gather(start_measuring(), *users)
+        results.finished = time.perf_counter()
+        return results.summary()
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_until_up(url, proc, timeout=60):
+    import httpx
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise SystemExit(f"{' '.join(proc.args)} exited with {proc.returncode}")
+        try:
+            httpx.get(url, timeout=1)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    raise SystemExit(f"{url} did not come up within {timeout}s")
+
+
+@contextmanager
+def process(args, url, log_path=None, **kwargs):
+    proc = subprocess.Popen([sys.executable] + args, cwd=ROOT, **kwargs)
+    try:
+        try:
+            wait_until_up(url, proc)
+        except SystemExit as e:
+            if log_path:
+                with open(log_path, errors="replace") as f:
+                    raise SystemExit(f"{e}\n{f.read()[-3000:]}")
+            raise
+        yield proc
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+
+def serve_env(tmp, stub_url, port, args):
+    env = dict(os.environ)
+    env.update(app_env(stub_url))
+    env.update(
+        PORT=str(port),
+        LLM_PROVIDER="copilot",
+        SECRET_KEY="benchmark",
+        ADMIN_USERNAME=args.username,
+        ADMIN_PASSWORD=args.password,
+        DB_PATH=os.path.join(tmp, "jarvis.db"),
+        RATE_LIMIT="0",
+        LOG_FILE=os.path.join(tmp, "requests.log"),
+        METRICS_DIR=os.path.join(tmp, "metrics"),
+    )
+    for item in args.env:
+        key, _, value = item.partition("=")
+        env[key] = value
+    return env
+
+
+def run_served(mode, args, stub_url):
+    port = free_port()
+    command = [part.format(workers=args.workers, threads=args.threads) for part in SERVE_COMMANDS[mode]]
+    if command[:2] == ["-m", "gunicorn"]:
+        command += ["--bind", f"127.0.0.1:{port}", "--timeout", str(int(args.timeout) + 30)]
+    with tempfile.TemporaryDirectory() as tmp:
+        env = serve_env(tmp, stub_url, port, args)
+        base_url = f"http://127.0.0.1:{port}"
+        log_path = os.path.join(tmp, "server.log")
+        with open(log_path, "w") as log:
+            with process(command, f"{base_url}/login", log_path, env=env, stdout=log, stderr=subprocess.STDOUT):
+                return asyncio.run(run_load(base_url, args))
+
+
+def render(results, args):
+    mode = f"{'streaming' if args.stream else 'non-streaming'}, concurrency {args.concurrency}, {args.duration:g}s"
+    lines = [
+        f"# /chat load test ({mode})",
+        "",
+        f"Models: {', '.join(args.model) if args.model else 'server default'}."
+        f" Python {platform.python_version()} on {platform.system()} {platform.machine()}.",
+        "",
+        "| run | rps | ok | failed | p50 | p95 | p99 | max | TTFT p50 | TTFT p95 | TTFT p99 |",
+        "|---|---|---|---|---|---|---|---|---|---|---|",
+    ]
+
+    def cell(value):
+        return "-" if value is None else f"{value:g} ms"
+
+    for name, s in results.items():
+        lat, ttft = s["latency_ms"], s["ttft_ms"] or {}
+        failed = f"{s['failed']} {s['failures']}" if s["failed"] else "0"
+        lines.append(
+            f"| {name} | {s['rps']:g} | {s['ok']} | {failed} | {cell(lat['p50'])} | {cell(lat['p95'])} "
+            f"| {cell(lat['p99'])} | {cell(lat['max'])} | {cell(ttft.get('p50'))} | {cell(ttft.get('p95'))} "
+            f"| {cell(ttft.get('p99'))} |"
+        )
+    return "\n".join(lines) + "\n"
+
+
+def regressions(results, baseline, tolerance):
+    """Human-readable list of runs whose rps or p95 got worse than `baseline` by more than `tolerance`."""
+    found = []
+    for name, s in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        if base["rps"] and s["rps"] < base["rps"] * (1 - tolerance):
+            found.append(f"{name}: rps {s['rps']:g} < baseline {base['rps']:g}")
+        p95, base_p95 = s["latency_ms"]["p95"], base["latency_ms"]["p95"]
+        if p95 is not None and base_p95 and p95 > base_p95 * (1 + tolerance):
+            found.append(f"{name}: p95 {p95:g} ms > baseline {base_p95:g} ms")
+    return found
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--url", help="base URL of a running server")
+    target.add_argument("--serve", action="append", choices=sorted(SERVE_COMMANDS),
+                        help="start the stub upstreams and the app in this mode (repeat to compare)")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=20.0, help="measured seconds")
+    parser.add_argument("--warmup", type=float, default=3.0, help="unmeasured seconds before measuring")
+    parser.add_argument("--timeout", type=float, default=60.0, help="per-request timeout")
+    parser.add_argument("--stream", action="store_true", help="request SSE and measure time to first token")
+    parser.add_argument("--model", action="append", help="model to request (repeat to rotate across models)")
+    parser.add_argument("--message", default="Benchmark request: reply briefly.")
+    parser.add_argument("--same-message", action="store_true", help="send identical messages (response cache hits)")
+    parser.add_argument("--username", default="bench")
+    parser.add_argument("--password", default="bench-password")
+    parser.add_argument("--workers", type=int, default=2, help="--serve: gunicorn workers")
+    parser.add_argument("--threads", type=int, default=16, help="--serve: threads per wsgi worker")
+    parser.add_argument("--stub-set", action="append", default=[], metavar="[PROVIDER.]KEY=VALUE",
+                        help="--serve: stub profile setting (see stub_llm.py)")
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE", help="--serve: extra app environment")
+    parser.add_argument("--json", help="write the summary to this file")
+    parser.add_argument("--compare", help="summary JSON from an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="allowed regression for --compare (fraction)")
+    args = parser.parse_args(argv)
+
+    results = {}
+    if args.url:
+        results["server"] = asyncio.run(run_load(args.url.rstrip("/"), args))
+    else:
+        stub_port = free_port()
+        stub_url = f"http://127.0.0.1:{stub_port}"
+        stub_args = [os.path.join("benchmarks", "stub_llm.py"), "--port", str(stub_port)]
+        for item in args.stub_set:
+            stub_args += ["--set", item]
+        with process(stub_args, f"{stub_url}/healthz"):
+            for mode in args.serve:
+                results[mode] = run_served(mode, args, stub_url)
+                print(f"{mode}: {results[mode]['rps']:g} rps", file=sys.stderr)
+
+    print(render(results, args))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            found = regressions(results, json.load(f), args.tolerance)
+        for line in found:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        if found:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
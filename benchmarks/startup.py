@@ -0,0 +1,110 @@
+"""
+Cold-start benchmark for the web app.
+
+Imports `app` in fresh interpreters (as the serverless handlers do) and
+reports wall time plus the slowest imports from `python -X importtime`, for
+both the default start-up and LAZY_INIT=1. Each run uses a throwaway
+database that is migrated and seeded once beforehand, so the numbers reflect
+a warm-database cold start, the common case on a redeployed function.
+
+    python benchmarks/startup.py                  # print the report
+    python benchmarks/startup.py --write          # also update benchmarks/startup_report.md
+"""
+import os
+import sys
+import time
+import argparse
+import platform
+import compileall
+import statistics
+import subprocess
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+REPORT = os.path.join(ROOT, "benchmarks", "startup_report.md")
+IMPORT_APP = "import sys; sys.path.insert(0, {root!r}); import app".format(root=ROOT)
+
+
+def run(env, importtime=False):
+    """Import the app once in a new interpreter; returns (seconds, importtime stderr)."""
+    args = [sys.executable] + (["-X", "importtime"] if importtime else []) + ["-c", IMPORT_APP]
+    started = time.perf_counter()
+    proc = subprocess.run(args, env=env, cwd=ROOT, capture_output=True, text=True)
+    elapsed = time.perf_counter() - started
+    if proc.returncode != 0:
+        raise SystemExit(f"import app failed:\n{proc.stderr[-2000:]}")
+    return elapsed, proc.stderr
+
+
+def slowest_imports(stderr, top=15):
+    """Entries of an importtime report up to two levels deep, by cumulative microseconds.
+
+    Sorting breaks up the import tree, so rows are listed flat: a module's
+    cumulative time includes the rows for its own imports.
+    """
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        head, cumulative, name = line.split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        if depth <= 2:
+            rows.append((int(cumulative), int(head.split(":")[1]), name.strip()))
+    return sorted(rows, reverse=True)[:top]
+
+
+def measure(env, runs):
+    run(env)  # migrate and seed the throwaway database
+    times = [run(env)[0] for _ in range(runs)]
+    _, report = run(env, importtime=True)
+    return times, slowest_imports(report)
+
+
+def render(results, runs):
+    lines = [
+        "# Cold-start report",
+        "",
+        f"`import app` in a fresh interpreter, {runs} runs per mode, warm database.",
+        f"Python {platform.python_version()} on {platform.system()} {platform.machine()}.",
+        "Regenerate with `python benchmarks/startup.py --write`.",
+        "",
+        "| mode | median | min | max |",
+        "|---|---|---|---|",
+    ]
+    for mode, (times, _) in results.items():
+        lines.append(f"| {mode} | {statistics.median(times) * 1000:.0f} ms | {min(times) * 1000:.0f} ms "
+                     f"| {max(times) * 1000:.0f} ms |")
+    for mode, (_, imports) in results.items():
+        lines += ["", f"## Slowest imports ({mode})", "", "| module | cumulative | self |", "|---|---|---|"]
+        for cumulative, self_us, name in imports:
+            lines.append(f"| {name} | {cumulative / 1000:.1f} ms | {self_us / 1000:.1f} ms |")
+    return "\n".join(lines) + "\n"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--write", action="store_true", help=f"write the report to {os.path.relpath(REPORT, ROOT)}")
+    args = parser.parse_args()
+    # Deployed code starts from cached bytecode; write it even under PYTHONDONTWRITEBYTECODE
+    compileall.compile_file(os.path.join(ROOT, "app.py"), quiet=1)
+    compileall.compile_dir(os.path.join(ROOT, "backend"), quiet=1)
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        base = dict(
+            os.environ,
+            DB_PATH=os.path.join(tmp, "jarvis.db"),
+            LLM_PROVIDER=os.getenv("LLM_PROVIDER", "copilot"),
+            GITHUB_TOKEN=os.getenv("GITHUB_TOKEN", "benchmark"),
+        )
+        for mode, extra in (("default", {"LAZY_INIT": "0"}), ("LAZY_INIT=1", {"LAZY_INIT": "1"})):
+            results[mode] = measure(dict(base, **extra), args.runs)
+    report = render(results, args.runs)
+    print(report)
+    if args.write:
+        with open(REPORT, "w", encoding="utf-8") as f:
+            f.write(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,283 @@
+"""
+Local stand-ins for the upstream chat APIs, for load tests and benchmarks.
+
+One ASGI server answers in the wire formats the adapters in
+backend/providers.py speak, so the whole /chat pipeline runs without
+spending API quota:
+
+    POST /<provider>/chat/completions                        OpenAI-style (copilot, perplexity)
+    POST /openai/v1/chat/completions                         OpenAI SDK
+    POST /gemini/v1/models/<model>:generateContent           Gemini
+    POST /gemini/v1/models/<model>:streamGenerateContent?alt=sse
+    GET  /stats                                              requests / errors / streams per provider
+
+Point the app at it (loadgen.py --serve does this for you):
+
+    COPILOT_API_BASE=http://127.0.0.1:8900/copilot
+    PERPLEXITY_API_BASE=http://127.0.0.1:8900/perplexity
+    GEMINI_API_BASE=http://127.0.0.1:8900/gemini/v1
+    OPENAI_API_BASE=http://127.0.0.1:8900/openai/v1
+
+Each provider has a profile: time to first token, the gap between streamed
+chunks, reply length in chunks, and the fraction of requests that fail
+(with a status drawn from `error_statuses`). A non-streaming reply takes
+ttft + chunks * token_interval. Profiles are set with --set, either for all
+providers or for one:
+
+    python benchmarks/stub_llm.py --set ttft=lognormal:0.4:0.5 --set perplexity.error_rate=0.05
+
+Latency specs: `0.2` or `fixed:0.2`, `uniform:LOW:HIGH`,
+`lognormal:MEDIAN:SIGMA`, `normal:MEAN:SD`, `exp:MEAN` (seconds).
+"""
+import sys
+import json
+import math
+import time
+import random
+import asyncio
+import argparse
+
+PROVIDERS = ("copilot", "perplexity", "openai", "gemini")
+WORDS = ("the", "quick", "brown", "fox", "jumps", "over", "a", "lazy", "dog", "while", "Jarvis", "answers")
+
+
+def parse_latency(spec):
+    """Turn a latency spec into a zero-argument sampler returning seconds (never negative)."""
+    kind, _, rest = str(spec).partition(":")
+    try:
+        if not rest:
+            value = float(kind)
+            return lambda: value
+        args = [float(a) for a in rest.split(":")]
+        if kind == "fixed":
+            return lambda: args[0]
+        if kind == "uniform":
+            return lambda: random.uniform(args[0], args[1])
+        if kind == "lognormal":
+            mu = math.log(args[0])
+            return lambda: random.lognormvariate(mu, args[1])
+        if kind == "normal":
+            return lambda: max(0.0, random.gauss(args[0], args[1]))
+        if kind == "exp":
+            return lambda: random.expovariate(1.0 / args[0]) if args[0] > 0 else 0.0
+    except (ValueError, IndexError):
+        pass
+    raise ValueError(f"bad latency spec {spec!r}")
+
+
+class Profile:
+    """How one stub provider behaves."""
+
+    def __init__(self, ttft="lognormal:0.3:0.4", token_interval="uniform:0.01:0.03", chunks=40,
+                 error_rate=0.0, error_statuses="500,503,429"):
+        self.specs = {}
+        self.update(ttft=ttft, token_interval=token_interval, chunks=chunks,
+                    error_rate=error_rate, error_statuses=error_statuses)
+
+    def update(self, **settings):
+        for key, value in settings.items():
+            if key in ("ttft", "token_interval"):
+                setattr(self, key, parse_latency(value))
+            elif key == "chunks":
+                value = int(value)
+                self.chunks = value
+            elif key == "error_rate":
+                value = float(value)
+                self.error_rate = value
+            elif key == "error_statuses":
+                self.error_statuses = [int(s) for s in str(value).split(",") if s.strip()]
+            else:
+                raise ValueError(f"unknown profile setting {key!r}")
+            self.specs[key] = value
+
+    def reply(self):
+        return [WORDS[i % len(WORDS)] + " " for i in range(self.chunks)]
+
+    def failure(self):
+        """An error status to answer with, or None."""
+        if self.error_rate and random.random() < self.error_rate:
+            return random.choice(self.error_statuses or [500])
+        return None
+
+
+def profiles_from_args(settings):
+    """Build {provider: Profile} from "key=value" / "provider.key=value" overrides."""
+    profiles = {name: Profile() for name in PROVIDERS}
+    for item in settings or ():
+        key, sep, value = item.partition("=")
+        if not sep:
+            raise ValueError(f"expected key=value, got {item!r}")
+        provider, _, field = key.rpartition(".")
+        targets = [provider] if provider else PROVIDERS
+        for name in targets:
+            if name not in profiles:
+                raise ValueError(f"unknown provider {name!r} (expected one of {', '.join(PROVIDERS)})")
+            profiles[name].update(**{field: value})
+    return profiles
+
+
+# --- Wire formats ---
+
+def completion_body(model, text):
+    return {
+        "id": f"chatcmpl-stub{random.getrandbits(32):08x}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": 0, "completion_tokens": len(text.split()), "total_tokens": len(text.split())},
+    }
+
+
+def completion_chunk(model, delta, finish_reason=None):
+    return {
+        "id": "chatcmpl-stub",
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "delta": {"content": delta} if delta else {}, "finish_reason": finish_reason}],
+    }
+
+
+def gemini_body(text):
+    return {"candidates": [{"content": {"role": "model", "parts": [{"text": text}]}, "finishReason": "STOP"}]}
+
+
+def error_body(provider, status):
+    if provider == "gemini":
+        return {"error": {"code": status, "message": "stub upstream error", "status": "UNAVAILABLE"}}
+    return {"error": {"message": "stub upstream error", "type": "server_error", "code": status}}
+
+
+class StubServer:
+    """ASGI app serving every provider profile."""
+
+    def __init__(self, profiles):
+        self.profiles = profiles
+        self.stats = {name: {"requests": 0, "errors": 0, "streams": 0} for name in profiles}
+
+    @staticmethod
+    def route(path):
+        """Split "/gemini/v1/models/x:streamGenerateContent" into (provider, model, streaming hint)."""
+        provider, _, rest = path.lstrip("/").partition("/")
+        if provider == "gemini":
+            _, _, call = rest.partition("/models/")
+            model, _, method = call.partition(":")
+            if method in ("generateContent", "streamGenerateContent"):
+                return provider, model, method == "streamGenerateContent"
+            return None
+        if provider in PROVIDERS and rest.rstrip("/").endswith("chat/completions"):
+            return provider, None, None
+        return None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            while True:
+                message = await receive()
+                if message["type"] == "lifespan.startup":
+                    await send({"type": "lifespan.startup.complete"})
+                elif message["type"] == "lifespan.shutdown":
+                    await send({"type": "lifespan.shutdown.complete"})
+                    return
+        if scope["type"] != "http":
+            return
+        if scope["method"] == "GET" and scope["path"] in ("/stats", "/healthz"):
+            await self.json(send, 200, self.stats if scope["path"] == "/stats" else {"ok": True})
+            return
+        matched = self.route(scope["path"]) if scope["method"] == "POST" else None
+        if matched is None:
+            await self.json(send, 404, {"error": {"message": f"no stub for {scope['method']} {scope['path']}"}})
+            return
+        body = b""
+        while True:
+            message = await receive()
+            body += message.get("body", b"")
+            if not message.get("more_body"):
+                break
+        try:
+            payload = json.loads(body or b"{}")
+        except ValueError:
+            await self.json(send, 400, {"error": {"message": "invalid JSON body"}})
+            return
+        provider, model, stream = matched
+        if provider != "gemini":
+            model = payload.get("model") or "stub"
+            stream = bool(payload.get("stream"))
+        profile = self.profiles[provider]
+        stats = self.stats[provider]
+        stats["requests"] += 1
+        if stream:
+            stats["streams"] += 1
+        await asyncio.sleep(profile.ttft())
+        status = profile.failure()
+        if status:
+            stats["errors"] += 1
+            await self.json(send, status, error_body(provider, status))
+        elif stream:
+            await self.stream(send, provider, model, profile)
+        else:
+            chunks = profile.reply()
+            await asyncio.sleep(sum(profile.token_interval() for _ in chunks))
+            text = "".join(chunks)
+            await self.json(send, 200, gemini_body(text) if provider == "gemini" else completion_body(model, text))
+
+    @staticmethod
+    async def json(send, status, body):
+        data = json.dumps(body).encode()
+        await send({"type": "http.response.start", "status": status,
+                    "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(data)).encode())]})
+        await send({"type": "http.response.body", "body": data})
+
+    @staticmethod
+    async def stream(send, provider, model, profile):
+        await send({"type": "http.response.start", "status": 200,
+                    "headers": [(b"content-type", b"text/event-stream"), (b"cache-control", b"no-cache")]})
+        for i, chunk in enumerate(profile.reply()):
+            if i:
+                await asyncio.sleep(profile.token_interval())
+            event = gemini_body(chunk) if provider == "gemini" else completion_chunk(model, chunk)
+            await send({"type": "http.response.body", "body": f"data: {json.dumps(event)}\n\n".encode(), "more_body": True})
+        if provider == "gemini":
+            await send({"type": "http.response.body", "body": b""})
+            return
+        tail = f"data: {json.dumps(completion_chunk(model, None, 'stop'))}\n\ndata: [DONE]\n\n"
+        await send({"type": "http.response.body", "body": tail.encode()})
+
+
+def app_env(base_url):
+    """Environment variables that point every adapter at a stub server at `base_url`."""
+    base_url = base_url.rstrip("/")
+    return {
+        "COPILOT_API_BASE": f"{base_url}/copilot",
+        "PERPLEXITY_API_BASE": f"{base_url}/perplexity",
+        "GEMINI_API_BASE": f"{base_url}/gemini/v1",
+        "OPENAI_API_BASE": f"{base_url}/openai/v1",
+        "GITHUB_TOKEN": "stub",
+        "PERPLEXITY_API_KEY": "stub",
+        "GEMINI_API_KEY": "stub",
+        "OPENAI_API_KEY": "stub",
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--set", action="append", default=[], metavar="[PROVIDER.]KEY=VALUE",
+                        help="profile setting: ttft, token_interval, chunks, error_rate, error_statuses")
+    parser.add_argument("--seed", type=int, help="seed the random latencies and errors")
+    args = parser.parse_args(argv)
+    try:
+        profiles = profiles_from_args(args.set)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.seed is not None:
+        random.seed(args.seed)
+    import uvicorn
+    for name, profile in profiles.items():
+        print(f"stub {name}: {profile.specs}", file=sys.stderr)
+    uvicorn.run(StubServer(profiles), host=args.host, port=args.port, log_level="warning", access_log=False)
+
+
+if __name__ == "__main__":
+    main()
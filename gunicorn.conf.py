@@ -0,0 +1,18 @@
+"""
+gunicorn hooks, picked up automatically when gunicorn starts from the project
+root. Command-line flags and GUNICORN_CMD_ARGS still take precedence.
+"""
+from dotenv import load_dotenv
+
+from backend.metrics import clear_metrics_dir, mark_process_dead
+
+load_dotenv()
+
+
+def on_starting(server):
+    # Multiprocess metrics (METRICS_DIR) must not carry samples over from the previous run
+    clear_metrics_dir()
+
+
+def child_exit(server, worker):
+    mark_process_dead(worker.pid)
@@ -1,15 +1,21 @@
 import os
+import threading
 import eel
 from backend.auth import recoganize
 from backend.auth.recoganize import AuthenticateFace
 from backend.feature import *
 from backend.command import *
+from backend.config import HOTWORD_IN_PROCESS
 
 
 
 def start():
     
     eel.init("frontend") 
+
+    if HOTWORD_IN_PROCESS:
+        # Listen for the wake word here so takecommand() can reuse the listener's audio
+        threading.Thread(target=hotword, kwargs={"share_audio": True}, name="hotword", daemon=True).start()
     
     play_assistant_sound()
     @eel.expose
@@ -12,6 +12,9 @@ try:
 except Exception:
     awsgi = None
 
+# Defer start-up work to first use: cold starts pay for it on every new instance
+os.environ.setdefault("LAZY_INIT", "1")
+
 from app import app as flask_app
 
 
@@ -12,13 +12,16 @@ def listenHotword():
     hotword()
     
 if __name__ == "__main__":
+    from backend.config import HOTWORD_IN_PROCESS
     process1 = multiprocessing.Process(target=startJarvis)
-    process2 = multiprocessing.Process(target=listenHotword)
+    # By default the UI process runs the hotword listener itself (HOTWORD_IN_PROCESS)
+    process2 = None if HOTWORD_IN_PROCESS else multiprocessing.Process(target=listenHotword)
     process1.start()
-    process2.start()
+    if process2 is not None:
+        process2.start()
     process1.join()
     
-    if process2.is_alive():
+    if process2 is not None and process2.is_alive():
         process2.terminate()
         print("Process 2 terminated.")
         process2.join()
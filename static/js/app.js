@@ -4,6 +4,7 @@ const state = {
   recognizing: false,
   lastAssistant: '',
   micReady: false,
+  conversationId: null,
 };
 
 function el(sel){return document.querySelector(sel)}
@@ -14,6 +15,41 @@ function addMsg(text, who){
   el('#messages').appendChild(m);
   el('#messages').scrollTop = el('#messages').scrollHeight;
   if(who === 'assistant') state.lastAssistant = text;
+  return m;
+}
+
+function appendToMsg(m, text){
+  m.textContent += text;
+  el('#messages').scrollTop = el('#messages').scrollHeight;
+  state.lastAssistant = m.textContent;
+}
+
+// Read a text/event-stream body and render `delta` tokens as they arrive
+async function readStream(res){
+  const reader = res.body.getReader();
+  const decoder = new TextDecoder();
+  const m = addMsg('', 'assistant');
+  let buf = '';
+  while(true){
+    const { value, done } = await reader.read();
+    if(done) break;
+    buf += decoder.decode(value, { stream:true });
+    let idx;
+    while((idx = buf.indexOf('\n\n')) >= 0){
+      const raw = buf.slice(0, idx); buf = buf.slice(idx + 2);
+      let event = 'message', data = '';
+      raw.split('\n').forEach(line=>{
+        if(line.startsWith('event:')) event = line.slice(6).trim();
+        else if(line.startsWith('data:')) data += line.slice(5).trim();
+      });
+      if(!data) continue;
+      const payload = JSON.parse(data);
+      if(event === 'error') appendToMsg(m, (m.textContent ? '\n' : '') + (payload.error || 'Error from server'));
+      else if(event === 'done'){ if(payload.conversation_id) state.conversationId = payload.conversation_id; }
+      else if(payload.delta) appendToMsg(m, payload.delta);
+    }
+  }
+  if(!m.textContent) m.textContent = 'No response';
 }
 
 async function loadModels(){
@@ -45,11 +81,17 @@ async function sendChat(){
   inp.value = '';
   try{
     el('#send').disabled = true; el('#send').classList.add('loading');
-    const res = await fetch('/chat', {
-      method:'POST', headers:{'Content-Type':'application/json'},
-      body: JSON.stringify({ message:text, model })
+    const res = await fetch('/chat?stream=1', {
+      method:'POST', headers:{'Content-Type':'application/json', 'Accept':'text/event-stream'},
+      body: JSON.stringify({ message:text, model, conversation_id: state.conversationId })
     });
+    const ctype = res.headers.get('Content-Type') || '';
+    if(res.ok && ctype.startsWith('text/event-stream') && res.body){
+      await readStream(res);
+      return;
+    }
     const data = await res.json();
+    if(data.conversation_id) state.conversationId = data.conversation_id;
     if(data.status === 'success') addMsg(data.response, 'assistant');
     else addMsg(data.error || 'Error from server', 'assistant');
   }catch(err){